@@ -1,17 +1,45 @@
 import os
 import json
 import re
+import asyncio
 import base64
+import copy
+import hashlib
+import importlib.util
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from typing import Optional, Dict, Any, List
-from flask import Flask, request, jsonify, render_template_string, send_from_directory
+from typing import Optional, Dict, Any
+from flask import Flask, Response, request, jsonify, render_template_string, send_from_directory, stream_with_context
 from dotenv import load_dotenv
+from werkzeug.exceptions import RequestEntityTooLarge
 from PIL import Image
 import io
+from history_store import HistoryStore
+from image_preprocessing import DEFAULT_MAX_PIXELS, create_worker_pool, difference_hash, preprocess_image, set_max_pixels
+from metrics import BACKEND_REQUESTS, CACHE_REQUESTS, FALLBACKS, METRICS_ENABLED, render as render_metrics, stage, timed
+from microbatch import MicroBatcher
+from prompts import PROMPT_TEMPLATE, TRIAGE_INSTRUCTIONS, TRIAGE_RESPONSE_SCHEMA, patient_block, triage_messages
+from static_assets import StaticAssets, content_type
+from structured_logging import get_logger
+from symptom_index import DEFAULT_DESCRIPTIONS_PATH, DEFAULT_INDEX_DIR, SymptomIndex, SymptomIndexError
+from triage_rules import DEFAULT_PATH as DEFAULT_TRIAGE_RULES_PATH, KnowledgeBase
 
 # Load environment variables
 load_dotenv()
 
+log = get_logger('mehelper')
+
+# Image preprocessing workers are spawned, and under `python app.py` each one
+# re-runs this script as __mp_main__ first. They only need image_preprocessing,
+# so the stores, caches, asset table and model backends are not set up there.
+IMAGE_WORKER = __name__ == '__mp_main__'
+
 # Check if using Inference Providers or local model
 USE_INFERENCE_PROVIDERS = os.getenv('USE_INFERENCE_PROVIDERS', 'true').lower() == 'true'
 HF_TOKEN = os.getenv('HF_TOKEN')
@@ -20,226 +48,221 @@ HF_TOKEN = os.getenv('HF_TOKEN')
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.urandom(24)
 
+# SQLite files (caches, history) live here; relative *_PATH settings are resolved against it
+DATA_DIR = os.path.abspath(os.getenv('DATA_DIR', os.path.dirname(os.path.abspath(__file__))))
+
+def data_path(path):
+    """Resolve a database path against DATA_DIR, creating the directory it goes in when possible"""
+    path = os.path.join(DATA_DIR, path)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    except OSError:
+        pass  # opening the database then fails, and the caller logs it
+    return path
+
+# Reject oversized uploads before they are read into memory
+MAX_UPLOAD_MB = float(os.getenv('MAX_UPLOAD_MB', '25'))
+app.config['MAX_CONTENT_LENGTH'] = int(MAX_UPLOAD_MB * 1024 * 1024)
+
 # Import based on configuration
 try:
-    from openai import OpenAI
+    from openai import OpenAI, AsyncOpenAI, BadRequestError
 except ImportError:
     OpenAI = None
+    AsyncOpenAI = None
+    BadRequestError = None
+
+# OpenAI-compatible endpoint for GPT-OSS-20B (override to point at a local stub)
+HF_ROUTER_BASE_URL = os.getenv('HF_ROUTER_BASE_URL', 'https://router.huggingface.co/v1')
+
+# Heavy local-inference dependencies (transformers, torch) are only imported
+# when a local backend is actually loaded; here we just check they exist
+TRANSFORMERS_AVAILABLE = (
+    importlib.util.find_spec('transformers') is not None
+    and importlib.util.find_spec('torch') is not None
+)
+if not TRANSFORMERS_AVAILABLE:
+    log.warning("transformers_unavailable", fallback="mock service")
+
+# Local inference backend: transformers (GPU, float16) or llama_cpp (quantized GGUF on CPU)
+LOCAL_BACKEND = os.getenv('LOCAL_BACKEND', 'transformers').lower()
+LOCAL_MODEL_PATH = os.getenv('LOCAL_MODEL_PATH')
+LOCAL_THREADS = int(os.getenv('LOCAL_THREADS', str(os.cpu_count() or 4)))
+LOCAL_CONTEXT = int(os.getenv('LOCAL_CONTEXT', '4096'))
+LLAMA_CPP_AVAILABLE = importlib.util.find_spec('llama_cpp') is not None
+
+# Generation budget and structured output for GPT-OSS-20B
+MODEL_MAX_TOKENS = int(os.getenv('MODEL_MAX_TOKENS', '1000'))
+# json_schema (default) constrains the router's decoding to the 7-level schema;
+# json_object only asks for valid JSON; off relies on the prompt alone
+STRUCTURED_OUTPUT = os.getenv('STRUCTURED_OUTPUT', 'json_schema').lower()
+# Stop local generation as soon as the top-level JSON object closes
+LOCAL_JSON_STOP = os.getenv('LOCAL_JSON_STOP', 'true').lower() == 'true'
+
+# Rule-based triage knowledge base, reloaded when the file changes
+TRIAGE_RULES_PATH = os.getenv('TRIAGE_RULES_PATH', DEFAULT_TRIAGE_RULES_PATH)
+TRIAGE_RULES_RELOAD_SECONDS = float(os.getenv('TRIAGE_RULES_RELOAD_SECONDS', '2'))
+knowledge_base = KnowledgeBase(TRIAGE_RULES_PATH, TRIAGE_RULES_RELOAD_SECONDS)
+
+# Semantic symptom -> condition matching for text no condition keyword covers:
+# 'hashing' (NumPy only), a sentence-embedding model id run through transformers, or 'off'
+SYMPTOM_INDEX_ENCODER = os.getenv('SYMPTOM_INDEX_ENCODER', 'hashing')
+SYMPTOM_INDEX_DIR = os.getenv('SYMPTOM_INDEX_DIR', DEFAULT_INDEX_DIR)
+CONDITION_DESCRIPTIONS_PATH = os.getenv('CONDITION_DESCRIPTIONS_PATH', DEFAULT_DESCRIPTIONS_PATH)
+SYMPTOM_INDEX_MIN_SCORE = float(os.getenv('SYMPTOM_INDEX_MIN_SCORE', '0.2'))
+
+def create_symptom_index():
+    """Open (building if needed) the symptom index, or None when it is off or unusable"""
+    if SYMPTOM_INDEX_ENCODER.lower() == 'off':
+        return None
+    try:
+        return SymptomIndex.open(SYMPTOM_INDEX_DIR, CONDITION_DESCRIPTIONS_PATH, SYMPTOM_INDEX_ENCODER)
+    except (SymptomIndexError, ImportError, OSError) as e:
+        log.warning("symptom_index_unavailable", encoder=SYMPTOM_INDEX_ENCODER, error=str(e))
+        return None
+
+symptom_index = None if IMAGE_WORKER else create_symptom_index()
+
+
+# Keys of the 7-level triage contract, in delivery order
+TRIAGE_LEVEL_KEYS = [
+    'level_1_reassurance', 'level_2_assessment', 'level_3_possibilities', 'level_4_first_aid',
+    'level_5_danger_signs', 'level_6_vitals_analysis', 'level_7_summary'
+]
+
+
+class IncrementalJSONParser:
+    """Parse a JSON object as it streams in, returning each top-level member once it is complete.
+
+    Text before the opening brace is ignored and parsing stops once the
+    top-level object closes, so chatter around the JSON does not matter.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = None
+        self.closed = False
+
+    def _parse_member(self, text):
+        text = text.strip()
+        if not text:
+            return []
+        try:
+            return list(json.loads('{' + text + '}').items())
+        except ValueError:
+            return []
+
+    def feed(self, chunk):
+        """Add streamed text and return the (key, value) members completed by it"""
+        self._buffer += chunk
+        members = []
+        buffer = self._buffer
+        index = self._pos
+        while index < len(buffer) and not self.closed:
+            char = buffer[index]
+            if self._depth == 0:
+                if char == '{':
+                    self._depth = 1
+                    self._member_start = index + 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    members.extend(self._parse_member(buffer[self._member_start:index]))
+                    self.closed = True
+            elif char == ',' and self._depth == 1:
+                members.extend(self._parse_member(buffer[self._member_start:index]))
+                self._member_start = index + 1
+            index += 1
+        self._pos = index
+        return members
+
+
+class JSONStopCriteria:
+    """Stopping criterion that ends local generation once the triage JSON object closes.
+
+    generate calls it after every new token. Each batch row feeds its tokens
+    to its own IncrementalJSONParser and finishes independently; objects that
+    close without any level_* key (e.g. braces in reasoning text) are skipped.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self._rows = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch  # type: ignore
+
+        if self._rows is None:
+            self._rows = [[IncrementalJSONParser(), False, False] for _ in range(input_ids.shape[0])]
+        for row, token_id in zip(self._rows, input_ids[:, -1].tolist()):
+            parser, seen_level, done = row
+            if done:
+                continue
+            members = parser.feed(self.tokenizer.decode([token_id], skip_special_tokens=True))
+            seen_level = seen_level or any(key in TRIAGE_LEVEL_KEYS for key, _ in members)
+            if parser.closed:
+                if seen_level:
+                    done = True
+                else:
+                    parser, seen_level = IncrementalJSONParser(), False
+            row[:] = [parser, seen_level, done]
+        return torch.tensor([row[2] for row in self._rows], dtype=torch.bool, device=input_ids.device)
+
+
+def local_generation_kwargs(tokenizer, generate_kwargs):
+    """Replace the stop_at_json_close flag with a fresh stopping criterion for one generate call
+
+    Callers pass the flag rather than a criterion object so MicroBatcher can
+    still group requests on identical settings.
+    """
+    generate_kwargs = dict(generate_kwargs)
+    if generate_kwargs.pop('stop_at_json_close', False):
+        from transformers import StoppingCriteriaList  # type: ignore
+        generate_kwargs['stopping_criteria'] = StoppingCriteriaList([JSONStopCriteria(tokenizer)])
+    return generate_kwargs
+
 
-# Handle transformers import with proper typing
-try:
-    from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM  # type: ignore
-    import torch  # type: ignore
-    TRANSFORMERS_AVAILABLE = True
-except ImportError:
-    print("Warning: transformers not available, using mock service")
-    TRANSFORMERS_AVAILABLE = False
-    # Type stubs for when transformers is not available
-    pipeline = None  # type: ignore
-    AutoTokenizer = None  # type: ignore
-    AutoModelForCausalLM = None  # type: ignore
-    torch = None  # type: ignore
 class MockAIService:
-    
-    def _determine_risk_level(self, symptoms, vitals, age):
-        """Determine risk level based on symptoms and vitals"""
-        
-        # Emergency keywords
-        emergency_keywords = [
-            'chest pain', 'heart attack', 'stroke', 'difficulty breathing', 'severe bleeding',
-            'unconscious', 'seizure', 'allergic reaction', 'anaphylaxis', 'poisoning',
-            'broken bone', 'severe burn', 'choking', 'drowning', 'electrocution'
-        ]
-        
-        # Check for emergency keywords
-        for keyword in emergency_keywords:
-            if keyword in symptoms:
-                return "emergency"
-        
-        # High risk symptoms
-        high_risk = ['severe', 'intense', 'extreme', 'unbearable', 'worst']
-        for word in high_risk:
-            if word in symptoms:
-                return "high"
-        
-        # Check vitals
-        temp = vitals.get('temperature')
-        heart_rate = vitals.get('heart_rate')
-        
-        if temp and (temp > 39.0 or temp < 35.0):
-            return "high"
-        
-        if heart_rate and (heart_rate > 120 or heart_rate < 50):
-            return "high"
-        
-        # Age factor
-        if age < 5 or age > 65:
-            return "moderate"
-        
-        # Duration factor
-        if 'week' in symptoms or 'month' in symptoms:
-            return "moderate"
-        
-        return "low"
-    
-    def _generate_reassurance(self, risk_level, symptoms):
-        """Generate reassurance based on risk level"""
-        if risk_level == "low":
-            return "These symptoms appear to be mild and likely self-limiting. Most people recover within a few days with proper rest and home care."
-        elif risk_level == "moderate":
-            return "These symptoms warrant attention but don't appear immediately life-threatening. Monitoring and timely medical consultation are recommended."
-        else:
-            return "These symptoms require prompt medical evaluation to ensure your safety and proper treatment."
-    
-    def _generate_risk_assessment(self, risk_level, symptoms):
-        """Generate risk assessment text"""
-        assessments = {
-            "emergency": "Critical condition requiring immediate emergency care",
-            "high": "High risk condition - seek medical care within hours",
-            "moderate": "Moderate concern - monitor closely and consider medical evaluation",
-            "low": "Low risk condition - likely self-limiting, monitor symptoms"
-        }
-        return assessments.get(risk_level, "Unable to assess risk level")
-    
-    def _generate_conditions(self, symptoms, age, sex):
-        """Generate possible conditions based on symptoms"""
-        conditions = []
-        
-        symptom_map = {
-            'fever': ['Viral infection', 'Bacterial infection', 'Flu'],
-            'cough': ['Common cold', 'Bronchitis', 'COVID-19', 'Pneumonia'],
-            'headache': ['Tension headache', 'Migraine', 'Sinus infection', 'Dehydration'],
-            'stomach': ['Gastroenteritis', 'Food poisoning', 'Stomach flu'],
-            'chest': ['Muscle strain', 'Anxiety', 'Heartburn', 'Respiratory infection'],
-            'pain': ['Muscle strain', 'Inflammation', 'Injury', 'Infection'],
-            'nausea': ['Gastroenteritis', 'Food poisoning', 'Motion sickness'],
-            'diarrhea': ['Gastroenteritis', 'Food poisoning', 'Viral infection'],
-            'anxiety': ['Anxiety disorder', 'Panic attacks', 'Acute stress response'],
-            'depression': ['Major depressive episode', 'Seasonal depression', 'Situational depression'],
-            'stress': ['Acute stress reaction', 'Work-related stress', 'Life stress'],
-            'other': ['Unspecified condition', 'Multiple symptom complex', 'Requires further evaluation']
-        }
-        
-        for keyword, conds in symptom_map.items():
-            if keyword in symptoms:
-                conditions.extend(conds)
-        
-        if not conditions:
-            conditions = ['Viral illness', 'General fatigue', 'Stress-related symptoms']
-        
-        return list(set(conditions))[:3]  # Return unique top 3
-    
-    def _generate_first_aid(self, symptoms, risk_level):
-        """Generate first aid measures"""
-        measures = [
-            "Rest and avoid strenuous activities",
-            "Stay hydrated with water or clear fluids",
-            "Monitor symptoms for changes"
-        ]
-        
-        if 'fever' in symptoms:
-            measures.extend([
-                "Use cool compresses or lukewarm bath",
-                "Take fever reducers if available (acetaminophen/ibuprofen)"
-            ])
-        
-        if 'pain' in symptoms:
-            measures.extend([
-                "Apply cold or warm compress to affected area",
-                "Take pain relievers if available"
-            ])
-        
-        if 'cough' in symptoms:
-            measures.extend([
-                "Use honey in warm tea (avoid for children <1 year)",
-                "Use humidifier or steam inhalation"
-            ])
-        
-        if 'anxiety' in symptoms:
-            measures.extend([
-                "Practice deep breathing exercises",
-                "Find a quiet, safe space to relax",
-                "Consider talking to someone you trust"
-            ])
-        
-        if 'depression' in symptoms:
-            measures.extend([
-                "Maintain regular sleep schedule",
-                "Engage in gentle physical activity",
-                "Reach out to mental health professional if needed"
-            ])
-        
-        if 'stress' in symptoms:
-            measures.extend([
-                "Practice stress-reduction techniques",
-                "Take breaks from stressful activities",
-                "Ensure adequate sleep and nutrition"
-            ])
-        
-        return measures
-    
-    def _generate_danger_signs(self, symptoms, age):
-        """Generate danger signs to watch for"""
-        danger_signs = [
-            "Difficulty breathing or shortness of breath",
-            "Severe or worsening pain",
-            "High fever (>39.5°C or 103°F)",
-            "Confusion or altered mental state",
-            "Inability to keep fluids down"
-        ]
-        
-        if age < 5:
-            danger_signs.extend([
-                "High fever in children (>38.5°C or 101.3°F)",
-                "Refusing to eat or drink",
-                "Unusual sleepiness or irritability"
-            ])
-        
-        return danger_signs
-    
-    def _analyze_vitals(self, vitals, age):
-        """Analyze vital signs"""
-        analysis = []
-        
-        temp = vitals.get('temperature')
-        heart_rate = vitals.get('heart_rate')
-        
-        if temp:
-            if temp > 39.0:
-                analysis.append(f"Temperature {temp}°C → High fever - monitor closely")
-            elif temp > 37.5:
-                analysis.append(f"Temperature {temp}°C → Mild fever")
-            elif temp < 36.0:
-                analysis.append(f"Temperature {temp}°C → Low - possible hypothermia")
-            else:
-                analysis.append(f"Temperature {temp}°C → Normal range")
-        
-        if heart_rate:
-            if heart_rate > 100:
-                analysis.append(f"Heart rate {heart_rate} bpm → Elevated - possible fever/stress")
-            elif heart_rate < 60:
-                analysis.append(f"Heart rate {heart_rate} bpm → Low - monitor for symptoms")
-            else:
-                analysis.append(f"Heart rate {heart_rate} bpm → Normal range")
-        
-        return "; ".join(analysis) if analysis else "No vitals provided for analysis"
-    
-    def _generate_summary(self, risk_level, symptoms):
-        """Generate summary"""
-        return f"Based on the symptoms provided, this appears to be a {risk_level} risk situation. {self._generate_risk_assessment(risk_level, symptoms)}."
-    
+    """Rule-based triage from the knowledge base in triage_rules.json"""
+
     def _generate_next_action(self, risk_level):
         """Generate next action"""
-        actions = {
-            "emergency": "Call emergency services immediately (911/999)",
-            "high": "Contact healthcare provider within 2-4 hours or visit urgent care",
-            "moderate": "Schedule appointment with doctor within 24-48 hours",
-            "low": "Continue home care and contact doctor if symptoms worsen"
-        }
-        return actions.get(risk_level, "Contact healthcare provider for guidance")
-    def analyze_symptoms(self, data):
-        """Analyze symptoms using mock AI logic"""
-        age = data.get('age', 30)
+        rules = knowledge_base.current()
+        return rules.next_actions.get(risk_level, rules.next_actions['default'])
+
+    def _possible_conditions(self, rules, matches, symptoms):
+        """Keyword conditions, or the closest conditions by meaning when no condition keyword matched"""
+        if not matches.get('condition') and symptom_index is not None:
+            found = symptom_index.search(symptoms, rules.max_conditions, SYMPTOM_INDEX_MIN_SCORE)
+            if found:
+                return [condition for condition, _ in found]
+        return rules.possible_conditions(matches)
+
+    def analyze_symptoms(self, data, risk_level=None):
+        """Analyze symptoms using mock AI logic
+
+        risk_level overrides the rule-based classification; the emergency fast
+        path in analyze_triage uses it to build an immediate emergency response.
+        """
+        BACKEND_REQUESTS.inc('rules')
+        # One revision for the whole request, even if the file is reloaded meanwhile
+        rules = knowledge_base.current()
+        age = data.get('age', rules.default_age)
         symptoms = data.get('symptoms', '').lower()
         vitals = data.get('vitals', {})
         image_analysis = data.get('image_analysis', None)
@@ -248,26 +271,576 @@ class MockAIService:
         if image_analysis:
             symptoms += f" Image findings: {image_analysis.lower()}"
         
+        # Scan the symptom text once for every keyword category
+        matches = rules.match(symptoms)
+
         # Determine risk level
-        risk_level = self._determine_risk_level(symptoms, vitals, age)
+        if risk_level is None:
+            risk_level = rules.risk_level(matches, vitals, age)
         
         # Generate comprehensive response
         return {
-            "level_1_reassurance": self._generate_reassurance(risk_level, symptoms),
+            "level_1_reassurance": rules.reassurance.get(risk_level, rules.reassurance['default']),
             "level_2_assessment": {
                 "severity": risk_level,
-                "description": self._generate_risk_assessment(risk_level, symptoms)
+                "description": rules.assessments.get(risk_level, rules.assessments['default'])
             },
-            "level_3_possibilities": self._generate_conditions(symptoms, age, data.get('sex', 'unknown')),
-            "level_4_first_aid": self._generate_first_aid(symptoms, risk_level),
-            "level_5_danger_signs": self._generate_danger_signs(symptoms, age),
-            "level_6_vitals_analysis": self._analyze_vitals(vitals, age),
+            "level_3_possibilities": self._possible_conditions(rules, matches, symptoms),
+            "level_4_first_aid": rules.first_aid_measures(matches),
+            "level_5_danger_signs": rules.danger_signs_for(age),
+            "level_6_vitals_analysis": rules.vitals_analysis(vitals),
             "level_7_summary": {
-                "summary": self._generate_summary(risk_level, symptoms),
-                "next_action": self._generate_next_action(risk_level)
+                "summary": rules.summary(risk_level),
+                "next_action": rules.next_actions.get(risk_level, rules.next_actions['default'])
             }
         }
 
+    def stream_analysis(self, data, risk_level=None):
+        """Yield (level_key, value, source) triples; rule-based levels are all ready at once"""
+        for key, value in self.analyze_symptoms(data, risk_level).items():
+            yield key, value, "rules"
+
+# Triage result cache
+class MemoryCacheStore:
+    """In-process LRU store with per-entry expiry"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        """Store a value and return the number of entries evicted to make room"""
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def size(self):
+        return len(self._entries)
+
+
+class SQLiteCacheStore:
+    """On-disk LRU store shared by every worker process that points at the same file"""
+
+    def __init__(self, path, max_entries, table='triage_cache'):
+        self.max_entries = max_entries
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_accessed ON {table}(accessed)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key, value, ttl):
+        """Store a value and return the number of entries evicted to make room"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now)
+            )
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE expires < ? OR key IN ("
+                f"SELECT key FROM {self.table} ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (now, self.max_entries)
+            )
+            return cursor.rowcount
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+
+class TriageCache:
+    """Bounded LRU+TTL cache of model assessments keyed on a normalized request fingerprint"""
+
+    AGE_BANDS = [(1, 'infant'), (5, 'under5'), (13, 'child'), (18, 'teen'), (40, 'adult'), (66, 'midlife')]
+
+    def __init__(self, store, ttl):
+        self.store = store
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _age_band(cls, age):
+        try:
+            age = float(age)
+        except (TypeError, ValueError):
+            return 'unknown'
+        for upper, band in cls.AGE_BANDS:
+            if age < upper:
+                return band
+        return 'senior'
+
+    @staticmethod
+    def _duration_bucket(duration):
+        text = re.sub(r'\s+', '', str(duration or '').lower())
+        if 'hour' in text:
+            return 'hours'
+        if 'month' in text or text == 'more':
+            return 'weeks+'
+        if 'week' in text:
+            return 'weeks'
+        days = [int(n) for n in re.findall(r'\d+', text)]
+        if 'day' in text and days:
+            return 'days<3' if max(days) <= 2 else 'days3+'
+        return text or 'unknown'
+
+    @staticmethod
+    def _round_to(value, step):
+        try:
+            return round(float(value) / step) * step
+        except (TypeError, ValueError):
+            return None
+
+    def fingerprint(self, data):
+        """Build a cache key that ignores symptom order, exact age and small vital differences"""
+        symptoms = str(data.get('symptoms', '')).lower()
+        phrases = sorted({
+            ' '.join(phrase.split())
+            for phrase in re.split(r'[,;/\n]|\band\b', symptoms)
+            if phrase.strip()
+        })
+        vitals = data.get('vitals') or {}
+        image_analysis = ' '.join(str(data.get('image_analysis') or '').lower().split())
+        key = {
+            'symptoms': phrases,
+            'age': self._age_band(data.get('age')),
+            'sex': str(data.get('sex', 'unknown')).lower().strip(),
+            'duration': self._duration_bucket(data.get('duration')),
+            'temperature': self._round_to(vitals.get('temperature'), 0.5),
+            'heart_rate': self._round_to(vitals.get('heart_rate'), 5),
+            'image': hashlib.sha256(image_analysis.encode('utf-8')).hexdigest() if image_analysis else None
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value = self.store.get(key)
+        CACHE_REQUESTS.inc('triage', 'miss' if value is None else 'hit')
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, analysis):
+        evicted = self.store.set(key, json.dumps(analysis), self.ttl)
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+
+    def stats(self):
+        return {
+            "backend": type(self.store).__name__,
+            "entries": self.store.size(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+def create_triage_cache():
+    """Build the triage cache from environment configuration"""
+    backend = os.getenv('TRIAGE_CACHE_BACKEND', 'memory').lower()
+    max_entries = int(os.getenv('TRIAGE_CACHE_MAX_ENTRIES', '1024'))
+    ttl = int(os.getenv('TRIAGE_CACHE_TTL_SECONDS', '3600'))
+
+    if backend == 'off':
+        return None
+    if backend == 'sqlite':
+        path = data_path(os.getenv('TRIAGE_CACHE_PATH', 'triage_cache.sqlite3'))
+        try:
+            return TriageCache(SQLiteCacheStore(path, max_entries), ttl)
+        except sqlite3.Error as e:
+            log.warning("triage_cache_open_failed", path=path, error=str(e), fallback="memory")
+    return TriageCache(MemoryCacheStore(max_entries), ttl)
+
+
+triage_cache = None if IMAGE_WORKER else create_triage_cache()
+
+# Image analysis cache
+class ImageAnalysisCache:
+    """Gemini results keyed on the normalized upload and prompt, with an optional disk tier.
+
+    "exact" (the default) keys on the SHA-256 of the preprocessed JPEG, so only
+    byte-identical re-uploads hit. "perceptual" keys on a 64-bit difference
+    hash instead, which also matches the same photo re-encoded or resized by a
+    phone or messaging app. It cannot be confirmed with a byte hash, since
+    those copies differ byte for byte, so two different photos with the same
+    coarse light/dark layout (close-ups of similar rashes, say) can share a
+    key and one patient would be shown findings made for another's image.
+    Lookups go to the in-memory LRU first and then to SQLite, promoting disk hits.
+    """
+
+    def __init__(self, memory, disk=None, ttl=86400, key_mode='exact'):
+        self.memory = memory
+        self.disk = disk
+        self.ttl = ttl
+        self.key_mode = key_mode
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def fingerprint(self, image_data, prompt):
+        if self.key_mode == 'perceptual':
+            try:
+                digest = 'dhash:' + difference_hash(image_data)
+            except Exception:
+                digest = 'sha256:' + hashlib.sha256(image_data).hexdigest()
+        else:
+            digest = 'sha256:' + hashlib.sha256(image_data).hexdigest()
+        prompt = ' '.join(str(prompt or '').split())
+        return hashlib.sha256(f"{digest}\n{prompt}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        value = self.memory.get(key)
+        tier = 'memory'
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            tier = 'disk'
+            if value is not None:
+                self.memory.set(key, value, self.ttl)
+        CACHE_REQUESTS.inc('image', 'miss' if value is None else tier + '_hit')
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            if tier == 'memory':
+                self.memory_hits += 1
+            else:
+                self.disk_hits += 1
+        return json.loads(value)
+
+    def set(self, key, result):
+        value = json.dumps(result)
+        evicted = self.memory.set(key, value, self.ttl)
+        if self.disk is not None:
+            evicted += self.disk.set(key, value, self.ttl)
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "backend": "memory+sqlite" if self.disk is not None else "memory",
+            "key_mode": self.key_mode,
+            "entries": self.disk.size() if self.disk is not None else self.memory.size(),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0
+        }
+
+
+def create_image_cache():
+    """Build the image analysis cache from environment configuration"""
+    backend = os.getenv('IMAGE_CACHE_BACKEND', 'memory').lower()
+    max_entries = int(os.getenv('IMAGE_CACHE_MAX_ENTRIES', '512'))
+    ttl = int(os.getenv('IMAGE_CACHE_TTL_SECONDS', '86400'))
+    key_mode = os.getenv('IMAGE_CACHE_KEY', 'exact').lower()
+
+    if backend == 'off':
+        return None
+    disk = None
+    if backend == 'sqlite':
+        path = data_path(os.getenv('IMAGE_CACHE_PATH', 'image_cache.sqlite3'))
+        try:
+            disk = SQLiteCacheStore(path, max_entries, table='image_cache')
+        except sqlite3.Error as e:
+            log.warning("image_cache_open_failed", path=path, error=str(e), fallback="memory")
+    if key_mode == 'perceptual':
+        log.warning("image_cache_perceptual_keys", risk="different images with similar structure share results")
+    return ImageAnalysisCache(MemoryCacheStore(max_entries), disk, ttl, key_mode)
+
+
+image_cache = None if IMAGE_WORKER else create_image_cache()
+
+# Server-side triage history synced from every device in the clinic
+HISTORY_SYNC_MAX_RECORDS = int(os.getenv('HISTORY_SYNC_MAX_RECORDS', '5000'))
+HISTORY_SYNC_PAGE_SIZE = int(os.getenv('HISTORY_SYNC_PAGE_SIZE', '500'))
+
+def create_history_store():
+    """Build the history store from HISTORY_BACKEND (sqlite or off)"""
+    if os.getenv('HISTORY_BACKEND', 'sqlite').lower() == 'off':
+        return None
+    path = data_path(os.getenv('HISTORY_DB_PATH', 'triage_history.sqlite3'))
+    try:
+        return HistoryStore(path)
+    except sqlite3.Error as e:
+        log.warning("history_store_open_failed", path=path, error=str(e))
+        return None
+
+
+history_store = None if IMAGE_WORKER else create_history_store()
+
+class PromptPrefixCache:
+    """Reuse the KV cache of the shared system prompt across local generations.
+
+    Every triage request starts with the same system message, so its
+    attention keys and values are computed once at load time. Each request
+    starts from a copy of that cache and only prefills its patient block.
+    Requests whose rendered prompt does not start with the cached tokens
+    are generated from scratch.
+    """
+
+    SENTINEL = "\u2063PATIENT\u2063"
+
+    def __init__(self, pipe, system_prompt):
+        import torch  # type: ignore
+        from transformers import DynamicCache  # type: ignore
+
+        self._torch = torch
+        self.model = pipe.model
+        self.tokenizer = pipe.tokenizer
+        self.hits = 0
+        self.misses = 0
+
+        # Render a conversation with a placeholder user turn and keep the text before it
+        rendered = self.tokenizer.apply_chat_template(
+            [{"role": "system", "content": system_prompt}, {"role": "user", "content": self.SENTINEL}],
+            tokenize=False, add_generation_prompt=True
+        )
+        prefix_text = rendered[:rendered.index(self.SENTINEL)]
+        # Drop the last token: it may merge with the patient text when tokenized together
+        self.prefix_ids = self.tokenizer(
+            prefix_text, add_special_tokens=False, return_tensors='pt'
+        ).input_ids[:, :-1].to(self.model.device)
+        self.prefix_tokens = self.prefix_ids.shape[1]
+
+        self.cache = DynamicCache()
+        with torch.no_grad():
+            self.model(input_ids=self.prefix_ids, past_key_values=self.cache, use_cache=True)
+
+    def __call__(self, messages, return_full_text=False, **generate_kwargs):
+        """Generate like the text-generation pipeline, returning [{"generated_text": ...}]"""
+        torch = self._torch
+        generate_kwargs = local_generation_kwargs(self.tokenizer, generate_kwargs)
+        text = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        input_ids = self.tokenizer(text, add_special_tokens=False, return_tensors='pt').input_ids.to(self.model.device)
+
+        n = self.prefix_tokens
+        if input_ids.shape[1] > n and torch.equal(input_ids[:, :n], self.prefix_ids):
+            generate_kwargs["past_key_values"] = copy.deepcopy(self.cache)
+            self.hits += 1
+        else:
+            self.misses += 1
+
+        with torch.no_grad():
+            output = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                **generate_kwargs
+            )
+        generated = self.tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True)
+        return [{"generated_text": text + generated if return_full_text else generated}]
+
+    def stats(self):
+        return {
+            "template": PROMPT_TEMPLATE,
+            "prefix_tokens": self.prefix_tokens,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+class LlamaCppPipeline:
+    """Quantized GGUF model on CPU through llama.cpp, called like the text-generation pipeline.
+
+    Weights are memory-mapped, so loading is fast and the pages are shared
+    by every worker process on the box. llama.cpp keeps the KV state of the
+    previous prompt and only evaluates tokens after the longest common
+    prefix, so the shared system prompt is not prefilled again. With
+    stop_at_json_close the output is grammar-constrained to the 7-level
+    schema, which also ends generation when the object closes.
+    """
+
+    def __init__(self, model_path, n_threads, n_ctx):
+        from llama_cpp import Llama  # type: ignore
+
+        self.llm = Llama(
+            model_path=model_path,
+            n_threads=n_threads,
+            n_threads_batch=n_threads,
+            n_ctx=n_ctx,
+            use_mmap=True,
+            verbose=False
+        )
+        # Token counting goes through pipe.tokenizer.encode like the transformers backend
+        self.tokenizer = self
+        self._lock = threading.Lock()
+
+    def encode(self, text, add_special_tokens=False):
+        return self.llm.tokenize(text.encode('utf-8'), add_bos=add_special_tokens, special=False)
+
+    def _completion_kwargs(self, messages, max_new_tokens, temperature, stop_at_json_close):
+        kwargs = {"messages": messages, "max_tokens": max_new_tokens, "temperature": temperature}
+        if stop_at_json_close:
+            kwargs["response_format"] = {"type": "json_object", "schema": TRIAGE_RESPONSE_SCHEMA}
+        return kwargs
+
+    def __call__(self, messages, max_new_tokens=MODEL_MAX_TOKENS, temperature=0.1,
+                 return_full_text=False, stop_at_json_close=False, **_):
+        kwargs = self._completion_kwargs(messages, max_new_tokens, temperature, stop_at_json_close)
+        # One llama.cpp context serves one sequence at a time
+        with self._lock:
+            result = self.llm.create_chat_completion(**kwargs)
+        return [{"generated_text": result["choices"][0]["message"]["content"] or ""}]
+
+    def stream(self, messages, max_new_tokens=MODEL_MAX_TOKENS, temperature=0.1, stop_at_json_close=False):
+        """Yield generated text chunks"""
+        kwargs = self._completion_kwargs(messages, max_new_tokens, temperature, stop_at_json_close)
+        with self._lock:
+            for chunk in self.llm.create_chat_completion(stream=True, **kwargs):
+                text = chunk["choices"][0]["delta"].get("content")
+                if text:
+                    yield text
+
+
+class CircuitBreaker:
+    """Stop calling a failing upstream and probe it again after a cool-down.
+
+    "closed" passes every call through. After failure_threshold consecutive
+    failures the breaker opens and rejects calls for recovery_seconds; it
+    then goes "half_open" and lets a single probe through, closing again on
+    success or re-opening on failure.
+    """
+
+    def __init__(self, failure_threshold=5, recovery_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.recovery_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Give up a call's probe without a verdict, e.g. when its consumer went away"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    log.warning("circuit_breaker_opened", consecutive_failures=self.consecutive_failures)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def status(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected": self.rejected,
+            "failure_threshold": self.failure_threshold,
+            "recovery_seconds": self.recovery_seconds
+        }
+
+
+# Upstream (HF router) client tuning
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '3'))
+UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', '30'))
+UPSTREAM_MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', '0'))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv('UPSTREAM_MAX_CONNECTIONS', '100'))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv('UPSTREAM_MAX_KEEPALIVE', '20'))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv('UPSTREAM_KEEPALIVE_EXPIRY', '30'))
+
+def upstream_client_options(async_mode=False):
+    """Timeouts, retries and a keep-alive connection pool for the router clients"""
+    options: Dict[str, Any] = {"timeout": UPSTREAM_READ_TIMEOUT, "max_retries": UPSTREAM_MAX_RETRIES}
+    try:
+        import httpx
+    except ImportError:
+        return options
+    
+    timeout = httpx.Timeout(UPSTREAM_READ_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT)
+    limits = httpx.Limits(
+        max_connections=UPSTREAM_MAX_CONNECTIONS,
+        max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+        keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY
+    )
+    client_class = httpx.AsyncClient if async_mode else httpx.Client
+    options["timeout"] = timeout
+    options["http_client"] = client_class(timeout=timeout, limits=limits)
+    return options
+
+
+def structured_response_format(mode):
+    """The response_format argument for a STRUCTURED_OUTPUT mode, or None"""
+    if mode == 'json_schema':
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": "triage_assessment", "schema": TRIAGE_RESPONSE_SCHEMA, "strict": True}
+        }
+    if mode == 'json_object':
+        return {"type": "json_object"}
+    return None
+
+
 class GPTOSS20BService:
     """GPT-OSS-20B model integration service using Hugging Face Inference Providers"""
     
@@ -275,122 +848,192 @@ class GPTOSS20BService:
         """Initialize GPT-OSS-20B service"""
         self.model_name = "openai/gpt-oss-20b:fireworks-ai"
         self.client = None
+        self.async_client = None
         self.use_local = False
+        self.batcher = None
+        self.prefix_cache = None
+        self.response_format = structured_response_format(STRUCTURED_OUTPUT)
+        self.generation_stats = {"requests": 0, "fallbacks": 0, "tokens_generated": 0, "trailing_chars": 0}
+        self._stats_lock = threading.Lock()
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5')),
+            recovery_seconds=float(os.getenv('BREAKER_RECOVERY_SECONDS', '30'))
+        )
         
         # Try to initialize with Hugging Face Inference Providers first
         try:
-            # Check for HF_TOKEN environment variable
-            if "HF_TOKEN" in os.environ and OpenAI:
+            # Check for HF_TOKEN environment variable (USE_INFERENCE_PROVIDERS=false forces local)
+            if USE_INFERENCE_PROVIDERS and "HF_TOKEN" in os.environ and OpenAI:
                 self.client = OpenAI(
-                    base_url="https://router.huggingface.co/v1",
-                    api_key=os.environ["HF_TOKEN"]
+                    base_url=HF_ROUTER_BASE_URL,
+                    api_key=os.environ["HF_TOKEN"],
+                    **upstream_client_options()
                 )
-                print("Using Hugging Face Inference Providers for GPT-OSS-20B")
+                if AsyncOpenAI:
+                    # Used by the async serving mode (asgi.py)
+                    self.async_client = AsyncOpenAI(
+                        base_url=HF_ROUTER_BASE_URL,
+                        api_key=os.environ["HF_TOKEN"],
+                        **upstream_client_options(async_mode=True)
+                    )
+                log.info("model_backend_selected", backend="inference_providers", model=self.model_name)
             else:
                 # Try local transformers
                 self._init_local_model()
         except ImportError:
-            print("OpenAI client not available, trying local transformers...")
+            log.warning("openai_client_unavailable", fallback="local model")
             self._init_local_model()
         except Exception as e:
-            print(f"Error with Inference Providers: {e}")
+            log.warning("inference_providers_failed", error=str(e))
             self._init_local_model()
     
     def _init_local_model(self):
-        """Initialize local transformers model"""
+        """Initialize the local model selected by LOCAL_BACKEND"""
+        if LOCAL_BACKEND == 'llama_cpp':
+            self._init_cpu_model()
+            return
         try:
-            if not TRANSFORMERS_AVAILABLE or pipeline is None:
+            if not TRANSFORMERS_AVAILABLE:
                 raise ImportError("Transformers not available")
+            
+            from transformers import pipeline  # type: ignore
+            import torch  # type: ignore
+            
+            if 'LOCAL_THREADS' in os.environ:
+                torch.set_num_threads(LOCAL_THREADS)
                 
-            print("Loading local GPT-OSS-20B model...")
+            log.info("local_model_loading", backend="transformers")
             self.pipe = pipeline(
                 "text-generation",
                 model="openai/gpt-oss-20b",
-                torch_dtype=torch.float16 if torch is not None else None,
+                torch_dtype=torch.float16,
                 device_map="auto"
             )
             self.use_local = True
-            print("Local GPT-OSS-20B model loaded successfully")
+            
+            # Prefill the shared system prompt once (LOCAL_PREFIX_CACHE=false disables)
+            if os.getenv('LOCAL_PREFIX_CACHE', 'true').lower() == 'true':
+                try:
+                    self.prefix_cache = PromptPrefixCache(self.pipe, TRIAGE_INSTRUCTIONS)
+                    log.info("prompt_prefix_cached", prefix_tokens=self.prefix_cache.prefix_tokens)
+                except Exception as e:
+                    log.warning("prompt_prefix_cache_unavailable", error=str(e))
+            
+            # Batch concurrent requests into shared generate calls (LOCAL_BATCH_MAX_SIZE=1 disables)
+            max_batch = int(os.getenv('LOCAL_BATCH_MAX_SIZE', '8'))
+            if max_batch > 1:
+                self.batcher = MicroBatcher(
+                    self.pipe,
+                    window_ms=float(os.getenv('LOCAL_BATCH_WINDOW_MS', '20')),
+                    max_batch=max_batch,
+                    single=self.prefix_cache,
+                    prepare=local_generation_kwargs
+                )
+            log.info("local_model_loaded", backend="transformers")
         except Exception as e:
-            print(f"Failed to load local model: {e}")
+            log.error("local_model_failed", backend=LOCAL_BACKEND, error=str(e))
             raise RuntimeError("Both Inference Providers and local model failed")
     
-    def _create_prompt(self, data):
-        """Create comprehensive medical triage prompt"""
-        age = data.get('age', 'unknown')
-        sex = data.get('sex', 'unknown')
-        symptoms = data.get('symptoms', '')
-        duration = data.get('duration', 'unknown')
-        vitals = data.get('vitals', {})
-        image_analysis = data.get('image_analysis', None)
-        
-        prompt = f"""You are an expert medical triage AI assistant. Analyze the following patient information and provide a comprehensive 7-level triage assessment.
-
-Patient Information:
-- Age: {age} years
-- Sex: {sex}
-- Symptoms: {symptoms}
-- Duration: {duration}
-"""
-
-        if vitals and vitals.get('temperature'):
-            prompt += f"- Temperature: {vitals['temperature']}°C\n"
-        if vitals and vitals.get('heart_rate'):
-            prompt += f"- Heart Rate: {vitals['heart_rate']} BPM\n"
-        
-        if image_analysis:
-            prompt += f"- Image Analysis: {image_analysis}\n"
-
-        prompt += """
-Please provide a comprehensive medical assessment in the following 7 levels:
-
-**Level 1 - Reassurance Level**: Provide reassurance for mild symptoms and general advice.
-
-**Level 2 - Initial Assessment**: Classify the condition severity (mild/moderate/severe/emergency).
-
-**Level 3 - Pathological Possibilities**: List the 3-5 most likely medical conditions based on symptoms.
-
-**Level 4 - First Aid Measures**: Provide specific first aid instructions that can be done at home.
-
-**Level 5 - Danger Signs Alert**: List critical warning signs that require immediate medical attention.
-
-**Level 6 - Vital Signs Analysis**: Analyze any provided vital signs and their implications.
-
-**Level 7 - Summary Report & Next Action**: Provide a concise summary and specific next steps.
-
-Format your response as a JSON object with these exact keys:
-{
-  "level_1_reassurance": "string",
-  "level_2_assessment": {"severity": "mild|moderate|severe|emergency", "description": "string"},
-  "level_3_possibilities": ["condition1", "condition2", "condition3"],
-  "level_4_first_aid": ["step1", "step2", "step3"],
-  "level_5_danger_signs": ["sign1", "sign2", "sign3"],
-  "level_6_vitals_analysis": "string",
-  "level_7_summary": {"summary": "string", "next_action": "string"}
-}
-
-Be precise, medically accurate, and prioritize patient safety."""
+    def _init_cpu_model(self):
+        """Initialize a quantized GGUF model on CPU with llama.cpp"""
+        try:
+            if not LLAMA_CPP_AVAILABLE:
+                raise ImportError("llama-cpp-python not available")
+            if not LOCAL_MODEL_PATH:
+                raise RuntimeError("LOCAL_MODEL_PATH must point at a GGUF model file")
+            
+            log.info("local_model_loading", backend="llama_cpp", path=LOCAL_MODEL_PATH, threads=LOCAL_THREADS)
+            self.pipe = LlamaCppPipeline(LOCAL_MODEL_PATH, LOCAL_THREADS, LOCAL_CONTEXT)
+            self.use_local = True
+            self.model_name = os.path.basename(LOCAL_MODEL_PATH)
+            log.info("local_model_loaded", backend="llama_cpp")
+        except Exception as e:
+            log.error("local_model_failed", backend=LOCAL_BACKEND, error=str(e))
+            raise RuntimeError("Both Inference Providers and local model failed")
+    
+    def warm_up(self):
+        """Run one minimal generation so the first real request skips connection and kernel setup"""
+        messages = [{"role": "user", "content": "Reply with OK."}]
+        if self.client and not self.use_local:
+            self.client.chat.completions.create(model=self.model_name, messages=messages, max_tokens=1)
+        else:
+            self.pipe(messages, max_new_tokens=1)
+    
+    def _completion_kwargs(self, messages, **extra):
+        kwargs = dict(model=self.model_name, messages=messages, max_tokens=MODEL_MAX_TOKENS, temperature=0.1, **extra)
+        if self.response_format is not None:
+            kwargs["response_format"] = self.response_format
+        return kwargs
+    
+    def _structured_output_rejected(self, e):
+        """Turn structured outputs off if the provider rejected them; True means retry without"""
+        if self.response_format is None or BadRequestError is None or not isinstance(e, BadRequestError):
+            return False
+        if 'response_format' not in str(e) and 'json_schema' not in str(e):
+            return False
+        log.warning("structured_output_rejected", mode=STRUCTURED_OUTPUT, error=str(e))
+        self.response_format = None
+        return True
+    
+    def _create_completion(self, messages, **extra):
+        try:
+            return self.client.chat.completions.create(**self._completion_kwargs(messages, **extra))
+        except Exception as e:
+            if not self._structured_output_rejected(e):
+                raise
+            return self.client.chat.completions.create(**self._completion_kwargs(messages, **extra))
+    
+    async def _create_completion_async(self, messages):
+        try:
+            return await self.async_client.chat.completions.create(**self._completion_kwargs(messages))
+        except Exception as e:
+            if not self._structured_output_rejected(e):
+                raise
+            return await self.async_client.chat.completions.create(**self._completion_kwargs(messages))
+    
+    def _local_generate(self):
+        """Pick the local generation path: micro-batcher, prefix-cached model, or plain pipeline"""
+        if self.batcher is not None:
+            return self.batcher.submit
+        if self.prefix_cache is not None:
+            return self.prefix_cache
+        if isinstance(self.pipe, LlamaCppPipeline):
+            return self.pipe
+        return lambda messages, **kwargs: self.pipe(messages, **local_generation_kwargs(self.pipe.tokenizer, kwargs))
+    
+    def _create_messages(self, data):
+        """Build the triage chat messages: shared static instructions first, patient data last"""
+        return triage_messages(data)
+    
+    def _locate_json(self, response_text):
+        """Return (analysis, end offset) for the first JSON object carrying every triage level
 
-        return prompt
+        Decoding stops where that object closes, so trailing text and braces
+        in any text before it are ignored.
+        """
+        decoder = json.JSONDecoder()
+        index = response_text.find('{')
+        while index != -1:
+            try:
+                parsed, end = decoder.raw_decode(response_text, index)
+            except ValueError:
+                parsed = None
+            if isinstance(parsed, dict) and all(key in parsed for key in TRIAGE_LEVEL_KEYS):
+                return parsed, end
+            index = response_text.find('{', index + 1)
+        return None, len(response_text)
+    
+    def _extract_json(self, response_text):
+        """Extract the JSON object from a model response, or None if there is none"""
+        return self._locate_json(response_text)[0]
     
     def _parse_response(self, response_text):
         """Parse and validate response from GPT-OSS-20B"""
-        try:
-            # Try to extract JSON from response
-            import json
-            import re
-            
-            # Look for JSON object in the response
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
-            
+        parsed = self._extract_json(response_text)
+        if parsed is None:
             # Fallback: create structured response
             return self._create_fallback_response()
-            
-        except Exception as e:
-            print(f"Error parsing response: {e}")
-            return self._create_fallback_response()
+        return parsed
     
     def _create_fallback_response(self):
         """Create fallback response when parsing fails"""
@@ -407,37 +1050,238 @@ Be precise, medically accurate, and prioritize patient safety."""
             }
         }
     
+    def _stream_text(self, messages):
+        """Yield generated text chunks from the remote or local backend"""
+        if self.client and not self.use_local:
+            stream = self._create_completion(messages, stream=True)
+            try:
+                for event in stream:
+                    if event.choices and event.choices[0].delta.content:
+                        yield event.choices[0].delta.content
+            finally:
+                # Closing the response makes the provider stop generating once the consumer is done
+                stream.close()
+        elif isinstance(self.pipe, LlamaCppPipeline):
+            yield from self.pipe.stream(
+                messages, max_new_tokens=MODEL_MAX_TOKENS, temperature=0.1, stop_at_json_close=LOCAL_JSON_STOP
+            )
+        else:
+            from transformers import TextIteratorStreamer  # type: ignore
+
+            streamer = TextIteratorStreamer(self.pipe.tokenizer, skip_prompt=True, skip_special_tokens=True)
+            worker = threading.Thread(
+                target=self.prefix_cache or self.pipe,
+                args=(messages,),
+                kwargs=local_generation_kwargs(self.pipe.tokenizer, {
+                    "max_new_tokens": MODEL_MAX_TOKENS, "temperature": 0.1,
+                    "streamer": streamer, "stop_at_json_close": LOCAL_JSON_STOP
+                }),
+                daemon=True
+            )
+            worker.start()
+            for text in streamer:
+                yield text
+    
+    def stream_analysis(self, data):
+        """Yield (level_key, value, source) triples as each level completes in the model output
+
+        Levels the model fails to produce are filled in from the rule-based
+        service at the end, so consumers always receive all seven.
+        """
+        cache_key, cached = self._cache_lookup(data)
+        if cached is not None:
+            for key, value in cached.items():
+                yield key, value, "cache"
+            return
+        
+        parser = IncrementalJSONParser()
+        analysis = {}
+        remote = self._uses_remote()
+        if not remote or self.breaker.allow_request():
+            recorded = False
+            try:
+                for chunk in self._stream_text(self._create_messages(data)):
+                    for key, value in parser.feed(chunk):
+                        if key in TRIAGE_LEVEL_KEYS and key not in analysis:
+                            analysis[key] = value
+                            yield key, value, "model"
+                    if parser.closed:
+                        break
+                if remote:
+                    self.breaker.record_success()
+                    recorded = True
+            except Exception as e:
+                log.error("model_stream_failed", error=str(e))
+                if remote:
+                    self.breaker.record_failure()
+                    recorded = True
+            finally:
+                # A client that disconnects closes this generator mid-stream (GeneratorExit);
+                # a half-open probe must not stay in flight forever
+                if remote and not recorded:
+                    self.breaker.release_probe()
+        
+        missing = [key for key in TRIAGE_LEVEL_KEYS if key not in analysis]
+        if missing:
+            FALLBACKS.inc('stream_incomplete')
+            fallback = mock_service.analyze_symptoms(data)
+            for key in missing:
+                yield key, fallback[key], "rules"
+        elif cache_key is not None:
+            triage_cache.set(cache_key, analysis)
+    
+    def _uses_remote(self):
+        return self.client is not None and not self.use_local
+    
+    def _cache_lookup(self, data):
+        """Return (cache_key, cached_analysis); the key is None when caching is off for this request"""
+        if triage_cache is None or not data.get('cache', True):
+            return None, None
+        cache_key = triage_cache.fingerprint(data)
+        return cache_key, triage_cache.get(cache_key)
+    
+    def _finish_analysis(self, response_text, cache_key, tokens_generated=None):
+        """Parse model output into the 7-level analysis, record generation stats and cache it"""
+        with stage('response_parse'):
+            analysis, end = self._locate_json(response_text)
+        generation = {
+            "tokens_generated": tokens_generated,
+            # Budget left unused, not a saving: an unconstrained run might also have stopped early
+            "tokens_unused": MODEL_MAX_TOKENS - tokens_generated if tokens_generated is not None else None,
+            "trailing_chars": len(response_text[end:].strip()),
+            "structured_output": self._structured_mode(),
+            "fallback": analysis is None
+        }
+        with self._stats_lock:
+            self.generation_stats["requests"] += 1
+            self.generation_stats["fallbacks"] += analysis is None
+            self.generation_stats["tokens_generated"] += tokens_generated or 0
+            self.generation_stats["trailing_chars"] += generation["trailing_chars"]
+        
+        if analysis is None:
+            FALLBACKS.inc('unparseable_output')
+            log.warning("model_output_unparseable", response_text=response_text)
+            return dict(self._create_fallback_response(), generation=generation)
+        
+        # Only cache real model output, never fallbacks
+        if cache_key is not None:
+            triage_cache.set(cache_key, analysis)
+        return dict(analysis, generation=generation)
+    
+    def _structured_mode(self):
+        """How this backend keeps output to the JSON contract"""
+        if not self.use_local:
+            return STRUCTURED_OUTPUT if self.response_format is not None else "off"
+        if not LOCAL_JSON_STOP:
+            return "off"
+        return "json_grammar" if isinstance(self.pipe, LlamaCppPipeline) else "stop_at_json_close"
+    
+    def _count_tokens(self, text):
+        tokenizer = getattr(getattr(self, 'pipe', None), 'tokenizer', None)
+        return len(tokenizer.encode(text, add_special_tokens=False)) if tokenizer is not None else None
+    
+    def generation_status(self):
+        stats = dict(self.generation_stats)
+        requests = stats["requests"]
+        stats["fallback_rate"] = round(stats["fallbacks"] / requests, 3) if requests else 0.0
+        stats["mean_tokens_generated"] = round(stats["tokens_generated"] / requests, 1) if requests else 0.0
+        stats["structured_output"] = self._structured_mode()
+        stats["local_json_stop"] = LOCAL_JSON_STOP
+        stats["max_tokens"] = MODEL_MAX_TOKENS
+        return stats
+    
     def analyze_symptoms(self, data):
-        """Main method to analyze symptoms using GPT-OSS-20B"""
-        prompt = self._create_prompt(data)
+        """Main method to analyze symptoms using GPT-OSS-20B
+
+        Results are cached on a normalized fingerprint of the request; send
+        "cache": false in the payload to bypass the cache for one request.
+        """
+        with stage('triage_cache_lookup'):
+            cache_key, cached = self._cache_lookup(data)
+        if cached is not None:
+            BACKEND_REQUESTS.inc('cache')
+            return cached
+        
+        remote = self._uses_remote()
+        if remote and not self.breaker.allow_request():
+            # Upstream is known to be failing: answer from the rules right away
+            FALLBACKS.inc('breaker_open')
+            return mock_service.analyze_symptoms(data)
+        
+        with stage('prompt_build'):
+            messages = self._create_messages(data)
         
         try:
-            if self.client and not self.use_local:
+            if remote:
                 # Use Hugging Face Inference Providers
-                response = self.client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=1000,
-                    temperature=0.1
-                )
+                with stage('router_call'):
+                    response = self._create_completion(messages)
+                self.breaker.record_success()
                 response_text = response.choices[0].message.content
+                tokens_generated = getattr(response.usage, 'completion_tokens', None)
             else:
                 # Use local transformers
-                messages = [{"role": "user", "content": prompt}]
-                response = self.pipe(
-                    messages,
-                    max_new_tokens=1000,
-                    temperature=0.1,
-                    return_full_text=False
-                )
+                generate = self._local_generate()
+                with stage('local_generation'):
+                    response = generate(
+                        messages,
+                        max_new_tokens=MODEL_MAX_TOKENS,
+                        temperature=0.1,
+                        return_full_text=False,
+                        stop_at_json_close=LOCAL_JSON_STOP
+                    )
                 response_text = response[0]["generated_text"]
+                tokens_generated = self._count_tokens(response_text)
+            
+            BACKEND_REQUESTS.inc('router' if remote else 'local')
+            return self._finish_analysis(response_text, cache_key, tokens_generated)
             
-            return self._parse_response(response_text)
+        except Exception as e:
+            log.error("model_analysis_failed", error=str(e))
+            if remote:
+                self.breaker.record_failure()
+            # Fallback to mock service behavior
+            FALLBACKS.inc('error')
+            return mock_service.analyze_symptoms(data)
+    
+    async def analyze_symptoms_async(self, data):
+        """Async variant of analyze_symptoms for the ASGI serving mode
+
+        Router calls await AsyncOpenAI so no thread is held while waiting on
+        the network; local generation is CPU/GPU bound and runs in a thread.
+        """
+        if self.async_client is None or self.use_local:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.analyze_symptoms, data)
+        
+        with stage('triage_cache_lookup'):
+            cache_key, cached = self._cache_lookup(data)
+        if cached is not None:
+            BACKEND_REQUESTS.inc('cache')
+            return cached
+        
+        if not self.breaker.allow_request():
+            # Upstream is known to be failing: answer from the rules right away
+            FALLBACKS.inc('breaker_open')
+            return mock_service.analyze_symptoms(data)
+        
+        try:
+            with stage('prompt_build'):
+                messages = self._create_messages(data)
+            with stage('router_call'):
+                response = await self._create_completion_async(messages)
+            self.breaker.record_success()
+            BACKEND_REQUESTS.inc('router')
+            return self._finish_analysis(
+                response.choices[0].message.content, cache_key,
+                getattr(response.usage, 'completion_tokens', None)
+            )
             
         except Exception as e:
-            print(f"Error in GPT-OSS-20B analysis: {e}")
+            log.error("model_analysis_failed", error=str(e))
+            self.breaker.record_failure()
             # Fallback to mock service behavior
-            mock_service = MockAIService()
+            FALLBACKS.inc('error')
             return mock_service.analyze_symptoms(data)
 
 class GeminiVisionService:
@@ -456,64 +1300,121 @@ class GeminiVisionService:
         try:
             # Set the API key as environment variable for the client
             os.environ['GEMINI_API_KEY'] = self.gemini_api_key
-            self.client = genai.Client()
-            print("Gemini Vision service initialized successfully with Gemini 2.0 Flash")
+            base_url = os.getenv('GEMINI_BASE_URL')
+            if base_url:
+                # Point at an alternative endpoint such as a local benchmark stub
+                self.client = genai.Client(http_options=genai.types.HttpOptions(base_url=base_url))
+            else:
+                self.client = genai.Client()
+            log.info("gemini_client_ready", model="gemini-2.0-flash")
         except Exception as e:
-            print(f"Failed to initialize Gemini client: {e}")
+            log.error("gemini_client_failed", error=str(e))
             raise RuntimeError(f"Gemini initialization failed: {e}")
     
-    def analyze_image(self, image_data, prompt="What do you see in this medical image? Describe any visible symptoms, conditions, wounds, rashes, swelling, discoloration, or medical findings in detail."):
-        """Analyze medical image using Gemini 2.5 Flash vision model"""
+    def _no_image_result(self):
+        return {
+            "success": False,
+            "error": "No image data provided",
+            "user_message": "No image was uploaded for analysis."
+        }
+    
+    def _generation_request(self, image_data, prompt):
+        """Build the generate_content arguments shared by the sync and async paths"""
+        from google.genai import types
         
-        if not image_data:
+        # Create image part from bytes
+        image_part = types.Part.from_bytes(
+            data=image_data,
+            mime_type='image/jpeg'
+        )
+        
+        # Generate content with medical-focused prompt
+        return {
+            "model": 'gemini-2.0-flash',
+            "contents": [
+                image_part,
+                prompt
+            ],
+            "config": types.GenerateContentConfig(
+                thinking_config=types.ThinkingConfig(thinking_budget=0)  # Disable thinking for faster response
+            )
+        }
+    
+    def _format_result(self, response):
+        if response and response.text:
+            return {
+                "success": True,
+                "analysis": response.text.strip(),
+                "model": "gemini-2.0-flash"
+            }
+        else:
             return {
                 "success": False,
-                "error": "No image data provided",
-                "user_message": "No image was uploaded for analysis."
+                "error": "Empty response from Gemini",
+                "user_message": "Image analysis returned no results. Please describe any visible symptoms manually."
             }
+    
+    def _cache_lookup(self, image_data, prompt):
+        """Return (cache_key, cached_result); repeat uploads skip the Gemini call entirely"""
+        if image_cache is None:
+            return None, None
+        cache_key = image_cache.fingerprint(image_data, prompt)
+        cached = image_cache.get(cache_key)
+        if cached is not None:
+            cached["cached"] = True
+        return cache_key, cached
+    
+    def _finish_analysis(self, response, cache_key):
+        result = self._format_result(response)
+        # Only successful analyses are cached, so failures are retried next time
+        if result["success"] and cache_key is not None:
+            image_cache.set(cache_key, result)
+        return result
+    
+    def _format_error(self, e):
+        error_msg = f"Gemini analysis error: {str(e)}"
+        log.error("gemini_analysis_failed", error=str(e))
+        return {
+            "success": False,
+            "error": error_msg,
+            "user_message": f"Image analysis failed: {str(e)}. Please describe any visible symptoms, wounds, rashes, or medical findings manually."
+        }
+    
+    def analyze_image(self, image_data, prompt="What do you see in this medical image? Describe any visible symptoms, conditions, wounds, rashes, swelling, discoloration, or medical findings in detail."):
+        """Analyze medical image using Gemini 2.5 Flash vision model"""
+        
+        if not image_data:
+            return self._no_image_result()
+        
+        cache_key, cached = self._cache_lookup(image_data, prompt)
+        if cached is not None:
+            return cached
         
         try:
-            from google.genai import types
-            
-            # Create image part from bytes
-            image_part = types.Part.from_bytes(
-                data=image_data,
-                mime_type='image/jpeg'
-            )
-            
-            # Generate content with medical-focused prompt
-            response = self.client.models.generate_content(
-                model='gemini-2.0-flash',
-                contents=[
-                    image_part,
-                    prompt
-                ],
-                config=types.GenerateContentConfig(
-                    thinking_config=types.ThinkingConfig(thinking_budget=0)  # Disable thinking for faster response
-                )
-            )
-            
-            if response and response.text:
-                return {
-                    "success": True,
-                    "analysis": response.text.strip(),
-                    "model": "gemini-2.0-flash"
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": "Empty response from Gemini",
-                    "user_message": "Image analysis returned no results. Please describe any visible symptoms manually."
-                }
+            with stage('gemini_call'):
+                response = self.client.models.generate_content(**self._generation_request(image_data, prompt))
+            return self._finish_analysis(response, cache_key)
                 
         except Exception as e:
-            error_msg = f"Gemini analysis error: {str(e)}"
-            print(f"Gemini Vision Error: {error_msg}")
-            return {
-                "success": False,
-                "error": error_msg,
-                "user_message": f"Image analysis failed: {str(e)}. Please describe any visible symptoms, wounds, rashes, or medical findings manually."
-            }
+            return self._format_error(e)
+    
+    async def analyze_image_async(self, image_data, prompt="What do you see in this medical image? Describe any visible symptoms, conditions, wounds, rashes, swelling, discoloration, or medical findings in detail."):
+        """Async variant of analyze_image using the genai client's aio interface"""
+        
+        if not image_data:
+            return self._no_image_result()
+        
+        cache_key, cached = self._cache_lookup(image_data, prompt)
+        if cached is not None:
+            return cached
+        
+        try:
+            with stage('gemini_call'):
+                response = await self.client.aio.models.generate_content(**self._generation_request(image_data, prompt))
+            return self._finish_analysis(response, cache_key)
+                
+        except Exception as e:
+            return self._format_error(e)
     
     def _get_image_info(self, image_bytes):
         """Get basic information about the uploaded image"""
@@ -535,131 +1436,194 @@ class GeminiVisionService:
     
     def process_image_file(self, image_file):
         """Process uploaded image file and provide basic info"""
-        try:
-            # Open and process the image
-            image = Image.open(io.BytesIO(image_file))
-            
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Resize if too large (max 1024x1024 for efficiency)
-            max_size = 1024
-            if image.width > max_size or image.height > max_size:
-                image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-            
-            # Convert to bytes
-            img_byte_arr = io.BytesIO()
-            image.save(img_byte_arr, format='JPEG', quality=85)
-            img_byte_arr = img_byte_arr.getvalue()
-            
-            return {
-                "success": True,
-                "image_data": img_byte_arr,
-                "format": "JPEG",
-                "size": f"{image.width}x{image.height}",
-                "file_size_kb": len(img_byte_arr) // 1024
-            }
-            
-        except Exception as e:
-            error_msg = f"Error processing image file: {str(e)}"
-            print(f"Image Processing Error: {error_msg}")
-            return {
-                "success": False,
-                "error": error_msg
-            }
+        with stage('image_preprocess'):
+            result = run_image_preprocessing(image_file)
+        if not result["success"]:
+            log.warning("image_preprocess_failed", error=result['error'])
+        return result
+
+# Image preprocessing runs in a process pool so decoding does not hold the GIL
+# (IMAGE_PREPROCESS_WORKERS=0 runs it in the request thread instead)
+IMAGE_PREPROCESS_WORKERS = int(os.getenv('IMAGE_PREPROCESS_WORKERS', '2'))
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', str(DEFAULT_MAX_PIXELS)))
+set_max_pixels(MAX_IMAGE_PIXELS)
+_image_pool: Optional[ProcessPoolExecutor] = None
+_image_pool_lock = threading.Lock()
+
+def run_image_preprocessing(image_bytes):
+    """Preprocess an upload in the worker pool, falling back to this process if the pool breaks"""
+    global _image_pool
+    if IMAGE_PREPROCESS_WORKERS <= 0:
+        return preprocess_image(image_bytes, MAX_IMAGE_PIXELS)
+    
+    with _image_pool_lock:
+        if _image_pool is None:
+            _image_pool = create_worker_pool(IMAGE_PREPROCESS_WORKERS, MAX_IMAGE_PIXELS)
+        pool = _image_pool
+    
+    try:
+        return pool.submit(preprocess_image, image_bytes, MAX_IMAGE_PIXELS).result()
+    except BrokenProcessPool as e:
+        log.warning("image_pool_broken", error=str(e), fallback="in-process")
+        with _image_pool_lock:
+            if _image_pool is pool:
+                _image_pool = None
+        return preprocess_image(image_bytes, MAX_IMAGE_PIXELS)
+
+# Shared rule-based service for fast paths, fallbacks and startup
+mock_service = MockAIService()
 
-# Initialize AI service with fallback
-ai_service: Optional[Any] = None
+# AI services; MockAIService answers until the real backend is loaded and warm
+ai_service: Optional[Any] = mock_service
 image_service: Optional[GeminiVisionService] = None
 
-# Initialize GPT-OSS-20B service
-try:
-    ai_service = GPTOSS20BService()
-    print("GPT-OSS-20B service initialized successfully!")
-except Exception as e:
-    print(f"Failed to initialize GPT-OSS-20B service: {e}")
-    print("Falling back to mock AI service...")
-    ai_service = MockAIService()
-
-# Initialize Gemini Vision service
-try:
-    image_service = GeminiVisionService()
-    print("Gemini Vision service initialized successfully!")
-except Exception as e:
-    print(f"Failed to initialize Gemini Vision service: {e}")
-    print("Image analysis will not be available.")
-    image_service = None
 
-# Comprehensive medical triage prompt
-def create_triage_prompt(age, sex, symptoms, duration, vitals=None, image_analysis=None):
-    """Create a comprehensive medical triage prompt"""
-    
-    prompt = f"""You are an expert medical triage AI assistant. Analyze the following patient information and provide a comprehensive 7-level triage assessment.
+class BackendLoader:
+    """Load and warm up the model backends without blocking startup.
 
-Patient Information:
-- Age: {age} years
-- Sex: {sex}
-- Symptoms: {symptoms}
-- Duration: {duration}
-"""
+    State moves from "starting" (loading services) to "warming" (one
+    minimal inference) to "ready", when the real backend replaces the mock.
+    If the backend cannot be loaded the loader ends "degraded": it keeps
+    serving MockAIService and records the error.
+    """
 
-    if vitals and vitals.get('temperature'):
-        prompt += f"- Temperature: {vitals['temperature']}°C\n"
-    if vitals and vitals.get('heart_rate'):
-        prompt += f"- Heart Rate: {vitals['heart_rate']} BPM\n"
-    
-    if image_analysis:
-        prompt += f"- Image Analysis: {image_analysis}\n"
+    def __init__(self):
+        self.state = "starting"
+        self.started_at = time.time()
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.error: Optional[str] = None
 
-    prompt += """
-Please provide a comprehensive medical assessment in the following 7 levels:
+    def start(self, background=True):
+        if background:
+            threading.Thread(target=self._load, name='backend-loader', daemon=True).start()
+        else:
+            self._load()
 
-**Level 1 - Reassurance Level**: Provide reassurance for mild symptoms and general advice.
+    def _load(self):
+        global ai_service, image_service
 
-**Level 2 - Initial Assessment**: Classify the condition severity (mild/moderate/severe/emergency).
+        # Initialize Gemini Vision service
+        try:
+            image_service = GeminiVisionService()
+            log.info("vision_service_ready")
+        except Exception as e:
+            log.warning("vision_service_unavailable", error=str(e))
 
-**Level 3 - Pathological Possibilities**: List the 3-5 most likely medical conditions based on symptoms.
+        # Initialize GPT-OSS-20B service
+        started = time.perf_counter()
+        try:
+            service = GPTOSS20BService()
+            log.info("model_service_ready")
+        except Exception as e:
+            log.warning("model_service_unavailable", error=str(e), fallback="rule-based service")
+            self.error = str(e)
+            self.load_seconds = time.perf_counter() - started
+            self.state = "degraded"
+            return
+        self.load_seconds = time.perf_counter() - started
 
-**Level 4 - First Aid Measures**: Provide specific first aid instructions that can be done at home.
+        self.state = "warming"
+        started = time.perf_counter()
+        if os.getenv('MODEL_WARMUP', 'true').lower() == 'true':
+            try:
+                service.warm_up()
+            except Exception as e:
+                log.error("model_warmup_failed", error=str(e))
+                self.error = f"Warm-up failed: {e}"
+        self.warmup_seconds = time.perf_counter() - started
 
-**Level 5 - Danger Signs Alert**: List critical warning signs that require immediate medical attention.
+        ai_service = service
+        self.state = "ready"
+        log.info("ai_backend_ready", load_seconds=round(self.load_seconds, 1), warmup_seconds=round(self.warmup_seconds, 1))
 
-**Level 6 - Vital Signs Analysis**: Analyze any provided vital signs and their implications.
+    def status(self):
+        return {
+            "state": self.state,
+            "serving": type(ai_service).__name__ if ai_service is not None else None,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            "warmup_seconds": round(self.warmup_seconds, 2) if self.warmup_seconds is not None else None,
+            "error": self.error
+        }
 
-**Level 7 - Summary Report & Next Action**: Provide a concise summary and specific next steps.
 
-Format your response as a JSON object with these exact keys:
-{
-  "level_1_reassurance": "string",
-  "level_2_assessment": {"severity": "mild|moderate|severe|emergency", "description": "string"},
-  "level_3_possibilities": ["condition1", "condition2", "condition3"],
-  "level_4_first_aid": ["step1", "step2", "step3"],
-  "level_5_danger_signs": ["sign1", "sign2", "sign3"],
-  "level_6_vitals_analysis": "string",
-  "level_7_summary": {"summary": "string", "next_action": "string"}
-}
+backend_loader = BackendLoader()
 
-Be precise, medically accurate, and prioritize patient safety."""
+if not IMAGE_WORKER:
+    backend_loader.start(background=os.getenv('BACKGROUND_MODEL_LOAD', 'true').lower() == 'true')
 
-    return prompt
+# Comprehensive medical triage prompt
+def create_triage_prompt(age, sex, symptoms, duration, vitals=None, image_analysis=None):
+    """Create a comprehensive medical triage prompt as a single string (static instructions first)"""
+    return TRIAGE_INSTRUCTIONS + "\n\n" + patient_block(age, sex, symptoms, duration, vitals, image_analysis)
 
 # Emergency keywords detection
 def detect_emergency_keywords(symptoms):
     """Detect emergency keywords in symptoms"""
-    emergency_keywords = [
-        'chest pain', 'severe bleeding', 'bleeding', 'blood', 'fainting', 'fainted', 'unconscious',
-        'shortness of breath', 'can\'t breathe', 'difficulty breathing', 'stroke', 'heart attack',
-        'seizure', 'convulsion', 'anaphylaxis', 'allergic reaction', 'poisoning', 'overdose',
-        'suicide', 'drowning', 'choking', 'head injury', 'neck injury', 'spine injury', 'paralysis'
-    ]
-    
-    symptoms_lower = symptoms.lower()
-    detected = [keyword for keyword in emergency_keywords if keyword in symptoms_lower]
+    detected = knowledge_base.current().match(symptoms).get('emergency', [])
     return detected
 
+DEFAULT_IMAGE_PROMPT = 'What do you see in this medical image? Describe any symptoms, conditions, rashes, wounds, or medical findings visible. Focus on medically relevant observations.'
+
+IMAGE_FALLBACK_MESSAGE = 'Please describe any visible symptoms or medical findings in the text field.'
+
+ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
+
+def validate_image_upload(files):
+    """Return (file, None) for a usable upload or (None, (error_body, status)) otherwise"""
+    # Check if file is in request
+    if 'image' not in files:
+        return None, ({'error': 'No image file provided'}, 400)
+    
+    file = files['image']
+    if file.filename == '':
+        return None, ({'error': 'No image file selected'}, 400)
+    
+    # Check file type
+    if file.filename is None or '.' not in file.filename:
+        file_extension = ''
+    else:
+        file_extension = file.filename.rsplit('.', 1)[1].lower()
+    
+    if file_extension not in ALLOWED_IMAGE_EXTENSIONS:
+        return None, ({'error': 'Invalid file type. Please upload an image file.'}, 400)
+    
+    return file, None
+
+def format_image_response(processing_result, analysis_result):
+    """Build the /api/analyze_image response body"""
+    if analysis_result['success']:
+        return {
+            'success': True,
+            'analysis': analysis_result['analysis'],
+            'model': analysis_result['model'],
+            'cached': analysis_result.get('cached', False),
+            'image_info': {
+                'format': processing_result['format'],
+                'size': processing_result['size']
+            }
+        }
+    return {
+        'success': False,
+        'error': analysis_result.get('error', 'Analysis failed'),
+        'fallback_analysis': analysis_result.get('fallback_analysis', 'Please describe visible symptoms manually.')
+    }
+
+def upload_too_large_body():
+    return {
+        'error': f'Upload too large. The maximum size is {MAX_UPLOAD_MB:g} MB.',
+        'fallback_message': IMAGE_FALLBACK_MESSAGE
+    }
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    """Return the size limit as JSON instead of an HTML error page"""
+    return jsonify(upload_too_large_body()), 413
+
 # Image analysis endpoint
 @app.route('/api/analyze_image', methods=['POST'])
+@timed('image_request')
 def analyze_image():
     """Analyze uploaded image for medical symptoms"""
     try:
@@ -667,26 +1631,13 @@ def analyze_image():
         if image_service is None:
             return jsonify({
                 'error': 'Image analysis service not available',
-                'fallback_message': 'Please describe any visible symptoms or medical findings in the text field.'
+                'fallback_message': IMAGE_FALLBACK_MESSAGE
             }), 503
         
-        # Check if file is in request
-        if 'image' not in request.files:
-            return jsonify({'error': 'No image file provided'}), 400
-        
-        file = request.files['image']
-        if file.filename == '':
-            return jsonify({'error': 'No image file selected'}), 400
-        
-        # Check file type
-        allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
-        if file.filename is None or '.' not in file.filename:
-            file_extension = ''
-        else:
-            file_extension = file.filename.rsplit('.', 1)[1].lower()
-        
-        if file_extension not in allowed_extensions:
-            return jsonify({'error': 'Invalid file type. Please upload an image file.'}), 400
+        file, upload_error = validate_image_upload(request.files)
+        if upload_error:
+            body, status = upload_error
+            return jsonify(body), status
         
         # Read file data
         file_data = file.read()
@@ -700,7 +1651,7 @@ def analyze_image():
             }), 400
         
         # Get optional custom prompt
-        custom_prompt = request.form.get('prompt', 'What do you see in this medical image? Describe any symptoms, conditions, rashes, wounds, or medical findings visible. Focus on medically relevant observations.')
+        custom_prompt = request.form.get('prompt', DEFAULT_IMAGE_PROMPT)
         
         # Analyze image
         analysis_result = image_service.analyze_image(
@@ -708,43 +1659,149 @@ def analyze_image():
             custom_prompt
         )
         
-        if analysis_result['success']:
-            response = {
-                'success': True,
-                'analysis': analysis_result['analysis'],
-                'model': analysis_result['model'],
-                'image_info': {
-                    'format': processing_result['format'],
-                    'size': processing_result['size']
-                }
-            }
-        else:
-            response = {
-                'success': False,
-                'error': analysis_result.get('error', 'Analysis failed'),
-                'fallback_analysis': analysis_result.get('fallback_analysis', 'Please describe visible symptoms manually.')
-            }
-        
-        return jsonify(response)
+        return jsonify(format_image_response(processing_result, analysis_result))
         
+    except RequestEntityTooLarge:
+        return jsonify(upload_too_large_body()), 413
     except Exception as e:
         return jsonify({
             'error': f'Unexpected error during image analysis: {str(e)}',
-            'fallback_message': 'Please describe any visible symptoms or medical findings in the text field.'
+            'fallback_message': IMAGE_FALLBACK_MESSAGE
         }), 500
 
+def format_triage_response(analysis, data):
+    """Map a 7-level analysis onto the response structure the frontend expects"""
+    response = {
+        "risk_level": analysis["level_2_assessment"]["severity"],
+        "risk_assessment": analysis["level_2_assessment"]["description"],
+        "possible_conditions": analysis["level_3_possibilities"],
+        "first_aid_measures": analysis["level_4_first_aid"],
+        "immediate_actions": [analysis["level_7_summary"]["next_action"]],
+        "danger_signs": analysis["level_5_danger_signs"],
+        "vitals_analysis": [analysis["level_6_vitals_analysis"]],
+        "timeline_recommendations": copy.deepcopy(knowledge_base.current().timeline)
+    }
+
+    # Add image analysis info if available
+    if 'image_analysis' in data and data['image_analysis']:
+        response["image_analysis_included"] = True
+        response["image_findings"] = data['image_analysis']
+
+    if analysis.get("generation"):
+        response["generation"] = analysis["generation"]
+
+    return response
+
+# Background refinement of emergency fast-path responses
+REFINEMENT_TTL_SECONDS = int(os.getenv('REFINEMENT_TTL_SECONDS', '600'))
+REFINEMENT_MAX_JOBS = int(os.getenv('REFINEMENT_MAX_JOBS', '256'))
+refinement_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('REFINEMENT_WORKERS', '4')),
+    thread_name_prefix='triage-refine'
+)
+refinement_jobs: "OrderedDict[str, Any]" = OrderedDict()
+refinement_lock = threading.Lock()
+
+def pin_emergency(response, detected_keywords):
+    """Keep a model-refined response at emergency level with the emergency action first"""
+    response["risk_level"] = "emergency"
+    emergency_action = mock_service._generate_next_action("emergency")
+    if emergency_action not in response["immediate_actions"]:
+        response["immediate_actions"].insert(0, emergency_action)
+    response["emergency_keywords"] = detected_keywords
+    return response
+
+def _refine_triage(data, detected_keywords):
+    """Run the full AI assessment for a case that already has a preliminary answer"""
+    response = format_triage_response(ai_service.analyze_symptoms(data), data)
+
+    # The refinement adds detail but never downgrades an emergency
+    if detected_keywords:
+        pin_emergency(response, detected_keywords)
+    return response
+
+def submit_refinement(refine, *args):
+    """Queue a background AI assessment and return the id the client polls with
+
+    Finished jobs past REFINEMENT_TTL_SECONDS, then the oldest finished job,
+    make room for new ones; a job still running is never dropped, however old,
+    so when all REFINEMENT_MAX_JOBS are pending this returns None.
+    """
+    with refinement_lock:
+        now = time.time()
+        expired = [job_id for job_id, (created, future) in refinement_jobs.items()
+                   if now - created >= REFINEMENT_TTL_SECONDS and future.done()]
+        for job_id in expired:
+            refinement_jobs.pop(job_id)
+        if len(refinement_jobs) >= REFINEMENT_MAX_JOBS:
+            finished_id = next((job_id for job_id, (_, future) in refinement_jobs.items() if future.done()), None)
+            if finished_id is None:
+                log.warning("refinement_rejected", pending=len(refinement_jobs))
+                return None
+            refinement_jobs.pop(finished_id)
+        request_id = uuid.uuid4().hex
+        refinement_jobs[request_id] = (now, refinement_executor.submit(refine, *args))
+    return request_id
+
+def queue_refinement(response, refine, *args):
+    """Attach a background refinement to response, or mark it unavailable when the queue is full"""
+    request_id = submit_refinement(refine, *args)
+    if request_id is None:
+        response["refinement"] = "unavailable"
+    else:
+        response["request_id"] = request_id
+        response["refinement"] = "pending"
+    return response
+
+def emergency_fast_path(data, detected_keywords):
+    """Build an immediate emergency response without waiting on the language model"""
+    analysis = mock_service.analyze_symptoms(data, risk_level="emergency")
+    response = format_triage_response(analysis, data)
+    response["emergency_keywords"] = detected_keywords
+    response["fast_path"] = True
+
+    # Only schedule a refinement when a model would add something the rules did not
+    if data.get('refine', True) and not isinstance(ai_service, MockAIService):
+        queue_refinement(response, _refine_triage, data, detected_keywords)
+    else:
+        response["refinement"] = "none"
+
+    return response
+
+def validate_triage_payload(data):
+    """Return an error message for an invalid triage payload, or None if it is valid"""
+    if not isinstance(data, dict):
+        return 'Request body must be a JSON object'
+    required_fields = ['age', 'sex', 'symptoms', 'duration']
+    for field in required_fields:
+        if field not in data:
+            return f'Missing required field: {field}'
+    if not isinstance(data['symptoms'], str):
+        return 'Field symptoms must be a string'
+    return None
+
+def run_triage(data):
+    """Triage one validated payload, taking the emergency fast path when it applies"""
+    # Only what the patient wrote: model-written image findings such as 'no active
+    # bleeding' are weighed by the assessment, not matched as bare keywords
+    detected_keywords = detect_emergency_keywords(data['symptoms'])
+    if detected_keywords:
+        return emergency_fast_path(data, detected_keywords)
+    return format_triage_response(ai_service.analyze_symptoms(data), data)
+
 # Analyze triage endpoint
 @app.route('/api/analyze', methods=['POST'])
+@timed('triage_request')
 def analyze_triage():
     """Analyze patient symptoms and provide triage recommendations"""
     try:
-        data = request.get_json()
-        
-        # Validate required fields
-        required_fields = ['age', 'sex', 'symptoms', 'duration']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+        with stage('request_parse'):
+            data = request.get_json()
+            
+            # Validate required fields
+            validation_error = validate_triage_payload(data)
+        if validation_error:
+            return jsonify({'error': validation_error}), 400
         
         # Ensure ai_service is available
         if ai_service is None:
@@ -754,83 +1811,427 @@ def analyze_triage():
         if not hasattr(ai_service, 'analyze_symptoms'):
             return jsonify({'error': 'AI service does not support symptom analysis'}), 503
         
-        # Add image analysis if provided
-        if 'image_analysis' in data and data['image_analysis']:
-            # Image analysis has been performed, include it in the data
-            print(f"Including image analysis in symptom evaluation: {data['image_analysis'][:100]}...")
-            print(f"Full image analysis data received: {data['image_analysis']}")
+        # Emergency fast path: answer before any model call
+        detected_keywords = detect_emergency_keywords(data['symptoms'])
+        if detected_keywords:
+            log.info("emergency_fast_path", keywords=detected_keywords)
+            return jsonify(emergency_fast_path(data, detected_keywords))
+        
+        # Image analysis, if provided, is part of the data the AI service evaluates
+        if data.get('image_analysis'):
+            log.debug("triage_image_context", image_analysis=data['image_analysis'])
         
         # Use AI service for analysis
-        print(f"Using AI service: {type(ai_service).__name__}")
         analysis = ai_service.analyze_symptoms(data)
-        print(f"AI service returned analysis with keys: {list(analysis.keys()) if analysis else 'None'}")
         
         # Format response to match expected structure
-        response = {
-            "risk_level": analysis["level_2_assessment"]["severity"],
-            "risk_assessment": analysis["level_2_assessment"]["description"],
-            "possible_conditions": analysis["level_3_possibilities"],
-            "first_aid_measures": analysis["level_4_first_aid"],
-            "immediate_actions": [analysis["level_7_summary"]["next_action"]],
-            "danger_signs": analysis["level_5_danger_signs"],
-            "vitals_analysis": [analysis["level_6_vitals_analysis"]],
-            "timeline_recommendations": {
-                "Next 24 hours": ["Monitor symptoms closely", "Follow recommended first aid measures"],
-                "Next 48 hours": ["Reassess condition", "Contact healthcare provider if needed"],
-                "Next week": ["Follow up as recommended", "Complete any prescribed treatments"]
-            }
-        }
+        response = format_triage_response(analysis, data)
+        log.info(
+            "triage_complete",
+            backend=type(ai_service).__name__,
+            risk_level=response.get('risk_level'),
+            image_analysis_included=bool(response.get("image_analysis_included")),
+            request_fields=sorted(data.keys())
+        )
+        return jsonify(response)
         
-        # Add image analysis info if available
-        if 'image_analysis' in data and data['image_analysis']:
-            response["image_analysis_included"] = True
-            response["image_findings"] = data['image_analysis']
-            print(f"Added image analysis to response: {data['image_analysis'][:100]}...")
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Batch triage for offline queues synced by community health workers
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '200'))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '4'))
+
+def _batch_item_result(index, item):
+    """Triage one batch item, turning failures into a per-item error"""
+    result = {"index": index}
+    if isinstance(item, dict) and 'id' in item:
+        result["id"] = item['id']
+
+    validation_error = validate_triage_payload(item)
+    if validation_error:
+        result.update(status="error", error=validation_error)
+        return result
+
+    try:
+        result.update(status="ok", result=run_triage(item))
+    except Exception as e:
+        result.update(status="error", error=str(e))
+    return result
+
+@app.route('/api/analyze_batch', methods=['POST'])
+def analyze_batch():
+    """Triage an array of /api/analyze payloads concurrently
+
+    Accepts either a JSON array or {"items": [...]}. Results come back in
+    input order with a per-item status. With ?stream=ndjson (or an
+    Accept: application/x-ndjson header) each result is written as its own
+    line as soon as it finishes. ?concurrency=N lowers the fan-out below
+    the BATCH_MAX_CONCURRENCY cap.
+    """
+    body = request.get_json(silent=True)
+    items = body.get('items') if isinstance(body, dict) else body
+    if not isinstance(items, list):
+        return jsonify({'error': 'Request body must be a JSON array of triage requests'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'Batch too large: {len(items)} items (maximum {BATCH_MAX_ITEMS})'}), 413
+
+    if ai_service is None or not hasattr(ai_service, 'analyze_symptoms'):
+        return jsonify({'error': 'AI service not available'}), 503
+
+    concurrency = request.args.get('concurrency', BATCH_MAX_CONCURRENCY, type=int)
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY, len(items) or 1))
+    stream = (request.args.get('stream') == 'ndjson'
+              or request.accept_mimetypes.best == 'application/x-ndjson')
+
+    if stream:
+        def generate():
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='triage-batch') as executor:
+                futures = [executor.submit(_batch_item_result, index, item) for index, item in enumerate(items)]
+                for future in as_completed(futures):
+                    yield json.dumps(future.result()) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='triage-batch') as executor:
+        results = list(executor.map(_batch_item_result, range(len(items)), items))
+
+    return jsonify({
+        "count": len(results),
+        "errors": sum(1 for result in results if result["status"] == "error"),
+        "results": results
+    })
+
+# Combined image + symptom triage in one request
+multimodal_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('MULTIMODAL_WORKERS', '8')),
+    thread_name_prefix='image-analysis'
+)
+# Longest wait for an image before the text-only assessment is returned without it
+IMAGE_ANALYSIS_TIMEOUT = float(os.getenv('IMAGE_ANALYSIS_TIMEOUT', '45'))
+
+def parse_multimodal_form(form):
+    """Build a triage payload from multipart form fields; vitals arrive as a JSON string"""
+    data = {key: form[key] for key in ('age', 'sex', 'symptoms', 'duration') if key in form}
+    if 'age' in data:
+        try:
+            data['age'] = int(data['age'])
+        except ValueError:
+            pass
+    try:
+        vitals = json.loads(form.get('vitals') or '{}')
+    except ValueError:
+        vitals = {}
+    data['vitals'] = vitals if isinstance(vitals, dict) else {}
+    if form.get('refine') == 'false':
+        data['refine'] = False
+    return data
+
+def analyze_upload(image_bytes, prompt):
+    """Preprocess and analyze one upload; returns the analysis result dict"""
+    if image_service is None:
+        return {"success": False, "error": "Image analysis service not available"}
+    processing_result = image_service.process_image_file(image_bytes)
+    if not processing_result['success']:
+        return {"success": False, "error": processing_result.get('error', 'Failed to process image')}
+    return image_service.analyze_image(processing_result['image_data'], prompt)
+
+def wait_for_image(image_future):
+    """Return an image analysis result, or a failed one if it outlasts IMAGE_ANALYSIS_TIMEOUT"""
+    try:
+        return image_future.result(timeout=IMAGE_ANALYSIS_TIMEOUT)
+    except FutureTimeoutError:
+        image_future.cancel()
+        log.warning("image_analysis_timeout", timeout_s=IMAGE_ANALYSIS_TIMEOUT)
+        return {"success": False, "error": f"Image analysis did not finish within {IMAGE_ANALYSIS_TIMEOUT:g} seconds"}
+
+def merge_image_findings(response, data, image_result):
+    """Record image findings on a response; returns the payload to re-triage with, or None"""
+    if not image_result['success']:
+        response["image_analysis_included"] = False
+        response["image_error"] = image_result.get('error', 'Image analysis failed')
+        response["fallback_message"] = IMAGE_FALLBACK_MESSAGE
+        return None
+    response["image_analysis_included"] = True
+    response["image_findings"] = image_result['analysis']
+    response["image_cached"] = image_result.get('cached', False)
+    return dict(data, image_analysis=image_result['analysis'])
+
+def _refine_with_image(data, image_future, detected_keywords):
+    """Background assessment for an emergency answered before its image finished"""
+    image_result = wait_for_image(image_future)
+    scratch = {}
+    refined_data = merge_image_findings(scratch, data, image_result) or data
+    response = _refine_triage(refined_data, detected_keywords)
+    response.update(scratch)
+    return response
+
+@app.route('/api/analyze_multimodal', methods=['POST'])
+@timed('multimodal_request')
+def analyze_multimodal():
+    """Triage symptoms and an image together, running Gemini alongside the text assessment
+
+    Takes the /api/analyze fields as multipart form fields (vitals as a JSON
+    string) plus an image and optional prompt. The text-only triage starts
+    immediately while the image is analyzed; the findings are then folded
+    in. The rule-based service simply re-runs with them, while a language
+    model backend returns its text-only answer now and delivers the
+    image-aware assessment as a refinement polled via /api/analyze/<id>.
+    Emergencies never wait for the image.
+    """
+    try:
+        data = parse_multimodal_form(request.form)
+        validation_error = validate_triage_payload(data)
+        if validation_error is None and not isinstance(data['age'], int):
+            validation_error = 'Field age must be a whole number'
+        if validation_error:
+            return jsonify({'error': validation_error}), 400
+
+        if ai_service is None or not hasattr(ai_service, 'analyze_symptoms'):
+            return jsonify({'error': 'AI service not available'}), 503
+
+        file, upload_error = validate_image_upload(request.files)
+        if upload_error:
+            body, status = upload_error
+            return jsonify(body), status
+
+        image_future = multimodal_executor.submit(
+            analyze_upload, file.read(), request.form.get('prompt', DEFAULT_IMAGE_PROMPT)
+        )
+
+        # Text-only triage runs in this thread while Gemini works
+        response = run_triage(dict(data, refine=False))
+
+        if response.get("fast_path"):
+            if data.get('refine', True):
+                queue_refinement(response, _refine_with_image, data, image_future, response["emergency_keywords"])
+            response["image_analysis_included"] = False
+            response["image_status"] = "pending" if response.get("refinement") == "pending" else "skipped"
+            return jsonify(response)
+
+        refined_data = merge_image_findings(response, data, wait_for_image(image_future))
+        if refined_data is None:
+            response["refinement"] = "none"
+            return jsonify(response)
+
+        if isinstance(ai_service, MockAIService):
+            # The rules are instant, so re-run them with the image findings included
+            image_cached = response["image_cached"]
+            response = run_triage(dict(refined_data, refine=False))
+            response["image_cached"] = image_cached
+            response.setdefault("refinement", "none")
+            return jsonify(response)
+
+        # The model weighs the image findings; their words alone never pin an emergency
+        if data.get('refine', True):
+            queue_refinement(response, _refine_triage, refined_data, [])
         else:
-            print("No image analysis data found in request data")
-            print(f"Request data keys: {list(data.keys())}")
-        
-        print(f"Final response keys: {list(response.keys())}")
+            response["refinement"] = "none"
         return jsonify(response)
-        
+
+    except RequestEntityTooLarge:
+        return jsonify(upload_too_large_body()), 413
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def refinement_status(request_id):
+    """Return (body, status) describing a queued emergency refinement"""
+    with refinement_lock:
+        job = refinement_jobs.get(request_id)
+
+    if job is None:
+        return {'error': 'Unknown or expired request id'}, 404
+
+    _, future = job
+    if not future.done():
+        return {'request_id': request_id, 'status': 'pending'}, 202
+
+    try:
+        result = future.result()
+    except Exception as e:
+        return {'request_id': request_id, 'status': 'failed', 'error': str(e)}, 500
+
+    return {'request_id': request_id, 'status': 'complete', 'result': result}, 200
+
+# Emergency refinement endpoint
+@app.route('/api/analyze/<request_id>', methods=['GET'])
+def get_refinement(request_id):
+    """Return the detailed AI assessment that follows an emergency fast-path response"""
+    body, status = refinement_status(request_id)
+    return jsonify(body), status
+
+def _sse_event(event, payload):
+    """Encode one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+# Streaming triage endpoint
+@app.route('/api/analyze_stream', methods=['POST'])
+def analyze_triage_stream():
+    """Stream the 7-level assessment as Server-Sent Events, one level at a time
+
+    Rule-based levels that need no model (danger signs, vitals) are sent
+    first, then each model level as soon as the model has produced it,
+    and finally a "done" event carrying the same body /api/analyze returns.
+    Each level is sent once, except that a model value for a level the
+    rules already sent comes again with "replaces": "rules" and supersedes
+    it; a repeat of the same value is not sent.
+    """
+    data = request.get_json(silent=True)
+
+    # Validate required fields
+    validation_error = validate_triage_payload(data)
+    if validation_error:
+        return jsonify({'error': validation_error}), 400
+
+    if ai_service is None or not hasattr(ai_service, 'stream_analysis'):
+        return jsonify({'error': 'AI service does not support streaming analysis'}), 503
+
+    def generate():
+        detected_keywords = detect_emergency_keywords(data['symptoms'])
+        risk_override = "emergency" if detected_keywords else None
+        rules = mock_service.analyze_symptoms(data, risk_level=risk_override)
+        analysis = {}
+        # Source of the value each level was last sent with
+        sent = {}
+
+        if detected_keywords:
+            # Emergency: every rule-based level goes out before any model call
+            yield _sse_event("emergency", {"emergency_keywords": detected_keywords})
+            early_keys = TRIAGE_LEVEL_KEYS
+        else:
+            early_keys = ['level_5_danger_signs', 'level_6_vitals_analysis']
+        for key in early_keys:
+            analysis[key], sent[key] = rules[key], "rules"
+            yield _sse_event("level", {"key": key, "value": rules[key], "source": "rules"})
+
+        if not isinstance(ai_service, MockAIService):
+            try:
+                for key, value, source in ai_service.stream_analysis(data):
+                    if key == 'level_2_assessment' and detected_keywords:
+                        # The model refines an emergency but never downgrades it
+                        value = dict(value, severity="emergency")
+                    if key in sent and value == analysis[key]:
+                        continue
+                    event = {"key": key, "value": value, "source": source}
+                    if key in sent:
+                        event["replaces"] = sent[key]
+                    analysis[key], sent[key] = value, source
+                    yield _sse_event("level", event)
+            except Exception as e:
+                log.error("triage_stream_failed", error=str(e))
+                yield _sse_event("error", {"error": str(e)})
+
+        # Anything still missing comes from the rules
+        for key in TRIAGE_LEVEL_KEYS:
+            if key not in analysis:
+                analysis[key] = rules[key]
+                yield _sse_event("level", {"key": key, "value": rules[key], "source": "rules"})
+
+        response = format_triage_response(analysis, data)
+        if detected_keywords:
+            pin_emergency(response, detected_keywords)
+        yield _sse_event("done", response)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Triage history endpoints
+def _encode_cursor(cursor):
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode() if cursor else None
+
+def _decode_cursor(token):
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except ValueError:
+        return None
+    return cursor if isinstance(cursor, list) and len(cursor) == 3 else None
+
+@app.route('/api/history', methods=['GET'])
+def list_history():
+    """Newest-first page of stored triage results
+
+    Filters: device_id, patient_id, risk_level, since/until (ISO 8601 on the
+    record date). Pass the returned next_cursor as ?cursor= for the next page.
+    """
+    if history_store is None:
+        return jsonify({'error': 'History store is disabled (HISTORY_BACKEND=off)'}), 404
+    cursor = None
+    if request.args.get('cursor'):
+        cursor = _decode_cursor(request.args['cursor'])
+        if cursor is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    try:
+        records, next_cursor = history_store.query(
+            device_id=request.args.get('device_id'),
+            patient_id=request.args.get('patient_id'),
+            risk_level=request.args.get('risk_level'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            limit=request.args.get('limit', 50, type=int),
+            cursor=cursor
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({"count": len(records), "records": records, "next_cursor": _encode_cursor(next_cursor)})
+
+@app.route('/api/history/sync', methods=['POST'])
+def sync_history():
+    """Delta sync: upload local changes, download everything changed since sync_token
+
+    Body: {"device_id": "...", "sync_token": <token from the last sync, 0 at first>,
+    "records": [changed or deleted scans]}. The response lists the changes
+    other writers made after sync_token and the token to send next time;
+    while has_more is true, call again with the new token and no records.
+    """
+    if history_store is None:
+        return jsonify({'error': 'History store is disabled (HISTORY_BACKEND=off)'}), 404
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict) or not body.get('device_id'):
+        return jsonify({'error': 'Request body must be a JSON object with a device_id'}), 400
+    records = body.get('records') or []
+    if not isinstance(records, list):
+        return jsonify({'error': 'Field records must be an array'}), 400
+    if len(records) > HISTORY_SYNC_MAX_RECORDS:
+        return jsonify({'error': f'Too many records: {len(records)} (maximum {HISTORY_SYNC_MAX_RECORDS})'}), 413
+    try:
+        since = max(int(body.get('sync_token') or 0), 0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Field sync_token must be an integer'}), 400
+    try:
+        limit = max(1, min(int(body.get('limit') or HISTORY_SYNC_PAGE_SIZE), HISTORY_SYNC_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Field limit must be an integer'}), 400
+
+    device_id = str(body['device_id'])
+    accepted, stale, rejected, first, last = history_store.ingest(records, device_id)
+    changes, token, has_more = history_store.changes_since(since, limit, exclude=(first, last))
+    return jsonify({
+        "accepted": accepted,
+        "stale": stale,
+        "rejected": rejected,
+        "changes": changes,
+        "sync_token": token,
+        "has_more": has_more
+    })
+
+# Prometheus metrics endpoint
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Per-stage latency histograms and backend, fallback and cache counters"""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled (METRICS_ENABLED=false)'}), 404
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 # Health check endpoint
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Check if the AI services are loaded and ready"""
     try:
-        services_status = {
-            "ai_service": {
-                "available": ai_service is not None and hasattr(ai_service, 'analyze_symptoms'),
-                "model": getattr(ai_service, 'model_name', 'mock') if ai_service else None
-            },
-            "image_service": {
-                "available": image_service is not None,
-                "model": getattr(image_service, 'model_name', None) if image_service else None
-            }
-        }
-        
-        # Determine overall status
-        if services_status["ai_service"]["available"]:
-            overall_status = "healthy"
-            status_message = "Primary AI service ready"
-            if services_status["image_service"]["available"]:
-                status_message += " with image analysis"
-            else:
-                status_message += " (image analysis unavailable)"
-        else:
-            overall_status = "service_unavailable"
-            status_message = "AI service not ready"
-        
-        response = {
-            "status": overall_status,
-            "message": status_message,
-            "services": services_status
-        }
-        
-        return jsonify(response), 200 if overall_status == "healthy" else 503
+        response, status = health_status()
+        return jsonify(response), status
         
     except Exception as e:
         return jsonify({
@@ -838,28 +2239,119 @@ def health_check():
             "error": str(e)
         }), 500
 
+def health_status():
+    """Return (body, status) for the health check, shared by the WSGI and ASGI apps"""
+    services_status = {
+        "ai_service": {
+            "available": ai_service is not None and hasattr(ai_service, 'analyze_symptoms'),
+            "model": getattr(ai_service, 'model_name', 'mock') if ai_service else None,
+            "circuit_breaker": ai_service.breaker.status() if getattr(ai_service, 'breaker', None) else None,
+            "generation": ai_service.generation_status() if hasattr(ai_service, 'generation_status') else None
+        },
+        "image_service": {
+            "available": image_service is not None,
+            "model": getattr(image_service, 'model_name', None) if image_service else None
+        },
+        "local_batching": ai_service.batcher.stats() if getattr(ai_service, 'batcher', None) else None,
+        "prompt_prefix_cache": ai_service.prefix_cache.stats() if getattr(ai_service, 'prefix_cache', None) else None,
+        "triage_cache": triage_cache.stats() if triage_cache is not None else {"backend": "off"},
+        "image_cache": image_cache.stats() if image_cache is not None else {"backend": "off"},
+        "history": history_store.stats() if history_store is not None else {"backend": "off"},
+        "triage_rules": knowledge_base.stats(),
+        "symptom_index": symptom_index.stats() if symptom_index is not None else {"encoder": "off"}
+    }
+    
+    services_status["ai_service"]["backend"] = backend_loader.status()
+    
+    # Determine overall status
+    if backend_loader.state in ("starting", "warming"):
+        # Rule-based triage keeps answering while the model loads, but the instance is not ready yet
+        overall_status = backend_loader.state
+        status_message = f"AI backend {backend_loader.state}; rule-based triage is serving requests"
+    elif backend_loader.state == "degraded":
+        overall_status = "degraded"
+        status_message = f"AI backend failed to load ({backend_loader.error}); rule-based triage is serving requests"
+    elif services_status["ai_service"]["available"]:
+        overall_status = "healthy"
+        status_message = "Primary AI service ready"
+        if services_status["image_service"]["available"]:
+            status_message += " with image analysis"
+        else:
+            status_message += " (image analysis unavailable)"
+    else:
+        overall_status = "service_unavailable"
+        status_message = "AI service not ready"
+    
+    response = {
+        "status": overall_status,
+        "message": status_message,
+        "services": services_status
+    }
+    
+    return response, 503 if overall_status in ("starting", "warming", "service_unavailable") else 200
+
+# Frontend assets, loaded and precompressed once at startup
+STATIC_PRECOMPRESS = os.getenv('STATIC_PRECOMPRESS', 'true').lower() == 'true'
+STATIC_ROOT = os.path.dirname(os.path.abspath(__file__))
+# Built from the knowledge base rather than read from disk; index.html preloads the ruleset for the offline engine
+TRIAGE_RULES_ASSET = 'js/triage-rules.json'
+GENERATED_ASSETS = {TRIAGE_RULES_ASSET: knowledge_base.current().json}
+
+def create_static_assets():
+    """Build the in-memory asset table, or None to serve files from disk"""
+    if not STATIC_PRECOMPRESS:
+        return None
+    try:
+        return StaticAssets(STATIC_ROOT, generated=GENERATED_ASSETS)
+    except OSError as e:
+        log.warning("static_assets_failed", error=str(e), fallback="disk")
+        return None
+
+
+static_assets = None if IMAGE_WORKER else create_static_assets()
+
+def publish_triage_rules(rules):
+    """Serve a reloaded ruleset, and point index.html at its new fingerprint"""
+    GENERATED_ASSETS[TRIAGE_RULES_ASSET] = rules.json
+    if static_assets is not None:
+        static_assets.replace(TRIAGE_RULES_ASSET, rules.json)
+
+knowledge_base.on_reload(publish_triage_rules)
+
+def asset_response(path):
+    """Response for a precompressed asset, or None if it is not in the table"""
+    # Picks up an edited knowledge base before index.html names the ruleset's URL
+    knowledge_base.current()
+    if static_assets is None:
+        body = GENERATED_ASSETS.get(path)
+        if body is None:
+            return None
+        return Response(body, headers={'Content-Type': content_type(path), 'Cache-Control': 'no-cache'})
+    result = static_assets.lookup(
+        path, request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match')
+    )
+    if result is None:
+        return None
+    status, headers, body = result
+    return Response(body, status=status, headers=headers)
+
 # Serve static files
 @app.route('/css/<path:filename>')
 def serve_css(filename):
     """Serve CSS files"""
-    from flask import send_from_directory
-    return send_from_directory('css', filename)
+    return asset_response(f'css/{filename}') or send_from_directory(os.path.join(STATIC_ROOT, 'css'), filename)
 
 @app.route('/js/<path:filename>')
 def serve_js(filename):
     """Serve JS files"""
-    from flask import send_from_directory
-    return send_from_directory('js', filename)
+    return asset_response(f'js/{filename}') or send_from_directory(os.path.join(STATIC_ROOT, 'js'), filename)
 
 # Serve the frontend
 @app.route('/')
 def serve_frontend():
     """Serve the main HTML page"""
-    with open('index.html', 'r', encoding='utf-8') as f:
-        return f.read()
+    return asset_response('') or send_from_directory(STATIC_ROOT, 'index.html')
 
 if __name__ == '__main__':
-    print("Starting MeHelper Flask server...")
-    print("Mock AI service initialized successfully!")
-    print("Server running on http://localhost:5000")
+    log.info("server_starting", mode="flask", url="http://localhost:5000")
     app.run(debug=False, host='0.0.0.0', port=5000, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""Async (ASGI) serving mode for MeHelper.
+
+Run with:
+    hypercorn asgi:asgi_app --bind 0.0.0.0:5000
+
+The Flask app in app.py holds a worker thread for the whole round trip to
+the HF router or Gemini. Here the triage and image routes await
+AsyncOpenAI and the async genai client instead, so a single process can
+keep hundreds of requests in flight while it waits on the network. PIL
+preprocessing still runs in an executor so it does not block the event
+loop. Services, caches and helpers are shared with app.py; the streaming,
+batch, multimodal and history endpoints are only served by the Flask app.
+"""
+import asyncio
+
+try:
+    from quart import Quart, Response, jsonify, request, send_from_directory
+except ImportError as e:
+    raise RuntimeError("Async serving mode requires quart: pip install quart hypercorn") from e
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import app as core
+from metrics import METRICS_ENABLED, render as render_metrics, stage, timed
+from static_assets import content_type
+
+asgi_app = Quart(__name__)
+asgi_app.config['MAX_CONTENT_LENGTH'] = core.app.config['MAX_CONTENT_LENGTH']
+
+
+@asgi_app.errorhandler(413)
+async def upload_too_large(e):
+    """Return the size limit as JSON instead of an HTML error page"""
+    return jsonify(core.upload_too_large_body()), 413
+
+
+# Analyze triage endpoint
+@asgi_app.route('/api/analyze', methods=['POST'])
+@timed('triage_request')
+async def analyze_triage():
+    """Analyze patient symptoms and provide triage recommendations"""
+    try:
+        with stage('request_parse'):
+            data = await request.get_json()
+
+            # Validate required fields
+            validation_error = core.validate_triage_payload(data)
+        if validation_error:
+            return jsonify({'error': validation_error}), 400
+
+        # The background loader may swap the service, so read it per request
+        service = core.ai_service
+        if service is None or not hasattr(service, 'analyze_symptoms'):
+            return jsonify({'error': 'AI service not available'}), 503
+
+        # Emergency fast path: answer before any model call
+        detected_keywords = core.detect_emergency_keywords(data['symptoms'])
+        if detected_keywords:
+            return jsonify(core.emergency_fast_path(data, detected_keywords))
+
+        if hasattr(service, 'analyze_symptoms_async'):
+            analysis = await service.analyze_symptoms_async(data)
+        else:
+            # Rule-based analysis is fast enough to run inline
+            analysis = service.analyze_symptoms(data)
+
+        return jsonify(core.format_triage_response(analysis, data))
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# Emergency refinement endpoint
+@asgi_app.route('/api/analyze/<request_id>', methods=['GET'])
+async def get_refinement(request_id):
+    """Return the detailed AI assessment that follows an emergency fast-path response"""
+    body, status = core.refinement_status(request_id)
+    return jsonify(body), status
+
+
+# Image analysis endpoint
+@asgi_app.route('/api/analyze_image', methods=['POST'])
+@timed('image_request')
+async def analyze_image():
+    """Analyze uploaded image for medical symptoms"""
+    try:
+        service = core.image_service
+        if service is None:
+            return jsonify({
+                'error': 'Image analysis service not available',
+                'fallback_message': core.IMAGE_FALLBACK_MESSAGE
+            }), 503
+
+        file, upload_error = core.validate_image_upload(await request.files)
+        if upload_error:
+            body, status = upload_error
+            return jsonify(body), status
+
+        # Decoding and resizing is CPU work; keep it off the event loop
+        loop = asyncio.get_running_loop()
+        processing_result = await loop.run_in_executor(None, service.process_image_file, file.read())
+        if not processing_result['success']:
+            return jsonify({
+                'error': 'Failed to process image',
+                'details': processing_result.get('error', 'Unknown error')
+            }), 400
+
+        form = await request.form
+        analysis_result = await service.analyze_image_async(
+            processing_result['image_data'],
+            form.get('prompt', core.DEFAULT_IMAGE_PROMPT)
+        )
+
+        return jsonify(core.format_image_response(processing_result, analysis_result))
+
+    except RequestEntityTooLarge:
+        return jsonify(core.upload_too_large_body()), 413
+    except Exception as e:
+        return jsonify({
+            'error': f'Unexpected error during image analysis: {str(e)}',
+            'fallback_message': core.IMAGE_FALLBACK_MESSAGE
+        }), 500
+
+
+# Prometheus metrics endpoint
+@asgi_app.route('/api/metrics', methods=['GET'])
+async def metrics():
+    """Per-stage latency histograms and backend, fallback and cache counters"""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled (METRICS_ENABLED=false)'}), 404
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+# Health check endpoint
+@asgi_app.route('/api/health', methods=['GET'])
+async def health_check():
+    """Check if the AI services are loaded and ready"""
+    try:
+        body, status = core.health_status()
+        body["serving_mode"] = "asgi"
+        return jsonify(body), status
+    except Exception as e:
+        return jsonify({"status": "error", "error": str(e)}), 500
+
+
+# Serve static files (precompressed in memory by app.py's asset table)
+def asset_response(path):
+    """Response for a precompressed asset, or None if it is not in the table"""
+    # Picks up an edited knowledge base before index.html names the ruleset's URL
+    core.knowledge_base.current()
+    if core.static_assets is None:
+        body = core.GENERATED_ASSETS.get(path)
+        if body is None:
+            return None
+        return Response(body, headers={'Content-Type': content_type(path), 'Cache-Control': 'no-cache'})
+    result = core.static_assets.lookup(
+        path, request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match')
+    )
+    if result is None:
+        return None
+    status, headers, body = result
+    return Response(body, status=status, headers=headers)
+
+
+@asgi_app.route('/css/<path:filename>')
+async def serve_css(filename):
+    """Serve CSS files"""
+    return asset_response(f'css/{filename}') or await send_from_directory('css', filename)
+
+
+@asgi_app.route('/js/<path:filename>')
+async def serve_js(filename):
+    """Serve JS files"""
+    return asset_response(f'js/{filename}') or await send_from_directory('js', filename)
+
+
+# Serve the frontend
+@asgi_app.route('/')
+async def serve_frontend():
+    """Serve the main HTML page"""
+    return asset_response('') or await send_from_directory('.', 'index.html')
+
+
+if __name__ == '__main__':
+    core.log.info("server_starting", mode="asgi", url="http://localhost:5000")
+    asgi_app.run(host='0.0.0.0', port=5000)
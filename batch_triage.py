@@ -0,0 +1,305 @@
+"""Bulk rule-based triage of screening survey CSVs.
+
+Usage:
+    python batch_triage.py survey.csv -o results.csv [--chunk-size 20000] [--rules triage_rules.json]
+    python batch_triage.py survey.csv -o results.parquet      # needs pyarrow
+
+Applies the same rules as MockAIService and the emergency fast path
+(the knowledge base in triage_rules.json) to every record of a CSV with
+the columns age, sex, symptoms, temperature and heart_rate (plus an
+optional id). The input is read and the results are written one chunk
+at a time, so memory stays flat however many records there are.
+
+Within a chunk nothing is evaluated record by record:
+- Every symptom text is tokenized into one array of ids, one per
+  distinct set of keyword words a word matches.
+- Each keyword becomes one table lookup over the whole chunk.
+- The age and vital-sign thresholds are NumPy masks.
+- The risk level comes from a single np.select.
+Python loops only remain over actual keyword hits, to keep
+emergency keywords and conditions in order of appearance.
+"""
+import argparse
+import csv
+import itertools
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from triage_rules import DEFAULT_PATH, RISK_LEVELS, TOKEN_PATTERN, TriageRules
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+DEFAULT_CHUNK_SIZE = 20000
+
+# Only symptoms is required; a missing age or vital-sign column counts as not recorded
+NUMBER_COLUMNS = ['age', 'temperature', 'heart_rate']
+OUTPUT_COLUMNS = ['id', 'risk_level', 'emergency_keywords', 'possible_conditions', 'next_action']
+
+# Risk levels as integer codes, lowest first
+LOW, MODERATE, HIGH, EMERGENCY = (RISK_LEVELS.index(level) for level in ('low', 'moderate', 'high', 'emergency'))
+
+# Categories whose hits are reported in order of appearance; the others only need "any hit"
+ORDERED_CATEGORIES = ('emergency', 'condition')
+
+# Joins the symptom texts of a chunk for tokenizing; not a token character itself
+RECORD_SEPARATOR = '\x1e'
+SEPARATOR_ID = -2
+NO_KEYWORD = -1
+
+# Joins lists inside one CSV cell
+LIST_SEPARATOR = '; '
+
+
+class _FormIds(dict):
+    """Text word -> id of the tuple of keyword words it matches, worked out on first sight"""
+
+    def __init__(self, forms):
+        super().__init__({RECORD_SEPARATOR: SEPARATOR_ID})
+        self.forms = forms
+        # Tuple of keyword words -> id; () is "no keyword word"
+        self.ids = {(): NO_KEYWORD}
+
+    def __missing__(self, word):
+        found = self.forms(word)
+        self[word] = self.ids.setdefault(found, len(self.ids) - 1)
+        return self[word]
+
+
+class ChunkTriage:
+    """The rules of one knowledge base revision, compiled for whole chunks of records"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.chunk_re = re.compile(f"{TOKEN_PATTERN}|{RECORD_SEPARATOR}")
+        # Text words are matched like KeywordMatcher does, including inflections of keyword words
+        self.form_ids = _FormIds(rules.matcher.forms)
+        # (category, keyword, keyword words) in the order the keyword matcher registers them
+        self.keywords = []
+        for category, keywords in rules.keywords.items():
+            for keyword in keywords:
+                words = tuple(rules.matcher._tokenize(keyword))
+                if words:
+                    self.keywords.append((category, keyword, words))
+        self.next_actions = np.array([rules.next_actions[level] for level in RISK_LEVELS], dtype=object)
+        self.default_conditions = LIST_SEPARATOR.join(rules.possible_conditions({}))
+        self._conditions = {}
+
+    def tokens(self, texts):
+        """(form id per token, record index per token) for a chunk; -1 matches no keyword word, -2 separates records"""
+        # One lowercase and one regex pass over the whole chunk, records separated by RECORD_SEPARATOR
+        text = RECORD_SEPARATOR.join(texts)
+        if text.count(RECORD_SEPARATOR) != len(texts) - 1:
+            text = RECORD_SEPARATOR.join(record.replace(RECORD_SEPARATOR, ' ') for record in texts)
+        words = self.chunk_re.findall(text.lower().replace('’', "'"))
+        ids = np.fromiter(map(self.form_ids.__getitem__, words), dtype=np.int64, count=len(words))
+        # Separators stay in the arrays: they never match a keyword word, so phrases cannot span records
+        return ids, np.cumsum(ids == SEPARATOR_ID)
+
+    def _word_masks(self, ids):
+        """Keyword word -> mask of the tokens that match it"""
+        # Lookup tables over form ids, offset by 2 so that the separator and "no keyword word" index too
+        forms = sorted(self.form_ids.ids.items(), key=lambda item: item[1])
+        offset = ids + 2
+        masks = {}
+        for _, _, words in self.keywords:
+            for word in words:
+                if word not in masks:
+                    table = np.zeros(len(forms) + 2, dtype=bool)
+                    table[[form_id + 2 for found, form_id in forms if word in found]] = True
+                    masks[word] = table[offset]
+        return masks
+
+    def match(self, texts):
+        """Per category, a mask of records with a hit, and the ordered hits for ORDERED_CATEGORIES"""
+        ids, records = self.tokens(texts)
+        masks = self._word_masks(ids)
+        present = {category: np.zeros(len(texts), dtype=bool) for category in self.rules.keywords}
+        ordered = {category: [] for category in ORDERED_CATEGORIES}
+        for category, keyword, words in self.keywords:
+            span = len(words)
+            if len(ids) < span:
+                continue
+            last = len(ids) - span + 1
+            hit = masks[words[0]][:last].copy()
+            for offset in range(1, span):
+                hit &= masks[words[offset]][offset:offset + last]
+            starts = np.flatnonzero(hit)
+            if len(starts) == 0:
+                continue
+            present[category][records[starts]] = True
+            if category in ordered:
+                ordered[category].append((starts, span, keyword))
+        return present, {category: self._in_order(hits, records, len(texts)) for category, hits in ordered.items()}
+
+    @staticmethod
+    def _in_order(hits, records, size):
+        """Per record, keywords by first appearance (shorter phrases first at the same word), as the matcher does"""
+        found = [None] * size
+        if not hits:
+            return found
+        starts = np.concatenate([positions for positions, _, _ in hits])
+        spans = np.concatenate([np.full(len(positions), span) for positions, span, _ in hits])
+        names = np.concatenate([np.full(len(positions), index) for index, (positions, _, _) in enumerate(hits)])
+        order = np.lexsort((spans, starts))
+        keywords = [keyword for _, _, keyword in hits]
+        for record, name in zip(records[starts[order]].tolist(), names[order].tolist()):
+            keyword = keywords[name]
+            if found[record] is None:
+                found[record] = [keyword]
+            elif keyword not in found[record]:
+                found[record].append(keyword)
+        return found
+
+    def conditions(self, keywords):
+        # Screening data repeats the same few symptom combinations, so each is worked out once
+        key = tuple(keywords)
+        if key not in self._conditions:
+            self._conditions[key] = LIST_SEPARATOR.join(self.rules.possible_conditions({'condition': keywords}))
+        return self._conditions[key]
+
+    def evaluate(self, ages, symptoms, temperatures, heart_rates):
+        """Risk level codes, emergency keywords and conditions for one chunk"""
+        rules = self.rules
+        present, ordered = self.match(symptoms)
+        ages = np.where(np.isnan(ages), rules.default_age, ages)
+        vitals_high = np.zeros(len(ages), dtype=bool)
+        for name, above, below in rules.risk_vitals:
+            values = {'temperature': temperatures, 'heart_rate': heart_rates}.get(name)
+            if values is not None:
+                # Missing or zero readings count as not taken, as in MockAIService
+                taken = ~np.isnan(values) & (values != 0)
+                vitals_high |= taken & ((values > above) | (values < below))
+
+        emergency = present['emergency'] | present['risk_emergency']
+        high = present['risk_high'] | vitals_high
+        moderate = (ages < rules.age_under) | (ages > rules.age_over) | present['duration']
+        risk = np.select([emergency, high, moderate], [EMERGENCY, HIGH, MODERATE], LOW)
+
+        emergency_keywords = [LIST_SEPARATOR.join(found) if found else '' for found in ordered['emergency']]
+        conditions = [self.conditions(found) if found else self.default_conditions for found in ordered['condition']]
+        return risk, emergency_keywords, conditions
+
+
+def to_numbers(values):
+    """Column of CSV strings to floats, NaN where empty or unreadable"""
+    try:
+        return np.array([value or 'nan' for value in values], dtype=float)
+    except ValueError:
+        numbers = np.full(len(values), np.nan)
+        for index, value in enumerate(values):
+            try:
+                numbers[index] = float(value)
+            except ValueError:
+                pass
+        return numbers
+
+
+def read_chunks(stream, chunk_size, id_column='id'):
+    """Yield (ids, ages, symptoms, temperatures, heart_rates) for chunk_size records at a time"""
+    reader = csv.reader(stream)
+    header = next(reader, [])
+    if 'symptoms' not in header:
+        raise ValueError("input has no symptoms column")
+    row_number = 0
+    while True:
+        batch = list(itertools.islice(reader, chunk_size))
+        if not batch:
+            return
+        # Blank lines are skipped and short rows padded, as csv.DictReader does
+        rows = [row if len(row) >= len(header) else row + [''] * (len(header) - len(row)) for row in batch if row]
+        if not rows:
+            continue
+        columns = dict(zip(header, zip(*rows)))
+        ids = columns.get(id_column) or range(row_number + 1, row_number + len(rows) + 1)
+        row_number += len(rows)
+        empty = ('',) * len(rows)
+        age, temperature, heart_rate = (to_numbers(columns.get(column, empty)) for column in NUMBER_COLUMNS)
+        yield list(ids), age, columns['symptoms'], temperature, heart_rate
+
+
+class CSVResults:
+    def __init__(self, stream):
+        self.writer = csv.writer(stream)
+        self.writer.writerow(OUTPUT_COLUMNS)
+
+    def write(self, columns):
+        self.writer.writerows(zip(*(columns[name] for name in OUTPUT_COLUMNS)))
+
+    def close(self):
+        pass
+
+
+class ParquetResults:
+    def __init__(self, path):
+        if pq is None:
+            raise RuntimeError("Parquet output requires pyarrow: pip install pyarrow")
+        self.schema = pa.schema([(name, pa.string()) for name in OUTPUT_COLUMNS])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, columns):
+        table = pa.table({name: [str(value) for value in columns[name]] if name == 'id' else columns[name]
+                          for name in OUTPUT_COLUMNS}, schema=self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+
+def triage_file(input_stream, results, rules, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Triage every record; returns the count per risk level"""
+    triage = ChunkTriage(rules)
+    counts = np.zeros(len(RISK_LEVELS), dtype=np.int64)
+    levels = np.array(RISK_LEVELS, dtype=object)
+    for ids, ages, symptoms, temperatures, heart_rates in read_chunks(input_stream, chunk_size):
+        risk, emergency_keywords, conditions = triage.evaluate(ages, symptoms, temperatures, heart_rates)
+        counts += np.bincount(risk, minlength=len(RISK_LEVELS))
+        results.write({'id': ids, 'risk_level': levels[risk].tolist(), 'emergency_keywords': emergency_keywords,
+                       'possible_conditions': conditions, 'next_action': triage.next_actions[risk].tolist()})
+    return dict(zip(RISK_LEVELS, counts.tolist()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('input', help="CSV file, or - for stdin")
+    parser.add_argument('-o', '--output', default='-', help="CSV or .parquet file, or - for stdout (CSV)")
+    parser.add_argument('--format', choices=['csv', 'parquet'], help="default: from the output file extension")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--rules', default=os.getenv('TRIAGE_RULES_PATH', DEFAULT_PATH))
+    args = parser.parse_args()
+
+    output_format = args.format or ('parquet' if args.output.endswith('.parquet') else 'csv')
+    rules = TriageRules.load(args.rules)
+    input_stream = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    if output_format == 'parquet':
+        results = ParquetResults(args.output)
+        output_stream = None
+    else:
+        output_stream = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+        results = CSVResults(output_stream)
+
+    started = time.perf_counter()
+    try:
+        counts = triage_file(input_stream, results, rules, args.chunk_size)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        results.close()
+        for stream in (input_stream, output_stream):
+            if stream not in (None, sys.stdin, sys.stdout):
+                stream.close()
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(f"{total} records in {elapsed:.2f}s ({total / elapsed if elapsed else 0:,.0f} records/s), rules revision "
+          f"{rules.revision}: " + ', '.join(f"{level} {count}" for level, count in counts.items()), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
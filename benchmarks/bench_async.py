@@ -0,0 +1,146 @@
+"""Load test: synchronous Flask workers vs. the async ASGI serving mode.
+
+Usage:
+    python benchmarks/bench_async.py [--concurrency 200] [--requests 1000] [--latency-ms 800]
+
+Starts the OpenAI-compatible stub from benchmarks/stubs.py, then for each
+serving mode launches MeHelper against it and drives /api/analyze with a
+fixed number of requests in flight. The WSGI mode runs under gunicorn with
+a bounded thread pool (as in production); the ASGI mode runs asgi.py under
+hypercorn with a single worker. Needs gunicorn and hypercorn installed.
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import StubProfile, start_openai_stub  # noqa: E402
+
+PAYLOADS = [
+    {"age": 30, "sex": "male", "symptoms": "fever, cough", "duration": "1-2days"},
+    {"age": 8, "sex": "female", "symptoms": "headache, nausea", "duration": "hours"},
+    {"age": 45, "sex": "female", "symptoms": "diarrhea, pain", "duration": "3-7days"},
+    {"age": 70, "sex": "male", "symptoms": "cough, sore-throat", "duration": "1-2weeks"},
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_healthy(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/health')
+            body = json.loads(conn.getresponse().read())
+            if body.get('status') == 'healthy':
+                return
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not become healthy")
+
+
+def drive(port, concurrency, total, path='/api/analyze', payloads=PAYLOADS):
+    """Send `total` POSTs with `concurrency` in flight; return latency stats"""
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        nonlocal errors
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                conn.close()
+                return
+            body = json.dumps(payloads[index % len(payloads)])
+            start = time.perf_counter()
+            try:
+                conn.request('POST', path, body, {'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except OSError:
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors += 0 if ok else 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000  # noqa: E731
+    return {
+        "rps": total / wall,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "errors": errors,
+    }
+
+
+def server_command(mode, port, wsgi_threads):
+    if mode == 'wsgi':
+        return ['gunicorn', '-w', '1', '--threads', str(wsgi_threads), '-b', f'127.0.0.1:{port}', 'app:app']
+    return ['hypercorn', '-w', '1', '-b', f'127.0.0.1:{port}', 'asgi:asgi_app']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--latency-ms', type=float, default=800)
+    parser.add_argument('--wsgi-threads', type=int, default=16)
+    parser.add_argument('--modes', default='wsgi,asgi')
+    args = parser.parse_args()
+
+    _, base_url = start_openai_stub(StubProfile(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 10))
+    env = dict(os.environ, HF_TOKEN='stub', HF_ROUTER_BASE_URL=base_url, BACKGROUND_MODEL_LOAD='false',
+               MODEL_WARMUP='false', TRIAGE_CACHE_BACKEND='off')
+
+    print(f"upstream latency {args.latency_ms:.0f} ms, {args.concurrency} in flight, {args.requests} requests")
+    for mode in args.modes.split(','):
+        command = server_command(mode, free_port(), args.wsgi_threads)
+        if shutil.which(command[0]) is None:
+            print(f"{mode:>5}: skipped ({command[0]} not installed)")
+            continue
+        port = int(command[command.index('-b') + 1].rsplit(':', 1)[1])
+        server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_healthy(port)
+            result = drive(port, args.concurrency, args.requests)
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{mode:>5}: {result['rps']:.1f} req/s  p50 {result['p50_ms']:.0f} ms  "
+              f"p95 {result['p95_ms']:.0f} ms  p99 {result['p99_ms']:.0f} ms  errors {result['errors']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Records per second for bulk triage: chunked NumPy evaluation vs. the per-record rule path.
+
+Usage:
+    python benchmarks/bench_batch_triage.py [--records 200000] [--chunk-size 20000] [--parquet]
+
+Generates a synthetic screening CSV (ages, sexes, temperatures, heart
+rates and symptom texts built from the same phrases as bench_rules.py),
+then triages it twice:
+- "per record" reads it with csv.DictReader and runs the rule path one
+  record at a time: emergency keywords, then TriageRules.risk_level and
+  possible_conditions, as /api/analyze does with the mock service;
+- "batch_triage" runs batch_triage.py on the file.
+
+Both write the same CSV columns and the outputs are compared row by
+row. Each run happens in its own process so that peak RSS is its own;
+"batch_triage x4" repeats the batch run on a file four times as large to
+show that memory does not grow with the input.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_rules import WORDS  # noqa: E402
+
+FILLER = ['since yesterday', 'mostly at night', 'after eating', 'on and off', 'getting worse', 'no other problems']
+
+
+def write_survey(path, records, seed=7):
+    rng = random.Random(seed)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'age', 'sex', 'symptoms', 'temperature', 'heart_rate'])
+        for index in range(records):
+            symptoms = ', '.join(rng.sample(WORDS, rng.randint(1, 4)) + rng.sample(FILLER, rng.randint(0, 2)))
+            writer.writerow([f"r{index}", rng.choice(['', 1, 4, 12, 30, 45, 70, 85]), rng.choice(['male', 'female']),
+                             f"I have {symptoms}", rng.choice(['', 36.8, 37.9, 39.4, 34.8, 0]),
+                             rng.choice(['', 55, 78, 110, 130])])
+
+
+def per_record(input_path, output_path, rules_path):
+    """The existing rule path, one record at a time"""
+    from batch_triage import LIST_SEPARATOR, OUTPUT_COLUMNS, to_numbers
+    from triage_rules import TriageRules
+    rules = TriageRules.load(rules_path)
+    with open(input_path, newline='', encoding='utf-8') as source, \
+            open(output_path, 'w', newline='', encoding='utf-8') as target:
+        writer = csv.writer(target)
+        writer.writerow(OUTPUT_COLUMNS)
+        for row in csv.DictReader(source):
+            age, temperature, heart_rate = to_numbers([row['age'], row['temperature'], row['heart_rate']]).tolist()
+            vitals = {name: value for name, value in (('temperature', temperature), ('heart_rate', heart_rate))
+                      if value == value}
+            matches = rules.match(row['symptoms'])
+            emergency = matches.get('emergency', [])
+            level = 'emergency' if emergency else rules.risk_level(
+                matches, vitals, rules.default_age if age != age else age)
+            writer.writerow([row['id'], level, LIST_SEPARATOR.join(emergency),
+                             LIST_SEPARATOR.join(rules.possible_conditions(matches)), rules.next_actions[level]])
+
+
+def measure(mode, input_path, output_path, chunk_size):
+    """Runs in a subprocess; prints one JSON line"""
+    rules_path = os.path.join(ROOT, 'triage_rules.json')
+    started = time.perf_counter()
+    if mode == 'per_record':
+        per_record(input_path, output_path, rules_path)
+    else:
+        from batch_triage import CSVResults, ParquetResults, triage_file
+        from triage_rules import TriageRules
+        rules = TriageRules.load(rules_path)
+        with open(input_path, newline='', encoding='utf-8') as source:
+            if output_path.endswith('.parquet'):
+                results = ParquetResults(output_path)
+                triage_file(source, results, rules, chunk_size)
+                results.close()
+            else:
+                with open(output_path, 'w', newline='', encoding='utf-8') as target:
+                    triage_file(source, CSVResults(target), rules, chunk_size)
+    elapsed = time.perf_counter() - started
+    print(json.dumps({'seconds': elapsed, 'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+
+def run_measure(mode, input_path, output_path, chunk_size):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--measure', mode, input_path, output_path,
+         '--chunk-size', str(chunk_size)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=200000)
+    parser.add_argument('--chunk-size', type=int, default=20000)
+    parser.add_argument('--parquet', action='store_true', help='also time Parquet output (needs pyarrow)')
+    parser.add_argument('--measure', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure, args.chunk_size)
+        return
+
+    directory = tempfile.mkdtemp(prefix='mehelper-batch-')
+    survey, large = os.path.join(directory, 'survey.csv'), os.path.join(directory, 'survey_x4.csv')
+    write_survey(survey, args.records)
+    write_survey(large, args.records * 4)
+
+    rows = [("per record", args.records, run_measure('per_record', survey, os.path.join(directory, 'slow.csv'),
+                                                     args.chunk_size))]
+    rows.append(("batch_triage", args.records,
+                 run_measure('batch', survey, os.path.join(directory, 'fast.csv'), args.chunk_size)))
+    if args.parquet:
+        rows.append(("batch_triage parquet", args.records,
+                     run_measure('batch', survey, os.path.join(directory, 'fast.parquet'), args.chunk_size)))
+    rows.append(("batch_triage x4", args.records * 4,
+                 run_measure('batch', large, os.path.join(directory, 'large.csv'), args.chunk_size)))
+
+    with open(os.path.join(directory, 'slow.csv'), encoding='utf-8') as slow, \
+            open(os.path.join(directory, 'fast.csv'), encoding='utf-8') as fast:
+        mismatches = sum(a != b for a, b in zip(slow, fast))
+
+    print(f"{args.records} records, chunks of {args.chunk_size}")
+    print(f"{'mode':<22} {'records':>9} {'seconds':>8} {'records/s':>11} {'peak RSS MB':>12}")
+    baseline = rows[0][1] / rows[0][2]['seconds']
+    for name, records, result in rows:
+        per_sec = records / result['seconds']
+        note = f"  ({per_sec / baseline:.1f}x)" if name != "per record" else ''
+        print(f"{name:<22} {records:>9} {result['seconds']:>8.2f} {per_sec:>11,.0f} "
+              f"{result['peak_rss_mb']:>12.1f}{note}")
+    print(f"\noutput rows differing from the per-record path: {mismatches}")
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Benchmark the quantized CPU backend: speed, memory and agreement with the reference model.
+
+Usage:
+    # once, with router access: record GPT-OSS-20B's answers for the case set
+    HF_TOKEN=... python benchmarks/bench_cpu_backend.py --record-reference
+
+    # on the clinic box: run a GGUF model against the stored reference
+    python benchmarks/bench_cpu_backend.py --model models/triage-q4_k_m.gguf --threads 4
+
+Runs a fixed case set through GPTOSS20BService with LOCAL_BACKEND=llama_cpp
+and reports tokens/sec, mean latency, peak RSS, fallback count, and
+agreement with the reference answers. Agreement is measured on the
+level_2 severity (exact match) and on level_3 conditions (mean Jaccard
+overlap). Run --model several times with different quantizations or
+distilled models to compare them.
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+REFERENCE_PATH = os.path.join(ROOT, 'benchmarks', 'results', 'reference_triage.json')
+
+CASES = [
+    {"age": 30, "sex": "male", "symptoms": "fever, cough", "duration": "1-2days"},
+    {"age": 4, "sex": "female", "symptoms": "diarrhea, vomiting", "duration": "hours",
+     "vitals": {"temperature": 38.6, "heart_rate": 130}},
+    {"age": 52, "sex": "female", "symptoms": "headache, dizziness, fatigue", "duration": "3-7days"},
+    {"age": 67, "sex": "male", "symptoms": "shortness of breath when walking, swollen ankles", "duration": "1-2weeks"},
+    {"age": 25, "sex": "female", "symptoms": "itchy rash on both arms", "duration": "3-7days"},
+    {"age": 8, "sex": "male", "symptoms": "sore throat, fever", "duration": "1-2days",
+     "vitals": {"temperature": 39.4}},
+    {"age": 45, "sex": "male", "symptoms": "deep cut on hand from a machete, bleeding stopped", "duration": "hours"},
+    {"age": 34, "sex": "female", "symptoms": "burning when urinating, lower belly pain", "duration": "1-2days"},
+    {"age": 72, "sex": "female", "symptoms": "confusion, fever", "duration": "hours",
+     "vitals": {"temperature": 38.9, "heart_rate": 112}},
+    {"age": 19, "sex": "male", "symptoms": "twisted ankle, swelling, can walk with pain", "duration": "hours"},
+]
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_service(environment):
+    os.environ.update(environment)
+    # Only the backend is measured: no history database, asset precompression or cached answers
+    os.environ.update({'BACKGROUND_MODEL_LOAD': 'false', 'MODEL_WARMUP': 'false', 'TRIAGE_CACHE_BACKEND': 'off',
+                       'HISTORY_BACKEND': 'off', 'STATIC_PRECOMPRESS': 'false'})
+    os.chdir(ROOT)
+    import app
+    if type(app.ai_service).__name__ != 'GPTOSS20BService':
+        raise SystemExit(f"Backend failed to load: {app.backend_loader.error}")
+    return app.ai_service
+
+
+def conditions(analysis):
+    return {str(item).strip().lower() for item in analysis.get('level_3_possibilities', [])}
+
+
+def record_reference():
+    service = load_service({'USE_INFERENCE_PROVIDERS': 'true'})
+    answers = [service.analyze_symptoms(dict(case, cache=False)) for case in CASES]
+    os.makedirs(os.path.dirname(REFERENCE_PATH), exist_ok=True)
+    with open(REFERENCE_PATH, 'w') as f:
+        json.dump({"model": service.model_name, "cases": CASES, "answers": answers}, f, indent=2)
+    print(f"Recorded {len(answers)} reference answers from {service.model_name} to {REFERENCE_PATH}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', help='GGUF model file for the CPU backend')
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--reference', default=REFERENCE_PATH)
+    parser.add_argument('--record-reference', action='store_true')
+    args = parser.parse_args()
+
+    if args.record_reference:
+        record_reference()
+        return
+    if not args.model:
+        parser.error('--model is required unless --record-reference is given')
+
+    reference = None
+    if os.path.exists(args.reference):
+        with open(args.reference) as f:
+            reference = json.load(f)
+
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    service = load_service({
+        'USE_INFERENCE_PROVIDERS': 'false', 'LOCAL_BACKEND': 'llama_cpp',
+        'LOCAL_MODEL_PATH': args.model, 'LOCAL_THREADS': str(args.threads)
+    })
+    load_seconds = time.perf_counter() - started
+
+    tokens, seconds, fallbacks, severity_matches, overlaps = 0, 0.0, 0, 0, []
+    for index, case in enumerate(CASES):
+        started = time.perf_counter()
+        analysis = service.analyze_symptoms(dict(case, cache=False))
+        seconds += time.perf_counter() - started
+        generation = analysis.get('generation') or {}
+        tokens += generation.get('tokens_generated') or 0
+        fallbacks += bool(generation.get('fallback'))
+        if reference:
+            expected = reference['answers'][index]
+            severity_matches += (analysis['level_2_assessment']['severity']
+                                 == expected['level_2_assessment']['severity'])
+            union = conditions(analysis) | conditions(expected)
+            overlaps.append(len(conditions(analysis) & conditions(expected)) / len(union) if union else 1.0)
+
+    print(f"model: {os.path.basename(args.model)}, {args.threads} threads, {len(CASES)} cases")
+    print(f"load: {load_seconds:.1f} s, peak RSS: {peak_rss_mb():.0f} MB (interpreter baseline {rss_before:.0f} MB)")
+    print(f"generation: {tokens / seconds:.1f} tokens/s, {seconds / len(CASES):.1f} s per case, "
+          f"{fallbacks} fallbacks")
+    if reference:
+        print(f"agreement with {reference['model']}: severity {severity_matches}/{len(CASES)}, "
+              f"conditions Jaccard {sum(overlaps) / len(overlaps):.2f}")
+    else:
+        print(f"no reference answers at {args.reference}; run with --record-reference to create them")
+
+
+if __name__ == '__main__':
+    main()
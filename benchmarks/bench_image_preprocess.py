@@ -0,0 +1,123 @@
+"""Benchmark: image preprocessing latency and peak memory on large phone photos.
+
+Usage:
+    python benchmarks/bench_image_preprocess.py [--corpus DIR] [--megapixels 48] [--count 3]
+
+Uses the JPEGs in --corpus, or generates a synthetic corpus of large
+camera-like JPEGs. Each run happens in a fresh subprocess so peak RSS is
+measured for that path alone: "baseline" is the previous full-resolution
+decode -> RGB convert -> LANCZOS thumbnail, "draft" is
+image_preprocessing.preprocess_image.
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def baseline_preprocess(image_bytes):
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if image.width > 1024 or image.height > 1024:
+        image.thumbnail((1024, 1024), Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=85)
+    return output.getvalue()
+
+
+def draft_preprocess(image_bytes):
+    from image_preprocessing import preprocess_image
+
+    return preprocess_image(image_bytes)["image_data"]
+
+
+def make_corpus(directory, megapixels, count):
+    from PIL import Image, ImageFilter
+
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    paths = []
+    for index in range(count):
+        rng = random.Random(index)
+        # Low-resolution noise scaled up gives camera-like detail that JPEG cannot trivially compress
+        seed = Image.effect_noise((width // 16, height // 16), 64).convert('RGB')
+        tint = Image.new('RGB', seed.size, (rng.randint(120, 220), rng.randint(80, 160), rng.randint(60, 140)))
+        image = Image.blend(seed, tint, 0.5).resize((width, height), Image.Resampling.BILINEAR)
+        image = image.filter(ImageFilter.DETAIL)
+        path = os.path.join(directory, f'phone_{index}.jpg')
+        image.save(path, format='JPEG', quality=92)
+        paths.append(path)
+    return paths
+
+
+def measure(mode, path):
+    """Run one preprocessing pass in this process and print JSON stats"""
+    with open(path, 'rb') as f:
+        image_bytes = f.read()
+    func = baseline_preprocess if mode == 'baseline' else draft_preprocess
+    start = time.perf_counter()
+    func(image_bytes)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"latency_ms": elapsed * 1000, "peak_rss_mb": peak_rss_kb() / 1024}))
+
+
+def peak_rss_kb():
+    # ru_maxrss survives fork+exec on Linux, so prefer this address space's own high-water mark
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus')
+    parser.add_argument('--megapixels', type=float, default=48)
+    parser.add_argument('--count', type=int, default=3)
+    parser.add_argument('--measure', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.corpus:
+            paths = sorted(glob.glob(os.path.join(args.corpus, '*.jp*g')))
+        else:
+            print(f"generating {args.count} synthetic {args.megapixels:g} MP JPEGs...")
+            paths = make_corpus(tmp, args.megapixels, args.count)
+
+        print(f"{'mode':>9} {'mean ms':>9} {'max ms':>9} {'peak RSS MB':>12}")
+        for mode in ('baseline', 'draft'):
+            runs = []
+            for path in paths:
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--measure', mode, path],
+                    check=True, capture_output=True, text=True
+                ).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            latencies = [run["latency_ms"] for run in runs]
+            peak = max(run["peak_rss_mb"] for run in runs)
+            print(f"{mode:>9} {sum(latencies) / len(latencies):>9.0f} {max(latencies):>9.0f} {peak:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Fallback rate: greedy regex extraction vs. the triage-object decoder.
+
+Usage:
+    python benchmarks/bench_json_extraction.py
+
+Builds model outputs in the shapes GPT-OSS-20B produces: clean JSON,
+reasoning text with braces before it, chatter or a second object after it,
+markdown fences, and truncated output. Each output is parsed with the old
+re.search(r'\\{.*\\}', ..., re.DOTALL) + json.loads and with
+GPTOSS20BService._locate_json. A failure means the request fell back to
+the generic "Unable to provide detailed analysis" response. It also
+reports how much trailing text was generated after the object closed;
+the local stopping criterion and closing the router stream skip those
+tokens.
+"""
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stubs import TRIAGE_ANALYSIS  # noqa: E402
+
+OBJECT = json.dumps(TRIAGE_ANALYSIS, indent=2)
+SHAPES = {
+    "clean": OBJECT,
+    "reasoning braces": "analysis: the {fever, cough} pattern suggests a viral cause.\nassistantfinal" + OBJECT,
+    "trailing chatter": OBJECT + "\n\nI hope this helps. Stay safe and seek care if symptoms worsen.",
+    "second object": OBJECT + '\nExample follow-up: {"day": 2, "check": "temperature"}',
+    "markdown fence": "```json\n" + OBJECT + "\n```\nLet me know if you need anything else.",
+    "truncated": OBJECT[:len(OBJECT) // 2],
+}
+
+
+def legacy_extract(text):
+    match = re.search(r'\{.*\}', text, re.DOTALL)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group())
+    except ValueError:
+        return None
+
+
+def main():
+    os.environ.setdefault('BACKGROUND_MODEL_LOAD', 'false')
+    os.environ.setdefault('HF_TOKEN', '')
+    os.chdir(ROOT)
+    from app import GPTOSS20BService
+
+    service = GPTOSS20BService.__new__(GPTOSS20BService)
+    print(f"{'output shape':<18} {'legacy':>8} {'decoder':>8} {'trailing chars':>15}")
+    legacy_failures = decoder_failures = 0
+    for name, text in SHAPES.items():
+        legacy_ok = legacy_extract(text) is not None
+        parsed, end = service._locate_json(text)
+        legacy_failures += not legacy_ok
+        decoder_failures += parsed is None
+        print(f"{name:<18} {'ok' if legacy_ok else 'FALLBACK':>8} {'ok' if parsed else 'FALLBACK':>8} "
+              f"{len(text[end:].strip()) if parsed else 0:>15}")
+    print(f"fallback rate: legacy {legacy_failures / len(SHAPES):.0%}, decoder {decoder_failures / len(SHAPES):.0%}")
+
+    text = SHAPES["trailing chatter"]
+    runs = 20000
+    start = time.perf_counter()
+    for _ in range(runs):
+        service._locate_json(text)
+    print(f"decoder: {(time.perf_counter() - start) / runs * 1e6:.1f} us per response")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Per-request logging cost: the old print() calls vs. the queued structured logger.
+
+Usage:
+    python benchmarks/bench_logging.py [--threads 16] [--requests 500] [--target /tmp/mehelper.log]
+
+Replays the logging analyze_triage does for one request with a multi-KB
+image analysis attached, from many threads at once, with stdout pointed
+at a line-buffered file (one write per line, as with PYTHONUNBUFFERED in
+a container). "print" is the six print() calls the handler used to make,
+including the full image_analysis dump; "structured" is the current
+triage_complete event, and "structured+debug" adds the redacted
+triage_image_context event that LOG_LEVEL=DEBUG enables. Latency is what
+the request thread spends on logging; drain is how long the writer thread
+took to flush what was left after the last request finished.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import structured_logging  # noqa: E402
+
+DATA = {
+    "age": 34, "sex": "female", "symptoms": "itchy rash on both arms, mild fever", "duration": "3-7days",
+    "image_analysis": ("Raised erythematous plaques with well-defined borders on the volar forearms, "
+                       "fine scaling at the margins, no pustules or open wounds visible. ") * 30
+}
+RESPONSE_KEYS = ['risk_level', 'risk_assessment', 'possible_conditions', 'first_aid_measures',
+                 'immediate_actions', 'danger_signs', 'vitals_analysis', 'timeline_recommendations',
+                 'image_analysis_included']
+
+
+def print_path(data):
+    print(f"Including image analysis in symptom evaluation: {data['image_analysis'][:100]}...")
+    print(f"Full image analysis data received: {data['image_analysis']}")
+    print("Using AI service: GPTOSS20BService")
+    print(f"AI service returned analysis with keys: {RESPONSE_KEYS[:7]}")
+    print(f"Added image analysis to response: {data['image_analysis'][:100]}...")
+    print(f"Final response keys: {RESPONSE_KEYS}")
+
+
+def structured_path(log):
+    def emit(data):
+        if data.get('image_analysis'):
+            log.debug("triage_image_context", image_analysis=data['image_analysis'])
+        log.info("triage_complete", backend="GPTOSS20BService", risk_level="moderate",
+                 image_analysis_included=True, request_fields=sorted(data.keys()))
+    return emit
+
+
+def run(emit, threads, requests):
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker():
+        local = []
+        barrier.wait()
+        for _ in range(requests):
+            started = time.perf_counter()
+            emit(DATA)
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return latencies, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def report(name, latencies, elapsed, drain=0.0):
+    us = [value * 1e6 for value in latencies]
+    print(f"{name:<17} {statistics.median(us):>8.1f} {percentile(us, 0.95):>8.1f} "
+          f"{percentile(us, 0.99):>9.1f} {len(us) / elapsed:>10.0f} {drain * 1000:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500, help='requests per thread')
+    parser.add_argument('--target', default=os.path.join(tempfile.gettempdir(), 'mehelper-bench.log'))
+    args = parser.parse_args()
+
+    stream = open(args.target, 'w', buffering=1)
+    print(f"{args.threads} threads x {args.requests} requests, logging to {args.target}")
+    print(f"{'path':<17} {'p50 us':>8} {'p95 us':>8} {'p99 us':>9} {'req/s':>10} {'drain ms':>9}")
+
+    stdout = sys.stdout
+    sys.stdout = stream
+    try:
+        latencies, elapsed = run(print_path, args.threads, args.requests)
+    finally:
+        sys.stdout = stdout
+    report("print", latencies, elapsed)
+
+    for name, level in (("structured", "INFO"), ("structured+debug", "DEBUG")):
+        structured_logging.configure(stream=stream, fmt='json', level=level)
+        log = structured_logging.get_logger('bench')
+        latencies, elapsed = run(structured_path(log), args.threads, args.requests)
+        started = time.perf_counter()
+        structured_logging.shutdown()
+        report(name, latencies, elapsed, time.perf_counter() - started)
+
+    stream.close()
+    print(f"log file: {os.path.getsize(args.target) / 1024:.0f} KB written "
+          f"(print path writes the image analysis in full; structured paths redact it)")
+
+
+if __name__ == '__main__':
+    main()
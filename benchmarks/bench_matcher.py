@@ -0,0 +1,56 @@
+"""Micro-benchmark: compiled KeywordMatcher vs. per-keyword substring scans.
+
+Usage:
+    python benchmarks/bench_matcher.py
+
+Grows the keyword list from the built-in size into the thousands and reports the
+per-request cost of both approaches on a typical symptom description.
+"""
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from triage_rules import DEFAULT_PATH, KeywordMatcher, TriageRules  # noqa: E402
+
+EMERGENCY_KEYWORDS = TriageRules.load(DEFAULT_PATH).keywords['emergency']
+
+SAMPLE_TEXT = (
+    "I have had a fever and headache for 2 days, some cough at night and mild "
+    "stomach pain after eating. No chest pain. fever, cough, headache"
+)
+
+
+def synthetic_keywords(count, seed=7):
+    rng = random.Random(seed)
+    words = []
+    for _ in range(count):
+        size = rng.randint(1, 3)
+        words.append(' '.join(
+            ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+            for _ in range(size)
+        ))
+    return words
+
+
+def linear_scan(keywords, text):
+    text = text.lower()
+    return [keyword for keyword in keywords if keyword in text]
+
+
+def main():
+    repeats = 2000
+    print(f"{'keywords':>10} {'linear us/req':>15} {'matcher us/req':>15}")
+    for extra in (0, 100, 1000, 5000, 20000):
+        keywords = EMERGENCY_KEYWORDS + synthetic_keywords(extra)
+        matcher = KeywordMatcher({'emergency': keywords})
+        linear = timeit.timeit(lambda: linear_scan(keywords, SAMPLE_TEXT), number=repeats)
+        compiled = timeit.timeit(lambda: matcher.match(SAMPLE_TEXT), number=repeats)
+        print(f"{len(keywords):>10} {linear / repeats * 1e6:>15.1f} {compiled / repeats * 1e6:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
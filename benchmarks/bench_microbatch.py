@@ -0,0 +1,102 @@
+"""Benchmark: MicroBatcher vs. one pipeline call per request on a small CPU model.
+
+Usage:
+    python benchmarks/bench_microbatch.py [--model distilgpt2] [--clients 16] [--requests 64]
+    python benchmarks/bench_microbatch.py --model stub [--step-ms 4] [--row-ms 0.5]
+
+A small causal LM (needs transformers and torch) stands in for
+GPT-OSS-20B; --model stub uses StubPipeline from benchmarks/stubs.py,
+whose per-call cost is step_ms per decode step plus row_ms per batch row.
+Both paths receive the same prompts from the same number of concurrent
+client threads, and throughput plus p50/p95 latency are reported.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from microbatch import MicroBatcher  # noqa: E402
+from stubs import StubPipeline  # noqa: E402
+
+PROMPTS = [
+    "Patient reports fever and cough for two days. Triage:",
+    "Patient reports headache and nausea since this morning. Triage:",
+    "Patient reports diarrhea and stomach pain for a week. Triage:",
+    "Patient reports rash and mild fever. Triage:",
+]
+
+
+def run(generate, clients, total, max_new_tokens):
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            start = time.perf_counter()
+            generate(PROMPTS[index % len(PROMPTS)], max_new_tokens=max_new_tokens, do_sample=False,
+                     return_full_text=False)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default='distilgpt2')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=64)
+    parser.add_argument('--max-new-tokens', type=int, default=32)
+    parser.add_argument('--window-ms', type=float, default=20)
+    parser.add_argument('--max-batch', type=int, default=8)
+    parser.add_argument('--step-ms', type=float, default=4.0, help="stub cost per decode step")
+    parser.add_argument('--row-ms', type=float, default=0.5, help="stub cost per decode step and batch row")
+    args = parser.parse_args()
+
+    if args.model == 'stub':
+        pipe = StubPipeline(step_ms=args.step_ms, row_ms=args.row_ms)
+    else:
+        from transformers import pipeline
+        pipe = pipeline("text-generation", model=args.model, device=-1)
+    pipe_lock = threading.Lock()
+
+    def per_request(prompt, **kwargs):
+        # The current path: one call per request, serialized on the shared model
+        with pipe_lock:
+            return pipe(prompt, **kwargs)
+
+    batcher = MicroBatcher(pipe, window_ms=args.window_ms, max_batch=args.max_batch)
+
+    print(f"model={args.model} clients={args.clients} requests={args.requests}")
+    for name, generate in (("per-request", per_request), ("micro-batched", batcher.submit)):
+        result = run(generate, args.clients, args.requests, args.max_new_tokens)
+        print(f"{name:>14}: {result['rps']:.2f} req/s  p50 {result['p50_ms']:.0f} ms  p95 {result['p95_ms']:.0f} ms")
+    print(f"batcher stats: {batcher.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Benchmark: combined /api/analyze_multimodal vs. the two-call image-then-text flow.
+
+Usage:
+    python benchmarks/bench_multimodal.py [--runs 20] [--llm-ms 1500] [--vision-ms 1200] [--rtt-ms 300]
+
+Serves MeHelper in-process against the OpenAI-compatible stub from
+benchmarks/stubs.py, with the Gemini service replaced by a stand-in that
+sleeps for --vision-ms. The two-call flow mirrors what js/app.js used to
+do: POST /api/analyze_image, then POST /api/analyze with the findings.
+--rtt-ms adds a simulated network round trip per HTTP request, as on a
+slow rural link. Reports median and p95 wall-clock time per flow.
+"""
+import argparse
+import http.client
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stubs import StubProfile, start_openai_stub  # noqa: E402
+
+PAYLOAD = {"age": 34, "sex": "female", "symptoms": "itchy rash on forearm, fever", "duration": "1-2days",
+           "vitals": {"temperature": 38.1, "heart_rate": 88}}
+
+
+class StubVisionService:
+    """Stands in for GeminiVisionService with a fixed analysis latency"""
+
+    def __init__(self, latency_ms):
+        self.latency = latency_ms / 1000.0
+
+    def process_image_file(self, image_bytes):
+        return {"success": True, "image_data": image_bytes, "format": "JPEG", "size": "640x480"}
+
+    def analyze_image(self, image_data, prompt=None):
+        time.sleep(self.latency)
+        return {"success": True, "analysis": "Raised red patches on the forearm.", "model": "stub"}
+
+
+def sample_jpeg():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (180, 90, 80)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def multipart(fields, image):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="photo.jpg"\r\n'
+        f'Content-Type: image/jpeg\r\n\r\n'.encode() + image + b'\r\n'
+    )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def post(port, path, body, content_type, rtt):
+    time.sleep(rtt)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    conn.request('POST', path, body=body, headers={'Content-Type': content_type})
+    response = conn.getresponse()
+    result = json.loads(response.read())
+    if response.status != 200:
+        raise RuntimeError(f"{path} returned {response.status}: {result}")
+    return result
+
+
+def two_call_flow(port, image, rtt):
+    body, content_type = multipart({'prompt': 'Describe the findings'}, image)
+    image_result = post(port, '/api/analyze_image', body, content_type, rtt)
+    payload = dict(PAYLOAD, image_analysis=image_result['analysis'])
+    return post(port, '/api/analyze', json.dumps(payload).encode(), 'application/json', rtt)
+
+
+def combined_flow(port, image, rtt):
+    fields = {key: value for key, value in PAYLOAD.items() if key != 'vitals'}
+    fields.update(vitals=json.dumps(PAYLOAD['vitals']), prompt='Describe the findings', refine='false')
+    body, content_type = multipart(fields, image)
+    return post(port, '/api/analyze_multimodal', body, content_type, rtt)
+
+
+def measure(flow, port, image, runs, rtt):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        flow(port, image, rtt)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[max(0, int(len(timings) * 0.95) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--llm-ms', type=float, default=1500)
+    parser.add_argument('--vision-ms', type=float, default=1200)
+    parser.add_argument('--rtt-ms', type=float, default=300)
+    args = parser.parse_args()
+
+    _, base_url = start_openai_stub(StubProfile(latency_ms=args.llm_ms))
+    os.environ.update({
+        'HF_TOKEN': 'stub', 'HF_ROUTER_BASE_URL': base_url, 'USE_INFERENCE_PROVIDERS': 'true',
+        'BACKGROUND_MODEL_LOAD': 'false', 'MODEL_WARMUP': 'false',
+        'TRIAGE_CACHE_BACKEND': 'off', 'IMAGE_CACHE_BACKEND': 'off', 'IMAGE_PREPROCESS_WORKERS': '0'
+    })
+    os.environ.pop('GEMINI_API_KEY', None)
+    os.chdir(ROOT)
+
+    import app as mehelper
+    from werkzeug.serving import make_server
+
+    mehelper.image_service = StubVisionService(args.vision_ms)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, mehelper.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    image = sample_jpeg()
+    rtt = args.rtt_ms / 1000.0
+    print(f"LLM {args.llm_ms:.0f} ms, vision {args.vision_ms:.0f} ms, RTT {args.rtt_ms:.0f} ms, {args.runs} runs")
+    print(f"{'flow':<12} {'p50 ms':>9} {'p95 ms':>9}")
+    results = {}
+    for name, flow in (('two-call', two_call_flow), ('combined', combined_flow)):
+        flow(port, image, 0)  # warm up connections and code paths
+        results[name] = measure(flow, port, image, args.runs, rtt)
+        print(f"{name:<12} {results[name][0]:>9.0f} {results[name][1]:>9.0f}")
+    saved = results['two-call'][0] - results['combined'][0]
+    print(f"combined saves {saved:.0f} ms at the median ({saved / results['two-call'][0]:.0%})")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
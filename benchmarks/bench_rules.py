@@ -0,0 +1,194 @@
+"""Rule-based triage cost per request, and what a knowledge base reload costs.
+
+Usage:
+    python benchmarks/bench_rules.py [--cases 2000] [--repeat 5] [--baseline <git-ref>] [--threads 8]
+
+"evaluate" is what the rule path does for one request: emergency keyword
+detection plus MockAIService.analyze_symptoms. It runs over generated
+cases that mix condition words, emergency phrases and vitals. With
+--baseline, the same measurement runs against that commit, checked out
+in a temporary git worktree, so code that still hard-codes the rules in
+MockAIService can be compared with the compiled knowledge base.
+
+"reload" is the time to read and compile triage_rules.json. "under
+reload" repeats the evaluation from several threads while the file is
+rewritten every 10 ms, to show that hot reloads neither fail in-flight
+requests nor stall them.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ['fever', 'cough', 'headache', 'stomach ache', 'chest tightness', 'back pain', 'nausea', 'diarrhea',
+         'anxiety', 'stress', 'low mood', 'rash', 'tired', 'dizzy', 'sore throat', 'for two weeks',
+         'severe', 'worst ever', 'chest pain', 'bleeding', "can't breathe", 'seizure', 'since last month']
+
+
+def make_cases(count, seed=11):
+    rng = random.Random(seed)
+    cases = []
+    for _ in range(count):
+        symptoms = ', '.join(rng.sample(WORDS, rng.randint(1, 5)))
+        cases.append({
+            'age': rng.choice([1, 4, 12, 30, 45, 70, 85]), 'sex': rng.choice(['male', 'female']),
+            'symptoms': f"I have {symptoms}", 'duration': '1-3days',
+            'vitals': {'temperature': rng.choice([None, 36.8, 37.9, 39.4, 34.8]),
+                       'heart_rate': rng.choice([None, 55, 78, 110, 130])}
+        })
+    return cases
+
+
+def load_app(root):
+    os.environ.update(HISTORY_BACKEND='off', BACKGROUND_MODEL_LOAD='false', MODEL_WARMUP='false',
+                      LOG_LEVEL='CRITICAL', USE_INFERENCE_PROVIDERS='false', STATIC_PRECOMPRESS='false')
+    sys.path.insert(0, root)
+    os.chdir(root)
+    import app
+    return app
+
+
+def evaluator(app):
+    # Older trees have no shared mock_service instance
+    service = getattr(app, 'mock_service', None) or app.MockAIService()
+
+    def evaluate(data):
+        keywords = app.detect_emergency_keywords(data['symptoms'])
+        return keywords, service.analyze_symptoms(data)
+    return evaluate
+
+
+def timed_pass(evaluate, cases):
+    latencies = []
+    for data in cases:
+        started = time.perf_counter()
+        evaluate(data)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def measure(root, cases, repeat):
+    """Runs in a subprocess; prints one JSON line"""
+    app = load_app(root)
+    evaluate = evaluator(app)
+    timed_pass(evaluate, cases)  # warm up
+    best = min((timed_pass(evaluate, cases) for _ in range(repeat)), key=sum)
+    print(json.dumps({'p50_us': statistics.median(best) * 1e6,
+                      'p99_us': sorted(best)[int(len(best) * 0.99)] * 1e6,
+                      'per_sec': len(best) / sum(best)}))
+
+
+def measure_reload(cases, threads):
+    """Compile time, and evaluation latency with and without a reload every 10 ms"""
+    directory = tempfile.mkdtemp(prefix='mehelper-rules-')
+    path = os.path.join(directory, 'triage_rules.json')
+    shutil.copy(os.path.join(ROOT, 'triage_rules.json'), path)
+    os.environ.update(TRIAGE_RULES_PATH=path, TRIAGE_RULES_RELOAD_SECONDS='0.005')
+    app = load_app(ROOT)
+    from triage_rules import TriageRules
+
+    started = time.perf_counter()
+    for _ in range(20):
+        TriageRules.load(path)
+    compile_ms = (time.perf_counter() - started) / 20 * 1000
+
+    evaluate = evaluator(app)
+    with open(path) as f:
+        data = json.load(f)
+
+    def run(rewrite):
+        latencies, errors = [], []
+
+        def worker():
+            for case in cases:
+                started = time.perf_counter()
+                try:
+                    evaluate(case)
+                except Exception as e:  # a failed request is what this measures
+                    errors.append(repr(e))
+                latencies.append(time.perf_counter() - started)
+        pool = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in pool:
+            thread.start()
+        revision = 0
+        while rewrite and any(thread.is_alive() for thread in pool):
+            revision += 1
+            temporary = path + '.tmp'
+            with open(temporary, 'w') as f:
+                json.dump(dict(data, revision=revision), f)
+            os.replace(temporary, path)
+            time.sleep(0.01)
+        for thread in pool:
+            thread.join()
+        return latencies, errors
+
+    results = {}
+    for name, rewrite in (('steady', False), ('under reload', True)):
+        before = app.knowledge_base.reloads
+        latencies, errors = run(rewrite)
+        results[name] = (statistics.median(latencies) * 1e6, sorted(latencies)[int(len(latencies) * 0.99)] * 1e6,
+                         app.knowledge_base.reloads - before, len(errors))
+    shutil.rmtree(directory, ignore_errors=True)
+    return compile_ms, results
+
+
+def run_measure(root, args):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--measure', root, '--cases', str(args.cases),
+         '--repeat', str(args.repeat)],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cases', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--baseline', help='git ref to compare against, e.g. the commit before a rules change')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    cases = make_cases(args.cases)
+
+    if args.measure:
+        measure(args.measure, cases, args.repeat)
+        return
+
+    rows = []
+    if args.baseline:
+        worktree = tempfile.mkdtemp(prefix='mehelper-baseline-')
+        subprocess.run(['git', 'worktree', 'add', '--detach', '--force', worktree, args.baseline],
+                       cwd=ROOT, check=True, capture_output=True)
+        try:
+            rows.append((f"baseline {args.baseline}", run_measure(worktree, args)))
+        finally:
+            subprocess.run(['git', 'worktree', 'remove', '--force', worktree], cwd=ROOT, capture_output=True)
+    rows.append(("knowledge base", run_measure(ROOT, args)))
+
+    print(f"{args.cases} cases, best of {args.repeat} passes")
+    print(f"{'evaluate':<28} {'p50 us':>8} {'p99 us':>8} {'req/s':>10}")
+    for name, result in rows:
+        note = ''
+        if len(rows) > 1 and name == "knowledge base":
+            note = f"  ({result['per_sec'] / rows[0][1]['per_sec']:.2f}x)"
+        print(f"{name:<28} {result['p50_us']:>8.1f} {result['p99_us']:>8.1f} {result['per_sec']:>10.0f}{note}")
+
+    compile_ms, results = measure_reload(cases, args.threads)
+    print(f"\nreload: read + compile triage_rules.json {compile_ms:.2f} ms")
+    print(f"{f'{args.threads} threads x {args.cases} cases':<28} {'p50 us':>8} {'p99 us':>8} {'reloads':>8} {'errors':>7}")
+    for name, (p50, p99, reloads, errors) in results.items():
+        print(f"{name:<28} {p50:>8.1f} {p99:>8.1f} {reloads:>8} {errors:>7}")
+
+
+if __name__ == '__main__':
+    main()
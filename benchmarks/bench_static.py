@@ -0,0 +1,134 @@
+"""Bytes on the wire and server CPU per page load: files from disk vs. the precompressed asset table.
+
+Usage:
+    python benchmarks/bench_static.py [--loads 200] [--accept-encoding "gzip, deflate, br"]
+
+Runs MeHelper under the threaded werkzeug server twice:
+- once with STATIC_PRECOMPRESS=false, where index.html, styles.css and
+  app.js are sent uncompressed from disk as before;
+- once with the in-memory table.
+
+A small client loads the page the way a browser does: index.html, then
+the local stylesheets and scripts it references. It keeps an HTTP cache
+that honours ETag revalidation and immutable Cache-Control. "first
+visit" starts with an empty cache, and "repeat visit" reuses the cache
+from the first load. Bytes include response headers. Server CPU is the
+server process's user+system time from /proc, divided by the number of
+page loads. The 2G column is the transfer time at 50 kbit/s.
+"""
+import argparse
+import http.client
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_async import free_port, wait_until_healthy  # noqa: E402
+
+TWO_G_BITS_PER_SECOND = 50_000
+
+
+def cpu_seconds(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+class BrowserCache:
+    """Just enough of a browser HTTP cache: immutable entries and ETag revalidation"""
+
+    def __init__(self):
+        self.entries = {}
+
+    def fetch(self, conn, path, accept_encoding):
+        """Return (response bytes on the wire, body) for one resource, or (0, body) from cache"""
+        cached = self.entries.get(path)
+        if cached and 'immutable' in cached['cache_control']:
+            return 0, cached['body']
+        headers = {'Accept-Encoding': accept_encoding}
+        if cached and cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        conn.request('GET', path, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        wire = len(f"HTTP/1.1 {response.status} {response.reason}\r\n") + len(body) + 2
+        wire += sum(len(name) + len(value) + 4 for name, value in response.getheaders())
+        if response.status == 304:
+            return wire, cached['body']
+        if response.status != 200:
+            raise RuntimeError(f"GET {path} returned {response.status}")
+        encoding = response.getheader('Content-Encoding')
+        if encoding == 'gzip':
+            import gzip
+            decoded = gzip.decompress(body)
+        elif encoding == 'br':
+            import brotli
+            decoded = brotli.decompress(body)
+        else:
+            decoded = body
+        self.entries[path] = {'etag': response.getheader('ETag'), 'body': decoded,
+                              'cache_control': response.getheader('Cache-Control') or ''}
+        return wire, decoded
+
+
+def page_load(port, cache, accept_encoding):
+    """Load index.html and its local CSS/JS; returns bytes on the wire"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    wire, html = cache.fetch(conn, '/', accept_encoding)
+    for url in re.findall(r'(?:href|src)="(/?(?:css|js)/[^"]+)"', html.decode('utf-8')):
+        wire += cache.fetch(conn, '/' + url.lstrip('/'), accept_encoding)[0]
+    conn.close()
+    return wire
+
+
+def measure(precompress, loads, accept_encoding):
+    port = free_port()
+    env = dict(os.environ, STATIC_PRECOMPRESS='true' if precompress else 'false', HF_TOKEN='stub',
+               HF_ROUTER_BASE_URL='http://127.0.0.1:9/v1', BACKGROUND_MODEL_LOAD='false',
+               MODEL_WARMUP='false', LOG_LEVEL='WARNING', HISTORY_BACKEND='off')
+    command = [sys.executable, '-c', "from werkzeug.serving import run_simple; from app import app; "
+               f"run_simple('127.0.0.1', {port}, app, threaded=True)"]
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_healthy(port)
+        results = {}
+        for visit in ('first visit', 'repeat visit'):
+            warm = BrowserCache()
+            page_load(port, warm, accept_encoding)
+            wire = page_load(port, BrowserCache() if visit == 'first visit' else warm, accept_encoding)
+            started = cpu_seconds(server.pid)
+            for _ in range(loads):
+                page_load(port, BrowserCache() if visit == 'first visit' else warm, accept_encoding)
+            results[visit] = (wire, (cpu_seconds(server.pid) - started) / loads * 1000)
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--loads', type=int, default=200)
+    parser.add_argument('--accept-encoding', default='gzip, deflate, br')
+    args = parser.parse_args()
+
+    print(f"{args.loads} page loads per row, Accept-Encoding: {args.accept_encoding}")
+    print(f"{'serving':<14} {'visit':<13} {'wire KB':>8} {'2G s':>6} {'server CPU ms':>14}")
+    baseline = {}
+    for precompress in (False, True):
+        name = 'precompressed' if precompress else 'disk'
+        for visit, (wire, cpu_ms) in measure(precompress, args.loads, args.accept_encoding).items():
+            note = ''
+            if precompress and visit in baseline:
+                note = f"  ({wire / baseline[visit][0] - 1:+.0%} bytes, {cpu_ms / baseline[visit][1] - 1:+.0%} CPU)"
+            else:
+                baseline[visit] = (wire, cpu_ms)
+            print(f"{name:<14} {visit:<13} {wire / 1024:>8.1f} {wire * 8 / TWO_G_BITS_PER_SECOND:>6.1f} "
+                  f"{cpu_ms:>14.2f}{note}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Query latency and recall of the semantic symptom index against the keyword rules.
+
+Usage:
+    python benchmarks/bench_symptom_index.py [--encoder hashing] [--k 3] [--min-score 0.2] [--repeat 200]
+
+COMPLAINTS is a labelled set of free-text complaints: how patients
+describe a problem, with typos and lay terms, none copied from
+condition_descriptions.json. Each complaint comes with the conditions a
+clinician would accept. "recall@k" is the share of complaints with at
+least one accepted condition in the top k. "keywords" scores
+TriageRules.possible_conditions the same way. Its generic fallback list
+counts as a miss unless it happens to contain an accepted condition.
+"semantic" ranks with no threshold. "semantic >= min" only keeps
+conditions scoring at least --min-score, as the app does. "off-topic
+rejected" is the share of OFF_TOPIC texts (no complaint at all) for which
+nothing reaches the threshold.
+
+Latency covers one query end to end: encoding the text, the
+matrix-vector product and the top-k. "open" is the time to build and
+save the index from the descriptions, and the time to memory-map the
+saved one, as a worker does at startup.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+COMPLAINTS = [
+    ("my tummy hurts and I feel hot", {"Gastroenteritis", "Stomach flu", "Viral infection", "Flu"}),
+    ("been throwing up all night and have the runs", {"Gastroenteritis", "Food poisoning", "Stomach flu"}),
+    ("stomache cramps since the party buffet", {"Food poisoning", "Gastroenteritis"}),
+    ("belly is sore and I keep vomitting", {"Gastroenteritis", "Stomach flu", "Food poisoning"}),
+    ("loose stools five times today", {"Gastroenteritis", "Food poisoning"}),
+    ("I feel queasy whenever I'm on the boat", {"Motion sickness"}),
+    ("burning up and shivering under the blankets", {"Viral infection", "Flu", "Malaria"}),
+    ("whole body aches and I'm boiling hot", {"Flu", "Viral infection"}),
+    ("temperature went up and down with sweats after my trip to the lake, lots of mosquitoes",
+     {"Malaria", "Viral infection"}),
+    ("nose keeps running and I can't stop sneezing", {"Common cold", "Allergic rhinitis"}),
+    ("stuffed up nose and scratchy throat", {"Common cold", "Strep throat"}),
+    ("coughing up green gunk and running a fever", {"Pneumonia", "Bronchitis"}),
+    ("chesty cough that won't clear", {"Bronchitis", "Pneumonia"}),
+    ("food tastes of nothing and I can't smell coffee", {"COVID-19"}),
+    ("my head is throbbing on the left side and light hurts my eyes", {"Migraine"}),
+    ("feels like a tight band squeezing my head", {"Tension headache"}),
+    ("pressure in my cheeks and behind my eyes with a blocked nose", {"Sinus infection"}),
+    ("really thirsty, dry lips and my pee is dark", {"Dehydration"}),
+    ("lightheaded after working in the sun all day", {"Dehydration"}),
+    ("burning in my chest after dinner and sour taste", {"Heartburn"}),
+    ("acid keeps coming up my throat at night", {"Heartburn"}),
+    ("hurt my back lifting boxes", {"Muscle strain", "Injury"}),
+    ("rolled my ankle playing football and it's puffy", {"Injury"}),
+    ("knee is swollen warm and stiff", {"Inflammation"}),
+    ("it stings when I wee and I need to go all the time", {"Urinary tract infection"}),
+    ("urine is cloudy and smells strong", {"Urinary tract infection"}),
+    ("my ear is aching and sounds are muffled", {"Ear infection"}),
+    ("child pulling at ear and has a fever", {"Ear infection"}),
+    ("it hurts to swallow and my glands are swollen", {"Strep throat"}),
+    ("eyes are red sticky and itchy in the morning", {"Conjunctivitis"}),
+    ("itchy watery eyes and sneezing every spring", {"Allergic rhinitis"}),
+    ("itchy red bumps all over my arms", {"Skin allergy"}),
+    ("broke out in hives after the new soap", {"Skin allergy"}),
+    ("wheezy and chest feels tight when I run", {"Asthma"}),
+    ("whistling breath at night", {"Asthma"}),
+    ("I worry about everything and can't relax", {"Anxiety disorder"}),
+    ("suddenly my heart races, I shake and sweat and think I'm dying", {"Panic attacks"}),
+    ("since the car crash I can't stop replaying it", {"Acute stress response"}),
+    ("nothing interests me anymore and I feel hopeless", {"Major depressive episode"}),
+    ("feeling down and empty for weeks", {"Major depressive episode"}),
+    ("my boss piles on work and I'm burnt out", {"Work-related stress"}),
+    ("lying awake for hours every night", {"Insomnia"}),
+    ("wiped out all the time even after a full night", {"General fatigue"}),
+    ("no energy, run down", {"General fatigue"}),
+    ("cut on my hand is red hot and oozing pus", {"Bacterial infection"}),
+]
+
+OFF_TOPIC = ["hello", "I need a refill of my prescription", "general checkup please", "not sure",
+             "just here with my mother", "can I get a sick note for work", "asdf qwer", "vaccination appointment",
+             "what are your opening hours", "follow up visit"]
+
+
+def recall(predictions, k):
+    hits = sum(bool(set(predicted[:k]) & accepted) for predicted, (_, accepted) in zip(predictions, COMPLAINTS))
+    return hits / len(COMPLAINTS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--encoder', default='hashing', help="'hashing' or a sentence-embedding model id")
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--min-score', type=float, default=0.2)
+    parser.add_argument('--repeat', type=int, default=200, help='timed passes over the labelled set')
+    args = parser.parse_args()
+
+    from symptom_index import DEFAULT_DESCRIPTIONS_PATH, SymptomIndex
+    from triage_rules import TriageRules
+
+    directory = tempfile.mkdtemp(prefix='mehelper-index-')
+    try:
+        started = time.perf_counter()
+        SymptomIndex.open(directory, DEFAULT_DESCRIPTIONS_PATH, args.encoder)
+        build_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        index = SymptomIndex.open(directory, DEFAULT_DESCRIPTIONS_PATH, args.encoder)
+        open_ms = (time.perf_counter() - started) * 1000
+
+        semantic = [[name for name, _ in index.search(text, args.k)] for text, _ in COMPLAINTS]
+        thresholded = [[name for name, _ in index.search(text, args.k, args.min_score)] for text, _ in COMPLAINTS]
+        rejected = sum(not index.search(text, args.k, args.min_score) for text in OFF_TOPIC) / len(OFF_TOPIC)
+        latencies = []
+        for _ in range(args.repeat):
+            for text, _ in COMPLAINTS:
+                started = time.perf_counter()
+                index.search(text, args.k)
+                latencies.append(time.perf_counter() - started)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    rules = TriageRules.load(os.path.join(ROOT, 'triage_rules.json'))
+    keywords = [rules.possible_conditions(rules.match(text)) for text, _ in COMPLAINTS]
+
+    stats = index.stats()
+    print(f"{len(COMPLAINTS)} labelled complaints; index: {stats['conditions']} conditions, "
+          f"{stats['descriptions']} descriptions, {stats['encoder']} encoder, {stats['dimensions']} dimensions")
+    print(f"open: build + save {build_ms:.1f} ms, memory-map saved index {open_ms:.1f} ms")
+    print(f"{'matcher':<18} {'recall@1':>9} {f'recall@{args.k}':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    print(f"{'keywords':<18} {recall(keywords, 1):>9.0%} {recall(keywords, args.k):>9.0%}")
+    p50, p99 = statistics.median(latencies) * 1000, sorted(latencies)[int(len(latencies) * 0.99)] * 1000
+    print(f"{'semantic':<18} {recall(semantic, 1):>9.0%} {recall(semantic, args.k):>9.0%} {p50:>8.3f} {p99:>8.3f}")
+    print(f"{f'semantic >= {args.min_score:g}':<18} {recall(thresholded, 1):>9.0%} {recall(thresholded, args.k):>9.0%}"
+          f"   off-topic rejected {rejected:.0%}")
+
+    misses = [(text, predicted) for predicted, (text, accepted) in zip(semantic, COMPLAINTS)
+              if not set(predicted) & accepted]
+    for text, predicted in misses:
+        print(f"  miss: {text!r} -> {predicted}")
+
+
+if __name__ == '__main__':
+    main()
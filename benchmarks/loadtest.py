@@ -0,0 +1,377 @@
+"""Load test MeHelper per serving mode against local stub upstreams.
+
+Usage:
+    python benchmarks/loadtest.py [--modes werkzeug,wsgi,asgi] [--concurrency 50] [--requests 2000]
+                                  [--latency-ms 800] [--jitter-ms 200] [--error-rate 0.02]
+                                  [--mix analyze=70,image=10,health=20] [--seed 7] [--no-save]
+
+Starts the OpenAI-compatible and Gemini stubs from benchmarks/stubs.py,
+then for each serving mode launches MeHelper against them and replays the
+same seeded request mix: /api/analyze payloads built the way js/app.js
+builds them (free text plus the symptom chips from index.html, optional
+vitals, a few emergency phrasings), JPEG uploads to /api/analyze_image, and
+/api/health polls. Serving modes are the threaded werkzeug server, gunicorn
+with a thread pool (wsgi) and hypercorn running asgi.py (asgi); modes whose
+server is not installed are skipped.
+
+For each mode it reports requests/s, p50/p95/p99 overall and per endpoint,
+error counts, and the server's resident memory when idle and at peak
+(summed over the process tree). Each run is appended to
+benchmarks/results/loadtest.jsonl tagged with the git commit and compared
+with the latest earlier run that used the same settings; a drop in
+requests/s or a rise in p95 beyond --tolerance is flagged as a regression.
+Response caches are off unless --caches is given, so every request reaches
+the stubs.
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_async import free_port, wait_until_healthy  # noqa: E402
+from bench_multimodal import multipart  # noqa: E402
+from stubs import StubProfile, start_gemini_stub, start_openai_stub  # noqa: E402
+
+RESULTS_PATH = os.path.join(ROOT, 'benchmarks', 'results', 'loadtest.jsonl')
+
+DURATIONS = ['hours', '1-2days', '3-7days', '1-2weeks', 'more']
+FREE_TEXT = ['', 'since yesterday', 'worse at night', 'after eating at a market stall', 'and feeling weak',
+             'my child has', 'comes and goes']
+EMERGENCY_TEXT = ['chest pain spreading to left arm', 'difficulty breathing', 'fainted twice this morning']
+EMERGENCY_SHARE = 0.05
+
+
+def load_chips():
+    """Symptom chip values offered by the triage form"""
+    with open(os.path.join(ROOT, 'index.html'), encoding='utf-8') as f:
+        return re.findall(r'class="chip" data-value="([^"]+)"', f.read())
+
+
+def triage_payload(rng, chips):
+    """One /api/analyze body, assembled like submitTriage() in js/app.js"""
+    text = rng.choice(EMERGENCY_TEXT) if rng.random() < EMERGENCY_SHARE else rng.choice(FREE_TEXT)
+    selected = rng.sample(chips, rng.randint(1 if not text else 0, 3))
+    return {
+        "age": rng.randint(1, 85),
+        "sex": rng.choice(['male', 'female', 'other']),
+        "symptoms": text + (' ' + ', '.join(selected) if selected else ''),
+        "duration": rng.choice(DURATIONS),
+        "vitals": {
+            "temperature": round(rng.uniform(36.2, 40.1), 1) if rng.random() < 0.5 else None,
+            "heart_rate": rng.randint(55, 140) if rng.random() < 0.3 else None
+        }
+    }
+
+
+def sample_images(count=8):
+    """Distinct small JPEGs, so uploads are not all byte-identical"""
+    from PIL import Image
+    images = []
+    for index in range(count):
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), (120 + index * 15, 70 + index * 5, 60)).save(buffer, format='JPEG')
+        images.append(buffer.getvalue())
+    return images
+
+
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(','):
+        kind, _, weight = item.partition('=')
+        mix[kind.strip()] = float(weight)
+    unknown = set(mix) - {'analyze', 'image', 'health'}
+    if unknown:
+        raise SystemExit(f"unknown request kinds in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def build_requests(total, mix, seed):
+    """The seeded request list: (kind, method, path, body, headers)"""
+    rng = random.Random(seed)
+    chips = load_chips()
+    images = sample_images() if mix.get('image') else []
+    kinds, weights = zip(*[(kind, weight) for kind, weight in mix.items() if weight > 0])
+    requests = []
+    for kind in rng.choices(kinds, weights, k=total):
+        if kind == 'analyze':
+            body = json.dumps(triage_payload(rng, chips)).encode()
+            requests.append((kind, 'POST', '/api/analyze', body, {'Content-Type': 'application/json'}))
+        elif kind == 'image':
+            body, content_type = multipart({}, rng.choice(images))
+            requests.append((kind, 'POST', '/api/analyze_image', body, {'Content-Type': content_type}))
+        else:
+            requests.append((kind, 'GET', '/api/health', None, {}))
+    return requests
+
+
+def latency_summary(latencies):
+    latencies = sorted(latencies)
+    pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000  # noqa: E731
+    return {"p50_ms": round(statistics.median(latencies) * 1000, 1), "p95_ms": round(pick(0.95), 1),
+            "p99_ms": round(pick(0.99), 1)}
+
+
+def drive(port, requests, concurrency):
+    """Replay `requests` with `concurrency` in flight; return per-kind (latency, ok) samples and wall time"""
+    samples = []
+    lock = threading.Lock()
+    counter = iter(range(len(requests)))
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                conn.close()
+                return
+            kind, method, path, body, headers = requests[index]
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+            except OSError:
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples.append((kind, elapsed, ok))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def tree_rss_mb(pid):
+    """Resident memory of a process and all its descendants (Linux /proc)"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total / 1024
+
+
+class RSSSampler(threading.Thread):
+    """Track peak tree RSS of the server while the load runs"""
+
+    def __init__(self, pid, interval=0.2):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0.0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, tree_rss_mb(self.pid))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.peak
+
+
+def server_command(mode, port, wsgi_threads):
+    if mode == 'werkzeug':
+        return [sys.executable, '-c',
+                "from werkzeug.serving import run_simple; from app import app; "
+                f"run_simple('127.0.0.1', {port}, app, threaded=True)"], 'werkzeug'
+    if mode == 'wsgi':
+        return ['gunicorn', '-w', '1', '--threads', str(wsgi_threads), '-b', f'127.0.0.1:{port}', 'app:app'], 'gunicorn'
+    if mode == 'asgi':
+        return ['hypercorn', '-w', '1', '-b', f'127.0.0.1:{port}', 'asgi:asgi_app'], 'hypercorn'
+    raise SystemExit(f"unknown serving mode: {mode}")
+
+
+def server_available(binary):
+    if binary == 'werkzeug':
+        return True
+    return shutil.which(binary) is not None
+
+
+def image_service_available(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    conn.request('GET', '/api/health')
+    return json.loads(conn.getresponse().read())['services']['image_service']['available']
+
+
+def run_mode(mode, args, env, mix):
+    port = free_port()
+    command, binary = server_command(mode, port, args.wsgi_threads)
+    if not server_available(binary):
+        return None, f"skipped ({binary} not installed)"
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_healthy(port)
+        note = None
+        if mix.get('image') and not image_service_available(port):
+            mix = dict(mix, image=0)
+            note = "image service unavailable (is google-genai installed?), image requests left out"
+        requests = build_requests(args.requests, mix, args.seed)
+        # Warm connections, imports and caches before measuring
+        drive(port, requests[:min(len(requests), args.concurrency)], args.concurrency)
+        rss_idle = tree_rss_mb(server.pid)
+        sampler = RSSSampler(server.pid)
+        sampler.start()
+        samples, wall = drive(port, requests, args.concurrency)
+        rss_peak = max(sampler.stop(), rss_idle)
+    finally:
+        server.terminate()
+        server.wait()
+
+    endpoints = {}
+    for kind in sorted({kind for kind, _, _ in samples}):
+        latencies = [elapsed for k, elapsed, _ in samples if k == kind]
+        errors = sum(1 for k, _, ok in samples if k == kind and not ok)
+        endpoints[kind] = dict(latency_summary(latencies), count=len(latencies), errors=errors)
+    return {
+        "mode": mode,
+        "rps": round(len(samples) / wall, 1),
+        **latency_summary([elapsed for _, elapsed, _ in samples]),
+        "errors": sum(1 for _, _, ok in samples if not ok),
+        "endpoints": endpoints,
+        "rss_idle_mb": round(rss_idle, 1),
+        "rss_peak_mb": round(rss_peak, 1),
+        "mix": {kind: weight for kind, weight in mix.items() if weight}
+    }, note
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+
+def previous_run(settings, mode):
+    if not os.path.exists(RESULTS_PATH):
+        return None
+    match = None
+    with open(RESULTS_PATH) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('settings') == settings and record['result']['mode'] == mode:
+                match = record
+    return match
+
+
+def compare(result, previous, tolerance):
+    before = previous['result']
+    rps_change = result['rps'] / before['rps'] - 1 if before['rps'] else 0.0
+    p95_change = result['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+    regression = rps_change < -tolerance or p95_change > tolerance
+    return (f"vs {previous['commit'] or 'unknown'}{'+dirty' if previous.get('dirty') else ''}: "
+            f"req/s {rps_change:+.1%}, p95 {p95_change:+.1%}" + ("  REGRESSION" if regression else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default='werkzeug,wsgi,asgi')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--latency-ms', type=float, default=800)
+    parser.add_argument('--jitter-ms', type=float, default=200)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--vision-latency-ms', type=float, default=1200)
+    parser.add_argument('--mix', default='analyze=70,image=10,health=20')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--wsgi-threads', type=int, default=16)
+    parser.add_argument('--caches', action='store_true', help='leave the triage and image caches on')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='relative change flagged as a regression')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    llm_profile = StubProfile(args.latency_ms, args.jitter_ms, args.error_rate, args.seed, args.error_status)
+    vision_profile = StubProfile(args.vision_latency_ms, args.jitter_ms, args.error_rate, args.seed + 1,
+                                 args.error_status)
+    _, router_url = start_openai_stub(llm_profile)
+    _, gemini_url = start_gemini_stub(vision_profile)
+    env = dict(os.environ, HF_TOKEN='stub', HF_ROUTER_BASE_URL=router_url, GEMINI_API_KEY='stub',
+               GEMINI_BASE_URL=gemini_url, USE_INFERENCE_PROVIDERS='true', BACKGROUND_MODEL_LOAD='false',
+               MODEL_WARMUP='false', LOG_LEVEL='WARNING')
+    if not args.caches:
+        env.update(TRIAGE_CACHE_BACKEND='off', IMAGE_CACHE_BACKEND='off')
+
+    settings = {key: getattr(args, key) for key in (
+        'concurrency', 'requests', 'latency_ms', 'jitter_ms', 'error_rate', 'error_status',
+        'vision_latency_ms', 'mix', 'seed', 'wsgi_threads', 'caches')}
+    commit, dirty = git_revision()
+    print(f"commit {commit or 'unknown'}{' (dirty)' if dirty else ''}: {args.requests} requests, "
+          f"{args.concurrency} in flight, upstream {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms, "
+          f"vision {args.vision_latency_ms:.0f} ms, error rate {args.error_rate:.0%}, mix {args.mix}")
+
+    for mode in args.modes.split(','):
+        result, note = run_mode(mode.strip(), args, env, mix)
+        if result is None:
+            print(f"{mode:>8}: {note}")
+            continue
+        print(f"{mode:>8}: {result['rps']:.1f} req/s  p50 {result['p50_ms']:.0f} ms  p95 {result['p95_ms']:.0f} ms  "
+              f"p99 {result['p99_ms']:.0f} ms  errors {result['errors']}  "
+              f"RSS {result['rss_idle_mb']:.0f} MB idle / {result['rss_peak_mb']:.0f} MB peak")
+        for kind, stats in result['endpoints'].items():
+            print(f"{'':>10}{kind:<8} n={stats['count']:<5} p50 {stats['p50_ms']:.0f} ms  "
+                  f"p95 {stats['p95_ms']:.0f} ms  p99 {stats['p99_ms']:.0f} ms  errors {stats['errors']}")
+        if note:
+            print(f"{'':>10}note: {note}")
+        previous = previous_run(settings, result['mode'])
+        if previous:
+            print(f"{'':>10}{compare(result, previous, args.tolerance)}")
+        if not args.no_save:
+            os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+            with open(RESULTS_PATH, 'a') as f:
+                f.write(json.dumps({
+                    "commit": commit, "dirty": dirty,
+                    "timestamp": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                    "settings": settings, "result": result
+                }) + '\n')
+
+
+if __name__ == '__main__':
+    main()
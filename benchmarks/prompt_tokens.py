@@ -0,0 +1,99 @@
+"""Token-count report for the triage prompt template variants.
+
+Usage:
+    python benchmarks/prompt_tokens.py [--tokenizer openai/gpt-oss-20b]
+
+For each variant it reports the static prefix (identical on every request,
+so providers with prompt caching and the local prefix KV cache prefill it
+once), the per-request patient tokens, and the tokens that still have to be
+prefilled per request once the prefix is reused. "legacy" is the layout
+before the shared template, with the patient block in the middle of the
+instructions, where only the opening sentence was a reusable prefix.
+
+Tokens are counted with the model's tokenizer when transformers is
+installed, else tiktoken's o200k_base (same family as gpt-oss), else a
+word/punctuation approximation, which is labelled as such in the output.
+"""
+import argparse
+import os
+import re
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompts import TEMPLATES, VERBOSE_INSTRUCTIONS, patient_block  # noqa: E402
+
+CASES = [
+    {"age": 30, "sex": "male", "symptoms": "fever, cough", "duration": "1-2days"},
+    {"age": 4, "sex": "female", "symptoms": "diarrhea, vomiting", "duration": "hours",
+     "vitals": {"temperature": 38.6, "heart_rate": 130}},
+    {"age": 52, "sex": "female", "symptoms": "headache, dizziness, fatigue", "duration": "3-7days",
+     "vitals": {"heart_rate": 96}},
+    {"age": 67, "sex": "male", "symptoms": "rash, pain", "duration": "1-2weeks",
+     "image_analysis": "Raised red patches with clear borders on the left forearm, no visible pus or open wounds."},
+]
+
+
+def load_counter(tokenizer_name):
+    """Return (name, count_fn) for the best tokenizer available"""
+    try:
+        from transformers import AutoTokenizer  # type: ignore
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+        return tokenizer_name, lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+    except Exception:
+        pass
+    try:
+        import tiktoken  # type: ignore
+        encoding = tiktoken.get_encoding('o200k_base')
+        return 'tiktoken o200k_base', lambda text: len(encoding.encode(text))
+    except Exception:
+        pass
+    pattern = re.compile(r"\w+|[^\w\s]")
+    return 'approx (words + punctuation)', lambda text: len(pattern.findall(text))
+
+
+def legacy_parts(case):
+    """(reusable prefix, rest) of the pre-template prompt for one case"""
+    head, body = VERBOSE_INSTRUCTIONS.split("\n\n", 1)
+    head = head.replace("the patient information provided by the user", "the following patient information")
+    patient = patient_block(case['age'], case['sex'], case['symptoms'], case['duration'],
+                            case.get('vitals'), case.get('image_analysis'))
+    return head + "\n\n", patient + "\n\n" + body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--tokenizer', default='openai/gpt-oss-20b')
+    args = parser.parse_args()
+
+    name, count = load_counter(args.tokenizer)
+    print(f"tokenizer: {name}, {len(CASES)} cases")
+    print(f"{'variant':<10} {'prefix':>7} {'patient':>8} {'total':>7} {'prefill/req':>12}")
+
+    rows = []
+    for variant, instructions in [('legacy', None)] + sorted(TEMPLATES.items()):
+        prefixes, variables = [], []
+        for case in CASES:
+            if instructions is None:
+                prefix, rest = legacy_parts(case)
+            else:
+                prefix = instructions
+                rest = patient_block(case['age'], case['sex'], case['symptoms'], case['duration'],
+                                     case.get('vitals'), case.get('image_analysis'))
+            prefixes.append(count(prefix))
+            variables.append(count(rest))
+        prefix_tokens = statistics.mean(prefixes)
+        variable_tokens = statistics.mean(variables)
+        rows.append((variant, prefix_tokens + variable_tokens, variable_tokens))
+        print(f"{variant:<10} {prefix_tokens:>7.0f} {variable_tokens:>8.0f} "
+              f"{prefix_tokens + variable_tokens:>7.0f} {variable_tokens:>12.0f}")
+
+    legacy_prefill = rows[0][2]
+    for variant, total, prefill in rows[1:]:
+        print(f"{variant}: {prefill / legacy_prefill - 1:+.0%} prefill tokens per request vs legacy "
+              f"with prefix reuse, {total / rows[0][1] - 1:+.0%} total prompt tokens")
+
+
+if __name__ == '__main__':
+    main()
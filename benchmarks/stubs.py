@@ -0,0 +1,206 @@
+"""Local stub upstreams for benchmarks.
+
+Imitates the OpenAI-compatible chat completions API served by the HF
+router and the Gemini generate_content API, with configurable latency and
+error behaviour, so MeHelper can be load tested without network access or
+API quota. Point the app at them with HF_ROUTER_BASE_URL and
+GEMINI_BASE_URL. Run standalone with:
+
+    python benchmarks/stubs.py --port 8901 --gemini-port 8902 --latency-ms 800
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRIAGE_ANALYSIS = {
+    "level_1_reassurance": "Symptoms are most consistent with a self-limiting viral illness.",
+    "level_2_assessment": {"severity": "moderate", "description": "Moderate concern - monitor closely"},
+    "level_3_possibilities": ["Viral infection", "Influenza", "Common cold"],
+    "level_4_first_aid": ["Rest", "Stay hydrated", "Use fever reducers if available"],
+    "level_5_danger_signs": ["Difficulty breathing", "Confusion", "Fever above 39.5C"],
+    "level_6_vitals_analysis": "No abnormal vitals reported",
+    "level_7_summary": {"summary": "Likely viral illness", "next_action": "Home care, see a doctor if worse"}
+}
+
+
+class StubProfile:
+    """Latency and failure behaviour of a stub upstream"""
+
+    def __init__(self, latency_ms=500.0, jitter_ms=0.0, error_rate=0.0, seed=None, error_status=500):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        # 500 for upstream faults, 429/503 to imitate rate limiting or overload
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Sleep for one simulated upstream latency; return False if this call should fail"""
+        with self._lock:
+            delay = self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+            failed = self._random.random() < self.error_rate
+        time.sleep(max(delay, 0) / 1000.0)
+        return not failed
+
+
+def _chat_completion_body():
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "openai/gpt-oss-20b",
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": json.dumps(TRIAGE_ANALYSIS)},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 400, "completion_tokens": 180, "total_tokens": 580}
+    }
+
+
+def make_openai_handler(profile):
+    class OpenAIStubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            self.rfile.read(length)
+            if not self.path.endswith('/chat/completions'):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            if not profile.wait():
+                self._send_json(profile.error_status, {"error": {"message": "stub upstream failure"}})
+                return
+            self._send_json(200, _chat_completion_body())
+
+    return OpenAIStubHandler
+
+
+IMAGE_ANALYSIS = ("Raised red patches with clear borders on the forearm, mild surrounding swelling, "
+                  "no visible pus or open wounds. Consistent with contact dermatitis or a fungal rash.")
+
+
+def _generate_content_body():
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": IMAGE_ANALYSIS}]},
+            "finishReason": "STOP",
+            "index": 0
+        }],
+        "usageMetadata": {"promptTokenCount": 300, "candidatesTokenCount": 40, "totalTokenCount": 340},
+        "modelVersion": "gemini-2.0-flash"
+    }
+
+
+def make_gemini_handler(profile):
+    class GeminiStubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            self.rfile.read(length)
+            # e.g. /v1beta/models/gemini-2.0-flash:generateContent
+            if not self.path.split('?')[0].endswith(':generateContent'):
+                self._send_json(404, {"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}})
+                return
+            if not profile.wait():
+                self._send_json(profile.error_status, {"error": {
+                    "code": profile.error_status, "message": "stub upstream failure", "status": "UNAVAILABLE"
+                }})
+                return
+            self._send_json(200, _generate_content_body())
+
+    return GeminiStubHandler
+
+
+def start_stub(handler, port=0):
+    """Start a stub server on a background thread; returns (server, base_url)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def start_openai_stub(profile, port=0):
+    server, base_url = start_stub(make_openai_handler(profile), port)
+    return server, base_url + '/v1'
+
+
+def start_gemini_stub(profile, port=0):
+    return start_stub(make_gemini_handler(profile), port)
+
+
+class StubPipeline:
+    """Stand-in for a local text-generation pipeline with a batched cost model
+
+    Each decode step costs step_ms for the whole batch (streaming the
+    weights, which dominates on CPU) plus row_ms per batch row, and the
+    call sleeps for max_new_tokens steps. Sleeping releases the GIL the
+    way torch kernels do, so concurrent callers behave as with a real model.
+    """
+
+    tokenizer = None
+
+    def __init__(self, step_ms=4.0, row_ms=0.5):
+        self.step_ms = step_ms
+        self.row_ms = row_ms
+        self.calls = 0
+
+    def __call__(self, inputs, max_new_tokens=32, batch_size=1, **kwargs):
+        batch = inputs if isinstance(inputs, list) else [inputs]
+        self.calls += 1
+        time.sleep(max_new_tokens * (self.step_ms + self.row_ms * len(batch)) / 1000.0)
+        outputs = [[{"generated_text": json.dumps(TRIAGE_ANALYSIS)}] for _ in batch]
+        return outputs if isinstance(inputs, list) else outputs[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the OpenAI-compatible and Gemini stub upstreams")
+    parser.add_argument('--port', type=int, default=8901)
+    parser.add_argument('--gemini-port', type=int, default=8902)
+    parser.add_argument('--latency-ms', type=float, default=500)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--error-status', type=int, default=500)
+    args = parser.parse_args()
+
+    profile = StubProfile(args.latency_ms, args.jitter_ms, args.error_rate, error_status=args.error_status)
+    server, base_url = start_openai_stub(profile, args.port)
+    gemini_server, gemini_url = start_gemini_stub(profile, args.gemini_port)
+    print(f"OpenAI stub listening on {base_url} (HF_ROUTER_BASE_URL)")
+    print(f"Gemini stub listening on {gemini_url} (GEMINI_BASE_URL)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        gemini_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
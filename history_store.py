@@ -0,0 +1,226 @@
+"""Server-side triage history shared by every device in a clinic.
+
+Records are the scan objects js/app.js keeps in its history (id, date,
+riskLevel, symptoms, aiResponse, ...), stored as JSON alongside indexed
+columns for the fields we filter on. Each record is keyed by the device
+that created it plus its client id.
+
+Delta sync: every insert or update gets the next value of a store-wide
+version counter. A device sends the records changed since its last sync
+and the sync token it was given last time; it gets back the records
+other writers changed after that token and a new token. Deletions are
+kept as tombstones so they propagate too. When two writers change the
+same record, the one with the later updated_at wins.
+
+SQLite runs in WAL mode: writes go through one connection under a lock
+and every reader thread has its own connection, so queries are not
+blocked behind a bulk upload.
+"""
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+MAX_PAGE_SIZE = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS triage_history (
+    device_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    patient_id TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    risk_level TEXT,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (device_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_history_version ON triage_history(version);
+CREATE INDEX IF NOT EXISTS idx_history_created ON triage_history(created_at, device_id, id);
+CREATE INDEX IF NOT EXISTS idx_history_device ON triage_history(device_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_history_patient ON triage_history(patient_id, created_at, device_id, id)
+    WHERE patient_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_history_risk ON triage_history(risk_level, created_at, device_id, id);
+CREATE TABLE IF NOT EXISTS history_sync (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO history_sync (name, value) VALUES ('version', 0);
+"""
+
+# Newer updated_at wins; equal timestamps keep the stored copy
+UPSERT = """
+INSERT INTO triage_history
+    (device_id, id, patient_id, created_at, updated_at, risk_level, deleted, version, record)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (device_id, id) DO UPDATE SET
+    patient_id = excluded.patient_id,
+    created_at = excluded.created_at,
+    updated_at = excluded.updated_at,
+    risk_level = excluded.risk_level,
+    deleted = excluded.deleted,
+    version = excluded.version,
+    record = excluded.record
+WHERE excluded.updated_at > triage_history.updated_at
+"""
+
+
+class HistoryRecordError(ValueError):
+    """A history record that cannot be stored"""
+
+
+def normalize_timestamp(value):
+    """ISO 8601 (or epoch milliseconds) to a sortable UTC string like 2024-05-01T09:30:00.000Z"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        moment = datetime.fromtimestamp(value / 1000, timezone.utc)
+    elif isinstance(value, str) and value:
+        try:
+            moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            raise HistoryRecordError(f"invalid timestamp: {value!r}")
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+    else:
+        raise HistoryRecordError(f"invalid timestamp: {value!r}")
+    return moment.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.') + f"{moment.microsecond // 1000:03d}Z"
+
+
+def record_row(record, device_id):
+    """Indexed columns plus JSON for one client record; the version is filled in at write time"""
+    if not isinstance(record, dict):
+        raise HistoryRecordError("record must be an object")
+    record_id = record.get('id')
+    if record_id is None or record_id == '':
+        raise HistoryRecordError("record is missing id")
+    device_id = str(record.get('device_id') or device_id)
+    created_at = normalize_timestamp(record.get('date') or record.get('created_at'))
+    updated = record.get('updated_at') or record.get('updatedAt')
+    updated_at = normalize_timestamp(updated) if updated else created_at
+    ai_response = record.get('aiResponse') if isinstance(record.get('aiResponse'), dict) else {}
+    risk_level = record.get('riskLevel') or record.get('risk_level') or ai_response.get('risk_level')
+    patient_id = record.get('patient_id') or record.get('patientId')
+    deleted = bool(record.get('deleted'))
+    stored = dict(record, id=record_id, device_id=device_id, updated_at=updated_at)
+    if deleted:
+        stored = {'id': record_id, 'device_id': device_id, 'date': record.get('date') or record.get('created_at'),
+                  'updated_at': updated_at, 'deleted': True}
+    return [device_id, str(record_id), str(patient_id) if patient_id else None, created_at, updated_at,
+            str(risk_level) if risk_level else None, int(deleted), None,
+            json.dumps(stored, separators=(',', ':'))]
+
+
+class HistoryStore:
+    """SQLite (WAL) store of triage history with filtered pagination and delta sync"""
+
+    def __init__(self, path):
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+        self._writer = self._connect()
+        self._writer.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def ingest(self, records, device_id):
+        """Upsert a batch of client records in one transaction.
+
+        Returns (accepted, stale, rejected, first_version, last_version);
+        rejected is a list of {"index", "error"} for records that were skipped.
+        """
+        rows, rejected = [], []
+        for index, record in enumerate(records):
+            try:
+                rows.append(record_row(record, device_id))
+            except HistoryRecordError as e:
+                rejected.append({"index": index, "error": str(e)})
+        if not rows:
+            return 0, 0, rejected, None, None
+
+        with self._write_lock:
+            conn = self._writer
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                base = conn.execute("SELECT value FROM history_sync WHERE name = 'version'").fetchone()[0]
+                for offset, row in enumerate(rows, start=1):
+                    row[7] = base + offset
+                before = conn.total_changes
+                conn.executemany(UPSERT, rows)
+                accepted = conn.total_changes - before
+                conn.execute("UPDATE history_sync SET value = ? WHERE name = 'version'", (base + len(rows),))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return accepted, len(rows) - accepted, rejected, base + 1, base + len(rows)
+
+    def current_version(self):
+        return self._reader().execute("SELECT value FROM history_sync WHERE name = 'version'").fetchone()[0]
+
+    def changes_since(self, since, limit, exclude=None):
+        """Records (tombstones included) with version > since, oldest first.
+
+        exclude is an inclusive (first, last) version range to leave out, used
+        so a device does not get back the records it just uploaded.
+        Returns (records, sync_token, has_more).
+        """
+        conn = self._reader()
+        query = "SELECT version, record FROM triage_history WHERE version > ?"
+        params = [since]
+        if exclude and exclude[0] is not None:
+            query += " AND version NOT BETWEEN ? AND ?"
+            params += list(exclude)
+        # One read snapshot, so a write committed between the two SELECTs
+        # cannot be skipped by the token
+        conn.execute("BEGIN")
+        try:
+            rows = conn.execute(query + " ORDER BY version LIMIT ?", params + [limit + 1]).fetchall()
+            current = conn.execute("SELECT value FROM history_sync WHERE name = 'version'").fetchone()[0]
+        finally:
+            conn.execute("COMMIT")
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        token = rows[-1][0] if has_more else max(since, current)
+        return [json.loads(record) for _, record in rows], token, has_more
+
+    def query(self, device_id=None, patient_id=None, risk_level=None, since=None, until=None,
+              limit=50, cursor=None):
+        """Newest-first page of live records matching the filters.
+
+        The cursor is the (created_at, device_id, id) of the last record on the
+        previous page, so deep pages cost the same as the first one.
+        Returns (records, next_cursor).
+        """
+        clauses, params = ["deleted = 0"], []
+        for column, value in (('device_id', device_id), ('patient_id', patient_id), ('risk_level', risk_level)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since:
+            clauses.append("created_at >= ?")
+            params.append(normalize_timestamp(since))
+        if until:
+            clauses.append("created_at < ?")
+            params.append(normalize_timestamp(until))
+        if cursor:
+            clauses.append("(created_at, device_id, id) < (?, ?, ?)")
+            params.extend(cursor)
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        rows = self._reader().execute(
+            f"SELECT created_at, device_id, id, record FROM triage_history WHERE {' AND '.join(clauses)} "
+            "ORDER BY created_at DESC, device_id DESC, id DESC LIMIT ?",
+            params + [limit + 1]
+        ).fetchall()
+        next_cursor = list(rows[limit - 1][:3]) if len(rows) > limit else None
+        return [json.loads(row[3]) for row in rows[:limit]], next_cursor
+
+    def stats(self):
+        # Health checks poll this, so no COUNT(*) over the table
+        return {"backend": "sqlite", "path": self.path, "version": self.current_version()}
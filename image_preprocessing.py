@@ -0,0 +1,100 @@
+"""Bounded-memory preprocessing of uploaded medical images.
+
+Kept separate from app.py and importing only Pillow, so the process pool
+that runs it starts quickly and never loads the model backends.
+"""
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+# Longest side of the image sent for analysis
+MAX_IMAGE_SIZE = 1024
+
+# Largest image accepted, in pixels (a 108 MP phone photo is ~108,000,000)
+DEFAULT_MAX_PIXELS = 120_000_000
+
+
+def set_max_pixels(max_pixels):
+    """Make Pillow refuse anything far beyond max_pixels on every code path too
+
+    Pillow's limit is process-wide, so the server calls this with its
+    configured limit and each pool worker calls it as its initializer.
+    """
+    Image.MAX_IMAGE_PIXELS = max_pixels
+
+
+set_max_pixels(DEFAULT_MAX_PIXELS)
+
+
+def preprocess_image(image_bytes, max_pixels=DEFAULT_MAX_PIXELS, max_size=MAX_IMAGE_SIZE):
+    """Decode, downscale and re-encode an upload as JPEG without materializing it at full size"""
+    try:
+        # Opening only reads the header, so the size check happens before any decoding
+        image = Image.open(io.BytesIO(image_bytes))
+        if image.width * image.height > max_pixels:
+            return {
+                "success": False,
+                "error": f"Image is {image.width}x{image.height}, above the {max_pixels:,} pixel limit"
+            }
+
+        # JPEG can decode directly at 1/2, 1/4 or 1/8 scale, still at least max_size
+        if image.format == 'JPEG':
+            image.draft('RGB', (max_size, max_size))
+
+        # Palette and bilevel images cannot be resampled smoothly; convert those first
+        if image.mode in ('P', '1'):
+            image = image.convert('RGB')
+
+        # Resize if too large, then convert the small image rather than the full one
+        if image.width > max_size or image.height > max_size:
+            image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        # Convert to bytes
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=85)
+        image_data = output.getvalue()
+
+        return {
+            "success": True,
+            "image_data": image_data,
+            "format": "JPEG",
+            "size": f"{image.width}x{image.height}",
+            "file_size_kb": len(image_data) // 1024
+        }
+
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"Error processing image file: {str(e)}"
+        }
+
+
+def difference_hash(image_bytes, hash_size=8):
+    """Return a 64-bit perceptual (difference) hash as hex, stable across JPEG re-encodes"""
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.format == 'JPEG':
+        image.draft('L', (hash_size * 8, hash_size * 8))
+    # One extra column so each row yields hash_size left/right comparisons
+    pixels = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS).tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def create_worker_pool(max_workers, max_pixels=DEFAULT_MAX_PIXELS):
+    """Process pool for preprocess_image with Pillow's limit set to max_pixels
+
+    spawn keeps workers free of the parent's threads and model state. A
+    spawned worker re-runs the parent's main script as __mp_main__ before
+    its first task, so a script that starts this pool must keep its side
+    effects behind a check of __name__ (see the top of app.py).
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=set_max_pixels, initargs=(max_pixels,))
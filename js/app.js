@@ -70,6 +70,11 @@ function initializeMainApp() {
     // Load previous scans
     loadPreviousScans();
     
+    // Offline triage rules; re-send offline assessments whenever the connection returns
+    loadTriageRules();
+    window.addEventListener('online', flushPendingTriage);
+    flushPendingTriage();
+    
     // Navbar event listeners
     const menuIcon = document.getElementById('menu-icon');
     const closeNavbar = document.getElementById('close-navbar');
@@ -341,6 +346,8 @@ function toggleAccordion(item) {
 
 // Reset triage form and show it again
 function resetTriageForm() {
+    displayedScanId = null;
+    
     // Reset the form
     const form = document.getElementById('triage-form');
     if (form) {
@@ -412,42 +419,6 @@ async function analyzeTriage() {
     let imageAnalysis = null;
     
     try {
-        // First, analyze image if uploaded
-        if (imageInput.files && imageInput.files.length > 0) {
-            console.log('Image detected, analyzing...');
-            
-            // Update loading message
-            updateLoadingMessage('Analyzing image with AI...');
-            
-            const imageFile = imageInput.files[0];
-            const formData = new FormData();
-            formData.append('image', imageFile);
-            formData.append('prompt', 'What do you see in this medical image? Describe any symptoms, conditions, rashes, wounds, swelling, discoloration, or medical findings visible. Focus on medically relevant observations that could help with symptom assessment.');
-            
-            const imageResponse = await fetch('/api/analyze_image', {
-                method: 'POST',
-                body: formData
-            });
-            
-            if (imageResponse.ok) {
-                const imageResult = await imageResponse.json();
-                if (imageResult.success) {
-                    imageAnalysis = imageResult.analysis;
-                    console.log('Image analysis successful:', imageAnalysis);
-                } else {
-                    console.warn('Image analysis failed:', imageResult.error);
-                    if (imageResult.fallback_analysis) {
-                        imageAnalysis = imageResult.fallback_analysis;
-                    }
-                }
-            } else {
-                console.warn('Image analysis request failed:', imageResponse.status);
-            }
-        }
-        
-        // Update loading message for symptom analysis
-        updateLoadingMessage('Analyzing symptoms with GPT-OSS...');
-        
         // Create comprehensive form data object for API
         const apiData = {
             age: age,
@@ -459,33 +430,32 @@ async function analyzeTriage() {
                 heart_rate: heartRate
             }
         };
+        const imageFile = imageInput.files && imageInput.files.length > 0 ? imageInput.files[0] : null;
         
-        // Add image analysis to the data if available
-        if (imageAnalysis) {
-            apiData.image_analysis = imageAnalysis;
-            console.log('Adding image analysis to API data:', imageAnalysis.substring(0, 100) + '...');
-        } else {
-            console.log('No image analysis available to add to API data');
+        let result;
+        try {
+            result = await requestTriage(apiData, imageFile);
+        } catch (error) {
+            // No connection: answer instantly from the built-in rules, upgrade once back online
+            if (!triageRules) {
+                throw error;
+            }
+            console.warn('Server unreachable, using offline triage rules:', error);
+            result = evaluateTriageRules(apiData, Boolean(imageFile));
         }
-
-        // Call the backend API for AI analysis (direct web interface)
-        const response = await fetch('/api/analyze', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify(apiData)
-        });
-
-        if (!response.ok) {
-            throw new Error('Network response was not ok');
+        imageAnalysis = result.image_findings || null;
+        if (result.image_error) {
+            console.warn('Image analysis failed:', result.image_error);
         }
-
-        const result = await response.json();
         
         // Display results from AI analysis
         displayAIResults(result);
         
+        // Emergency fast-path and image-aware answers arrive after the first result; fetch them afterwards
+        if (result.refinement === 'pending' && result.request_id) {
+            pollRefinement(result.request_id);
+        }
+        
         // Ensure risk level is valid, fallback to calculated risk if undefined
         const validRiskLevel = result.risk_level || calculateRiskLevel(
             parseInt(document.getElementById('age').value) || 0,
@@ -501,7 +471,13 @@ async function analyzeTriage() {
             ...result,
             imageAnalysis: imageAnalysis
         };
-        saveScanToHistory(validRiskLevel, scanData);
+        saveScanToHistory(validRiskLevel, scanData).then(({ scan, saved }) => {
+            // A scan that was not stored has no history record to reconcile later
+            displayedScanId = saved ? scan.id : null;
+            if (saved && result.offline) {
+                queuePendingTriage(scan.id, apiData);
+            }
+        });
         
         // Debug: Check if we had image analysis to display
         console.log('Final result for display:', {
@@ -514,8 +490,7 @@ async function analyzeTriage() {
         console.error('Error:', error);
         alert('Error analyzing symptoms. Please check your connection and try again.');
         
-        // Do NOT use emulator/fallback analysis - only show error
-        // The user should retry with proper internet connection
+        // Without the offline rules there is nothing safe to show; the user should retry
         
     } finally {
         // Hide loading overlay
@@ -537,6 +512,316 @@ async function analyzeTriage() {
     }
 }
 
+// Poll for the detailed AI assessment that follows an emergency fast-path response
+async function pollRefinement(requestId, attempt = 0) {
+    const maxAttempts = 30;
+    try {
+        const response = await fetch(`/api/analyze/${requestId}`);
+        if (response.status === 202 && attempt < maxAttempts) {
+            setTimeout(() => pollRefinement(requestId, attempt + 1), 2000);
+            return;
+        }
+        if (!response.ok) {
+            console.warn('Detailed assessment unavailable:', response.status);
+            return;
+        }
+        const refinement = await response.json();
+        if (refinement.status === 'complete' && refinement.result) {
+            displayAIResults(refinement.result);
+        }
+    } catch (error) {
+        console.warn('Failed to fetch detailed assessment:', error);
+    }
+}
+
+// POST a triage request (multimodal when there is an image); throws when the server can't be reached
+async function requestTriage(apiData, imageFile = null) {
+    if (!navigator.onLine) {
+        throw new Error('Browser is offline');
+    }
+    let response;
+    if (imageFile) {
+        // One request: the server analyzes the image and the symptoms concurrently
+        console.log('Image detected, analyzing together with symptoms...');
+        updateLoadingMessage('Analyzing image and symptoms with AI...');
+        
+        const formData = new FormData();
+        formData.append('image', imageFile);
+        formData.append('prompt', 'What do you see in this medical image? Describe any symptoms, conditions, rashes, wounds, swelling, discoloration, or medical findings visible. Focus on medically relevant observations that could help with symptom assessment.');
+        formData.append('age', apiData.age);
+        formData.append('sex', apiData.sex);
+        formData.append('symptoms', apiData.symptoms);
+        formData.append('duration', apiData.duration);
+        formData.append('vitals', JSON.stringify(apiData.vitals));
+        
+        response = await fetch('/api/analyze_multimodal', {
+            method: 'POST',
+            body: formData
+        });
+    } else {
+        updateLoadingMessage('Analyzing symptoms with GPT-OSS...');
+        
+        // Call the backend API for AI analysis (direct web interface)
+        response = await fetch('/api/analyze', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(apiData)
+        });
+    }
+
+    if (!response.ok) {
+        throw new Error('Network response was not ok');
+    }
+    return response.json();
+}
+
+// ============================= 
+// OFFLINE TRIAGE ENGINE
+// ============================= 
+
+// Evaluates the ruleset exported from triage_rules.py, the same rules the
+// server's MockAIService applies, so there is an answer without a
+// connection. index.html preloads the ruleset from a fingerprinted,
+// immutable URL and a copy is kept in localStorage for later offline use.
+// Offline results are queued and re-sent to the server when the network
+// returns; the server's answer then replaces them on screen and in history.
+const TRIAGE_RULES_KEY = 'mehelper-triage-rules';
+const TRIAGE_RULES_SCHEMA = 2;
+const PENDING_TRIAGE_KEY = 'mehelper-pending-triage';
+
+let triageRules = null;
+let triageMatcher = null;
+let pendingTriageFlush = null;
+let displayedScanId = null;
+
+function useTriageRules(rules) {
+    if (!rules || rules.schema !== TRIAGE_RULES_SCHEMA) {
+        return false;
+    }
+    triageRules = rules;
+    triageMatcher = buildKeywordMatcher(rules.token_pattern, rules.keywords, rules.inflection_suffixes, rules.inflection_min_length);
+    return true;
+}
+
+async function loadTriageRules() {
+    try {
+        useTriageRules(JSON.parse(localStorage.getItem(TRIAGE_RULES_KEY)));
+    } catch (error) {
+        console.warn('Discarding unreadable triage rules:', error);
+    }
+    const link = document.getElementById('triage-rules');
+    try {
+        const response = await fetch(link ? link.getAttribute('href') : 'js/triage-rules.json');
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        const rules = await response.json();
+        if ((!triageRules || triageRules.version !== rules.version) && useTriageRules(rules)) {
+            localStorage.setItem(TRIAGE_RULES_KEY, JSON.stringify(rules));
+        }
+    } catch (error) {
+        if (!triageRules) {
+            console.warn('Triage rules unavailable, offline assessment disabled:', error);
+        }
+    }
+}
+
+// Word-start phrase matcher with the same results as KeywordMatcher.match in triage_rules.py
+function buildKeywordMatcher(tokenPattern, categories, inflectionSuffixes = [], inflectionMinLength = Infinity) {
+    const tokenize = text => (text || '').toLowerCase().replace(/\u2019/g, "'").match(new RegExp(tokenPattern, 'g')) || [];
+    const root = { next: new Map(), hits: [] };
+    const keywordWords = new Set();
+    let maxWords = 0;
+    let rank = 0;
+    Object.entries(categories).forEach(([category, keywords]) => {
+        keywords.forEach(keyword => {
+            const words = tokenize(keyword);
+            if (words.length === 0) {
+                return;
+            }
+            let node = root;
+            words.forEach(word => {
+                if (!node.next.has(word)) {
+                    node.next.set(word, { next: new Map(), hits: [] });
+                }
+                node = node.next.get(word);
+                keywordWords.add(word);
+            });
+            node.hits.push([rank++, keyword, category]);
+            maxWords = Math.max(maxWords, words.length);
+        });
+    });
+
+    // Keyword words a text word matches, longest first: itself, or a long enough keyword word plus one inflection
+    const formsCache = new Map();
+    const forms = token => {
+        let found = formsCache.get(token);
+        if (!found) {
+            const candidates = new Set([token]);
+            inflectionSuffixes.forEach(suffix => {
+                if (token.endsWith(suffix)) {
+                    const stem = token.slice(0, token.length - suffix.length);
+                    candidates.add(stem);
+                    if (suffix === 'ing') {
+                        candidates.add(stem + 'e');
+                    }
+                }
+            });
+            found = [...candidates]
+                .filter(word => keywordWords.has(word) && (word === token || word.length >= inflectionMinLength))
+                .sort((a, b) => b.length - a.length);
+            formsCache.set(token, found);
+        }
+        return found;
+    };
+
+    // category -> keywords found, in order of first appearance
+    return text => {
+        const tokenForms = tokenize(text).map(forms);
+        const grouped = {};
+        tokenForms.forEach((words, start) => {
+            let nodes = words.map(word => root.next.get(word)).filter(Boolean);
+            const found = [];
+            for (let span = 1; nodes.length > 0; span++) {
+                nodes.forEach(node => node.hits.forEach(([order, keyword, category]) => found.push([span, order, keyword, category])));
+                if (span >= maxWords || start + span >= tokenForms.length) {
+                    break;
+                }
+                nodes = nodes.flatMap(node => tokenForms[start + span].map(word => node.next.get(word)).filter(Boolean));
+            }
+            // Shorter phrases first, then keywords in file order
+            found.sort((a, b) => a[0] - b[0] || a[1] - b[1]).forEach(([, , keyword, category]) => {
+                const list = grouped[category] || (grouped[category] = []);
+                if (!list.includes(keyword)) {
+                    list.push(keyword);
+                }
+            });
+        });
+        return grouped;
+    };
+}
+
+function vitalsNote(rule, value) {
+    const band = rule.bands.find(([direction, limit]) => direction === 'above' ? value > limit : value < limit);
+    return `${rule.label.replace('{value}', value)} → ${band ? band[2] : rule.default}`;
+}
+
+// The /api/analyze response the server's rules would give for apiData
+function evaluateTriageRules(apiData, imageWasUploaded = false, rules = triageRules) {
+    const symptoms = (apiData.symptoms || '').toLowerCase();
+    const vitals = apiData.vitals || {};
+    const age = apiData.age ?? rules.default_age;
+    const matches = triageMatcher(symptoms);
+    const emergencyKeywords = matches.emergency || [];
+
+    // Emergency keywords take the server's fast path straight to "emergency"
+    let riskLevel = 'low';
+    const outOfRange = ([name, limits]) => vitals[name] && (vitals[name] > limits.above || vitals[name] < limits.below);
+    if (emergencyKeywords.length > 0 || matches.risk_emergency) {
+        riskLevel = 'emergency';
+    } else if (matches.risk_high || Object.entries(rules.risk_vitals).some(outOfRange)) {
+        riskLevel = 'high';
+    } else if (age < rules.risk_age.under || age > rules.risk_age.over || matches.duration) {
+        riskLevel = 'moderate';
+    }
+
+    let conditions = (matches.condition || []).flatMap(keyword => rules.conditions[keyword]);
+    if (conditions.length === 0) {
+        conditions = rules.default_conditions;
+    }
+
+    const firstAid = [...rules.base_first_aid];
+    Object.keys(rules.first_aid).forEach(keyword => {
+        if ((matches.first_aid || []).includes(keyword)) {
+            firstAid.push(...rules.first_aid[keyword]);
+        }
+    });
+
+    const vitalsNotes = ['temperature', 'heart_rate']
+        .filter(name => vitals[name])
+        .map(name => vitalsNote(rules.vitals_bands[name], vitals[name]));
+
+    const result = {
+        risk_level: riskLevel,
+        risk_assessment: rules.risk_assessments[riskLevel] || rules.risk_assessments.default,
+        possible_conditions: [...new Set(conditions)].slice(0, rules.max_conditions),
+        first_aid_measures: firstAid,
+        immediate_actions: [rules.next_actions[riskLevel] || rules.next_actions.default],
+        danger_signs: [...rules.danger_signs, ...(age < rules.child_age ? rules.child_danger_signs : [])],
+        vitals_analysis: [vitalsNotes.length > 0 ? vitalsNotes.join('; ') : rules.no_vitals],
+        timeline_recommendations: rules.timeline,
+        offline: true,
+        rules_version: rules.version
+    };
+    if (emergencyKeywords.length > 0) {
+        result.emergency_keywords = emergencyKeywords;
+        result.fast_path = true;
+    }
+    if (imageWasUploaded) {
+        result.image_message = 'The image could not be analyzed offline. Your symptoms will be re-assessed by the server when your connection returns; describe anything visible in the image in the symptom field.';
+    }
+    return result;
+}
+
+function pendingTriage() {
+    try {
+        return JSON.parse(localStorage.getItem(PENDING_TRIAGE_KEY)) || [];
+    } catch (error) {
+        return [];
+    }
+}
+
+function queuePendingTriage(scanId, apiData) {
+    const pending = pendingTriage().filter(entry => entry.scanId !== scanId);
+    pending.push({ scanId, apiData });
+    localStorage.setItem(PENDING_TRIAGE_KEY, JSON.stringify(pending));
+}
+
+// Re-send offline assessments and replace them with the server's answers
+function flushPendingTriage() {
+    if (pendingTriageFlush || !navigator.onLine || pendingTriage().length === 0) {
+        return pendingTriageFlush;
+    }
+    pendingTriageFlush = (async () => {
+        for (const entry of pendingTriage()) {
+            let result;
+            try {
+                result = await requestTriage(entry.apiData);
+            } catch (error) {
+                // Still unreachable; the next 'online' event retries
+                console.warn('Offline assessment not upgraded yet:', error);
+                return;
+            }
+            const scan = await getScan(entry.scanId);
+            if (scan) {
+                const riskLevel = result.risk_level || scan.riskLevel;
+                await updateScan({
+                    ...scan,
+                    riskLevel,
+                    guidance: firstAidGuidance[riskLevel],
+                    aiResponse: { ...result, imageAnalysis: result.image_findings || null },
+                    updatedAt: new Date().toISOString()
+                });
+            }
+            localStorage.setItem(PENDING_TRIAGE_KEY, JSON.stringify(
+                pendingTriage().filter(item => item.scanId !== entry.scanId)
+            ));
+            if (displayedScanId === entry.scanId) {
+                displayAIResults(result);
+                if (result.refinement === 'pending' && result.request_id) {
+                    pollRefinement(result.request_id);
+                }
+            }
+        }
+    })().finally(() => {
+        pendingTriageFlush = null;
+        loadPreviousScans();
+    });
+    return pendingTriageFlush;
+}
+
 // Calculate risk level based on inputs
 function calculateRiskLevel(age, symptomsText, selectedChips, duration, temperature, heartRate) {
     // Check for emergency keywords in symptoms text
@@ -645,15 +930,15 @@ function updateLoadingMessage(message, submessage = 'This may take a few moments
 }
 
 // Display triage result for history items
-function displayResult(scanId) {
-    // Get the actual scan data from history
-    const scans = JSON.parse(localStorage.getItem('mehelper-scans') || '[]');
-    const scan = scans.find(s => s.id === scanId);
+async function displayResult(scanId) {
+    // Load the full record (with the AI response) only when it is opened
+    const scan = await getScan(scanId);
     
     if (!scan) {
         console.error('Scan not found in history');
         return;
     }
+    displayedScanId = scan.id;
     
     // Create proper form data from scan
     const formData = {
@@ -811,7 +1096,222 @@ function fallbackShare(locationMessage) {
     }
 }
 
-// Local Storage Functions for Scan History
+// Scan history storage (IndexedDB)
+// The history list only reads small summaries through a date index, one
+// page at a time; full records with the AI response live in a separate
+// store and are read when a scan is opened. Browsers without IndexedDB
+// (some private modes) keep using the old localStorage array.
+const HISTORY_DB_NAME = 'mehelper-history';
+const HISTORY_DB_VERSION = 1;
+const HISTORY_PAGE_SIZE = 20;
+const HISTORY_MAX_SCANS = 500;
+const HISTORY_DUPLICATE_WINDOW = 10;
+const LEGACY_HISTORY_KEY = 'mehelper-scans';
+
+let historyDBPromise = null;
+let historyLoadGeneration = 0;
+
+function requestToPromise(request) {
+    return new Promise((resolve, reject) => {
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+function transactionDone(transaction) {
+    return new Promise((resolve, reject) => {
+        transaction.oncomplete = () => resolve();
+        transaction.onerror = () => reject(transaction.error);
+        transaction.onabort = () => reject(transaction.error);
+    });
+}
+
+// Fields the history list and duplicate check need
+function scanSummary(scan) {
+    return {
+        id: scan.id,
+        date: scan.date,
+        age: scan.age,
+        sex: scan.sex,
+        symptoms: scan.symptoms,
+        riskLevel: scan.riskLevel,
+        temperature: scan.temperature,
+        heartRate: scan.heartRate
+    };
+}
+
+function openHistoryDB() {
+    if (!historyDBPromise) {
+        historyDBPromise = new Promise((resolve, reject) => {
+            if (!window.indexedDB) {
+                reject(new Error('IndexedDB not supported'));
+                return;
+            }
+            const request = indexedDB.open(HISTORY_DB_NAME, HISTORY_DB_VERSION);
+            request.onupgradeneeded = () => {
+                const db = request.result;
+                db.createObjectStore('scans', { keyPath: 'id' });
+                const summaries = db.createObjectStore('summaries', { keyPath: 'id' });
+                // [date, id] keeps the order stable for scans saved in the same millisecond
+                summaries.createIndex('date', ['date', 'id']);
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        }).then(migrateLegacyHistory).catch(error => {
+            console.warn('IndexedDB unavailable, keeping scan history in localStorage:', error);
+            return null;
+        });
+    }
+    return historyDBPromise;
+}
+
+// One-time move of the old localStorage array into IndexedDB
+async function migrateLegacyHistory(db) {
+    const legacy = localStorage.getItem(LEGACY_HISTORY_KEY);
+    if (legacy === null) {
+        return db;
+    }
+    let scans = [];
+    try {
+        scans = JSON.parse(legacy) || [];
+    } catch (error) {
+        console.warn('Discarding unreadable scan history:', error);
+    }
+    const transaction = db.transaction(['scans', 'summaries'], 'readwrite');
+    scans.filter(scan => scan && scan.id !== undefined && scan.date).forEach(scan => {
+        transaction.objectStore('scans').put(scan);
+        transaction.objectStore('summaries').put(scanSummary(scan));
+    });
+    await transactionDone(transaction);
+    // Only drop the old copy once every scan is committed to IndexedDB
+    localStorage.removeItem(LEGACY_HISTORY_KEY);
+    return db;
+}
+
+function legacyScans() {
+    return JSON.parse(localStorage.getItem(LEGACY_HISTORY_KEY) || '[]');
+}
+
+// Newest-first page of summaries older than `after` ([date, id] of the last one shown)
+async function getHistoryPage(after, limit = HISTORY_PAGE_SIZE) {
+    const db = await openHistoryDB();
+    if (!db) {
+        const scans = legacyScans();
+        const start = after ? scans.findIndex(scan => scan.id === after[1]) + 1 : 0;
+        const page = scans.slice(start, start + limit).map(scanSummary);
+        const last = page[page.length - 1];
+        return { scans: page, next: start + limit < scans.length && last ? [last.date, last.id] : null };
+    }
+    const index = db.transaction('summaries', 'readonly').objectStore('summaries').index('date');
+    const range = after ? IDBKeyRange.upperBound(after, true) : null;
+    const page = [];
+    return new Promise((resolve, reject) => {
+        const request = index.openCursor(range, 'prev');
+        request.onsuccess = () => {
+            const cursor = request.result;
+            if (cursor && page.length < limit) {
+                page.push(cursor.value);
+                cursor.continue();
+                return;
+            }
+            // A cursor still open after `limit` summaries means there are older ones
+            const last = page[page.length - 1];
+            resolve({ scans: page, next: cursor && last ? [last.date, last.id] : null });
+        };
+        request.onerror = () => reject(request.error);
+    });
+}
+
+async function getScan(id) {
+    const db = await openHistoryDB();
+    if (!db) {
+        return legacyScans().find(scan => scan.id === id);
+    }
+    return requestToPromise(db.transaction('scans', 'readonly').objectStore('scans').get(id));
+}
+
+function isDuplicateScan(scan, recent) {
+    return recent.some(existingScan =>
+        Math.abs(new Date(existingScan.date) - new Date(scan.date)) < 1000 ||
+        (existingScan.age === scan.age &&
+         existingScan.sex === scan.sex &&
+         existingScan.symptoms === scan.symptoms &&
+         existingScan.riskLevel === scan.riskLevel &&
+         existingScan.temperature === scan.temperature &&
+         existingScan.heartRate === scan.heartRate)
+    );
+}
+
+// Store a scan unless it duplicates a recent one; returns whether it was saved
+async function saveScan(scan) {
+    const { scans: recent } = await getHistoryPage(null, HISTORY_DUPLICATE_WINDOW);
+    if (isDuplicateScan(scan, recent)) {
+        return false;
+    }
+
+    const db = await openHistoryDB();
+    if (!db) {
+        // localStorage has a small size cap, so only the latest few are kept
+        const scans = legacyScans();
+        scans.unshift(scan);
+        localStorage.setItem(LEGACY_HISTORY_KEY, JSON.stringify(scans.slice(0, HISTORY_DUPLICATE_WINDOW)));
+        return true;
+    }
+
+    const transaction = db.transaction(['scans', 'summaries'], 'readwrite');
+    const scansStore = transaction.objectStore('scans');
+    const summaries = transaction.objectStore('summaries');
+    scansStore.put(scan);
+    summaries.put(scanSummary(scan));
+
+    // Drop the oldest scans beyond HISTORY_MAX_SCANS
+    summaries.count().onsuccess = event => {
+        let excess = event.target.result - HISTORY_MAX_SCANS;
+        if (excess <= 0) {
+            return;
+        }
+        summaries.index('date').openKeyCursor().onsuccess = cursorEvent => {
+            const cursor = cursorEvent.target.result;
+            if (!cursor || excess <= 0) {
+                return;
+            }
+            scansStore.delete(cursor.primaryKey);
+            summaries.delete(cursor.primaryKey);
+            excess -= 1;
+            cursor.continue();
+        };
+    };
+    await transactionDone(transaction);
+    return true;
+}
+
+async function deleteScan(id) {
+    const db = await openHistoryDB();
+    if (!db) {
+        localStorage.setItem(LEGACY_HISTORY_KEY, JSON.stringify(legacyScans().filter(scan => scan.id !== id)));
+        return;
+    }
+    const transaction = db.transaction(['scans', 'summaries'], 'readwrite');
+    transaction.objectStore('scans').delete(id);
+    transaction.objectStore('summaries').delete(id);
+    await transactionDone(transaction);
+}
+
+// Replace a stored scan, e.g. an offline assessment upgraded to the server's
+async function updateScan(scan) {
+    const db = await openHistoryDB();
+    if (!db) {
+        const scans = legacyScans().map(existing => existing.id === scan.id ? scan : existing);
+        localStorage.setItem(LEGACY_HISTORY_KEY, JSON.stringify(scans));
+        return;
+    }
+    const transaction = db.transaction(['scans', 'summaries'], 'readwrite');
+    transaction.objectStore('scans').put(scan);
+    transaction.objectStore('summaries').put(scanSummary(scan));
+    await transactionDone(transaction);
+}
+
+// Scan History
 function saveScanToHistory(riskLevel, aiResponse = null) {
     // Get form data directly from elements to ensure we get the values
     const age = document.getElementById('age').value;
@@ -843,59 +1343,75 @@ function saveScanToHistory(riskLevel, aiResponse = null) {
         aiResponse: aiResponse
     };
     
-    // Get existing scans or initialize empty array
-    let scans = JSON.parse(localStorage.getItem('mehelper-scans') || '[]');
-    
-    // Check for duplicate scan based on timestamp (within 1 second) AND exact data match
-    const isDuplicate = scans.some(existingScan => 
-        Math.abs(new Date(existingScan.date) - new Date(scan.date)) < 1000 ||
-        (existingScan.age === scan.age &&
-         existingScan.sex === scan.sex &&
-         existingScan.symptoms === scan.symptoms &&
-         existingScan.riskLevel === scan.riskLevel &&
-         existingScan.temperature === scan.temperature &&
-         existingScan.heartRate === scan.heartRate)
-    );
-    
-    // Only add if not a duplicate
-    if (!isDuplicate) {
-        // Add new scan to beginning of array
-        scans.unshift(scan);
-        
-        // Limit to 10 most recent scans
-        if (scans.length > 10) {
-            scans = scans.slice(0, 10);
-        }
-        
-        // Save to local storage
-        localStorage.setItem('mehelper-scans', JSON.stringify(scans));
-    }
-    
-    // Refresh the history list
-    loadPreviousScans();
+    // Save, then refresh the history list; resolves to the scan and whether it was stored,
+    // which it is not when it duplicates a recent scan or the save failed
+    return saveScan(scan)
+        .catch(error => {
+            console.error('Failed to save scan to history:', error);
+            return false;
+        })
+        .then(saved => {
+            loadPreviousScans();
+            return { scan, saved };
+        });
 }
 
-function loadPreviousScans() {
-    // Get scans from local storage
-    const scans = JSON.parse(localStorage.getItem('mehelper-scans') || '[]');
+async function loadPreviousScans() {
+    // A newer load (e.g. after a save) replaces any that is still running
+    const generation = ++historyLoadGeneration;
+    let page;
+    try {
+        page = await getHistoryPage(null);
+    } catch (error) {
+        console.error('Failed to load scan history:', error);
+        return;
+    }
+    if (generation !== historyLoadGeneration) {
+        return;
+    }
     
     // Clear history list
     historyList.innerHTML = '';
     
     // Show no history text if no scans
-    if (scans.length === 0) {
+    if (page.scans.length === 0) {
         noHistoryText.classList.remove('hidden');
         return;
     }
     
     // Hide no history text
     noHistoryText.classList.add('hidden');
-    
-    // Add scans to history list
-    scans.forEach(scan => {
+    appendHistoryPage(page, generation);
+}
+
+// Add one page of history items, plus a button that loads the next page
+function appendHistoryPage(page, generation) {
+    page.scans.forEach(scan => {
         const historyItem = createHistoryItem(scan);
         historyList.appendChild(historyItem);
     });
+    
+    if (!page.next) {
+        return;
+    }
+    const moreButton = document.createElement('button');
+    moreButton.className = 'btn history-more';
+    moreButton.textContent = 'Show older scans';
+    moreButton.addEventListener('click', async (e) => {
+        e.stopPropagation();
+        moreButton.disabled = true;
+        try {
+            const nextPage = await getHistoryPage(page.next);
+            if (generation === historyLoadGeneration) {
+                moreButton.remove();
+                appendHistoryPage(nextPage, generation);
+            }
+        } catch (error) {
+            console.error('Failed to load older scans:', error);
+            moreButton.disabled = false;
+        }
+    });
+    historyList.appendChild(moreButton);
 }
 
 function createHistoryItem(scan) {
@@ -1013,23 +1529,28 @@ function createHistoryItem(scan) {
 }
 
 // Function to delete a history item
-function deleteHistoryItem(id) {
-    // Get existing scans
-    let scans = JSON.parse(localStorage.getItem('mehelper-scans') || '[]');
-    
-    // Filter out the scan with the given id
-    scans = scans.filter(scan => scan.id !== id);
-    
-    // Save updated scans to local storage
-    localStorage.setItem('mehelper-scans', JSON.stringify(scans));
+async function deleteHistoryItem(id) {
+    try {
+        await deleteScan(id);
+    } catch (error) {
+        console.error('Failed to delete scan:', error);
+        return;
+    }
     
     // Hide all delete buttons
     document.querySelectorAll('.delete-button').forEach(btn => {
         btn.classList.remove('show');
     });
     
-    // Refresh the history list
-    loadPreviousScans();
+    // Remove just this item so older pages already shown stay in place
+    const item = Array.from(historyList.querySelectorAll('.history-item'))
+        .find(element => element.dataset.id === String(id));
+    if (item) {
+        item.remove();
+    }
+    if (!historyList.querySelector('.history-item')) {
+        loadPreviousScans();
+    }
 }
 
 // New 8-Level Triage System Functions
@@ -1201,6 +1722,12 @@ function displayFirstAidMeasures(formData, riskLevel) {
 }
 
 function displayAIResults(aiResult) {
+    // Results from the offline rules say so until the server's answer replaces them
+    const offlineNotice = document.getElementById('offline-notice');
+    if (offlineNotice) {
+        offlineNotice.classList.toggle('hidden', !aiResult.offline);
+    }
+    
     // Update level 2: Initial Assessment - Fix the element selection
     const assessmentBadge = document.getElementById('assessment-badge');
     const conditionSeverity = document.getElementById('condition-severity');
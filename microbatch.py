@@ -0,0 +1,100 @@
+"""Micro-batching of concurrent local generation requests.
+
+Kept free of app imports so benchmarks can drive it with any pipeline.
+"""
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List
+
+
+class MicroBatcher:
+    """Collect generation requests from concurrent threads into batched pipeline calls.
+
+    The worker waits up to window_ms after the first queued request for more
+    to arrive, then runs them as one batch of at most max_batch inputs.
+    Requests are only batched with others that use identical generation
+    settings; shorter outputs are padded by the pipeline and trimmed again,
+    and every caller receives exactly the result a single call would return.
+
+    prepare(tokenizer, generate_kwargs) turns a group's shared settings into
+    the keyword arguments of the batched pipeline call.
+    """
+
+    def __init__(self, pipe, window_ms=20, max_batch=8, single=None, prepare=None):
+        self.pipe = pipe
+        self.single = single
+        self.prepare = prepare or (lambda tokenizer, generate_kwargs: dict(generate_kwargs))
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.batches = 0
+        self.items = 0
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+
+        # Decoder-only models need left padding and a pad token to batch
+        tokenizer = getattr(pipe, 'tokenizer', None)
+        if tokenizer is not None:
+            tokenizer.padding_side = 'left'
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+
+        self._worker = threading.Thread(target=self._run, name='local-microbatch', daemon=True)
+        self._worker.start()
+
+    def submit(self, inputs, **generate_kwargs):
+        """Queue one input and block until its result is ready"""
+        future: Future = Future()
+        self._queue.put((inputs, generate_kwargs, future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _generate(self, items):
+        inputs = [item[0] for item in items]
+        try:
+            if len(items) == 1 and self.single is not None:
+                # A lone request gains nothing from batching; let it use the prefix cache
+                outputs = [self.single(inputs[0], **items[0][1])]
+            else:
+                outputs = self.pipe(
+                    inputs, batch_size=len(inputs), **self.prepare(getattr(self.pipe, 'tokenizer', None), items[0][1])
+                )
+        except Exception as e:
+            for _, _, future in items:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(items)
+        for (_, _, future), output in zip(items, outputs):
+            future.set_result(output)
+
+    def _run(self):
+        while True:
+            groups: Dict[str, List[Any]] = {}
+            for item in self._collect():
+                key = json.dumps(item[1], sort_keys=True, default=str)
+                groups.setdefault(key, []).append(item)
+            for items in groups.values():
+                self._generate(items)
+
+    def stats(self):
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "requests": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0
+        }
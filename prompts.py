@@ -0,0 +1,135 @@
+"""Triage prompt templates shared by every GPT-OSS-20B code path.
+
+The static instructions go first, as the system message, and are identical
+for every request; only the short patient block in the user message
+varies. That lets providers with prompt caching, and the local backend's
+prefix KV cache, skip prefilling the instructions on every call.
+
+Two instruction variants are kept (PROMPT_TEMPLATE):
+  verbose  - the original long-form level descriptions (default)
+  compact  - token-minimal wording of the 7-level contract; opt in only
+             once its answers have been checked against verbose ones
+"""
+import os
+
+TRIAGE_JSON_SCHEMA = """{
+  "level_1_reassurance": "string",
+  "level_2_assessment": {"severity": "mild|moderate|severe|emergency", "description": "string"},
+  "level_3_possibilities": ["condition1", "condition2", "condition3"],
+  "level_4_first_aid": ["step1", "step2", "step3"],
+  "level_5_danger_signs": ["sign1", "sign2", "sign3"],
+  "level_6_vitals_analysis": "string",
+  "level_7_summary": {"summary": "string", "next_action": "string"}
+}"""
+
+# JSON Schema of the same contract, for providers that support structured outputs
+_STRING = {"type": "string"}
+_STRING_LIST = {"type": "array", "items": _STRING}
+TRIAGE_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "level_1_reassurance": _STRING,
+        "level_2_assessment": {
+            "type": "object",
+            "properties": {
+                "severity": {"type": "string", "enum": ["mild", "moderate", "severe", "emergency"]},
+                "description": _STRING
+            },
+            "required": ["severity", "description"],
+            "additionalProperties": False
+        },
+        "level_3_possibilities": _STRING_LIST,
+        "level_4_first_aid": _STRING_LIST,
+        "level_5_danger_signs": _STRING_LIST,
+        "level_6_vitals_analysis": _STRING,
+        "level_7_summary": {
+            "type": "object",
+            "properties": {"summary": _STRING, "next_action": _STRING},
+            "required": ["summary", "next_action"],
+            "additionalProperties": False
+        }
+    },
+    "required": [
+        "level_1_reassurance", "level_2_assessment", "level_3_possibilities", "level_4_first_aid",
+        "level_5_danger_signs", "level_6_vitals_analysis", "level_7_summary"
+    ],
+    "additionalProperties": False
+}
+
+VERBOSE_INSTRUCTIONS = f"""You are an expert medical triage AI assistant. Analyze the patient information provided by the user and provide a comprehensive 7-level triage assessment.
+
+Please provide a comprehensive medical assessment in the following 7 levels:
+
+**Level 1 - Reassurance Level**: Provide reassurance for mild symptoms and general advice.
+
+**Level 2 - Initial Assessment**: Classify the condition severity (mild/moderate/severe/emergency).
+
+**Level 3 - Pathological Possibilities**: List the 3-5 most likely medical conditions based on symptoms.
+
+**Level 4 - First Aid Measures**: Provide specific first aid instructions that can be done at home.
+
+**Level 5 - Danger Signs Alert**: List critical warning signs that require immediate medical attention.
+
+**Level 6 - Vital Signs Analysis**: Analyze any provided vital signs and their implications.
+
+**Level 7 - Summary Report & Next Action**: Provide a concise summary and specific next steps.
+
+Format your response as a JSON object with these exact keys:
+{TRIAGE_JSON_SCHEMA}
+
+Be precise, medically accurate, and prioritize patient safety."""
+
+COMPACT_INSTRUCTIONS = """You are a medical triage assistant. Assess the patient and reply with only this JSON object:
+{"level_1_reassurance": "reassurance and general advice",
+"level_2_assessment": {"severity": "mild|moderate|severe|emergency", "description": "..."},
+"level_3_possibilities": ["3-5 most likely conditions"],
+"level_4_first_aid": ["home first-aid steps"],
+"level_5_danger_signs": ["signs needing immediate care"],
+"level_6_vitals_analysis": "meaning of any vitals given",
+"level_7_summary": {"summary": "...", "next_action": "specific next step"}}
+Be precise, medically accurate, and prioritize patient safety."""
+
+TEMPLATES = {
+    'compact': COMPACT_INSTRUCTIONS,
+    'verbose': VERBOSE_INSTRUCTIONS
+}
+
+PROMPT_TEMPLATE = os.getenv('PROMPT_TEMPLATE', 'verbose').lower()
+if PROMPT_TEMPLATE not in TEMPLATES:
+    PROMPT_TEMPLATE = 'verbose'
+
+# The static system prompt, built once at import
+TRIAGE_INSTRUCTIONS = TEMPLATES[PROMPT_TEMPLATE]
+
+
+def patient_block(age='unknown', sex='unknown', symptoms='', duration='unknown', vitals=None, image_analysis=None):
+    """Render the per-request patient fields, omitting vitals and image findings that were not given"""
+    lines = [
+        "Patient Information:",
+        f"- Age: {age} years",
+        f"- Sex: {sex}",
+        f"- Symptoms: {symptoms}",
+        f"- Duration: {duration}"
+    ]
+    if vitals and vitals.get('temperature'):
+        lines.append(f"- Temperature: {vitals['temperature']}°C")
+    if vitals and vitals.get('heart_rate'):
+        lines.append(f"- Heart Rate: {vitals['heart_rate']} BPM")
+    if image_analysis:
+        lines.append(f"- Image Analysis: {image_analysis}")
+    return "\n".join(lines)
+
+
+def triage_messages(data, instructions=None):
+    """Chat messages for one triage request: shared system prefix, then the patient block"""
+    return [
+        {"role": "system", "content": instructions or TRIAGE_INSTRUCTIONS},
+        {"role": "user", "content": patient_block(
+            data.get('age', 'unknown'),
+            data.get('sex', 'unknown'),
+            data.get('symptoms', ''),
+            data.get('duration', 'unknown'),
+            data.get('vitals') or {},
+            data.get('image_analysis')
+        )}
+    ]
@@ -0,0 +1,186 @@
+"""Precompressed, fingerprinted frontend assets served from memory.
+
+At startup every file under css/ and js/ is read once, hashed, and
+compressed with gzip (and brotli when the brotli package is installed).
+index.html is rewritten to point at content-hashed URLs such as
+/css/styles.3f9a1c0b2d.css, which are served with a year-long immutable
+Cache-Control: a returning visitor only revalidates index.html, and a
+changed file gets a new URL. index.html itself is served with no-cache
+and an ETag, so the revalidation is a bodyless 304 on a slow link.
+
+Files generated at startup (the triage ruleset, say) are passed in as
+`generated` and served exactly like files on disk; `replace` swaps in
+new content for one of them when it is regenerated.
+
+Requests pick the smallest encoding the client accepts; nothing is
+compressed per request. Assets are loaded once per process, so edits
+to the frontend need a restart (or STATIC_PRECOMPRESS=false while
+developing, which serves the files from disk).
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Below this size compression headers cost more than they save
+MIN_COMPRESS_BYTES = 512
+
+TEXT_TYPES = {'.css': 'text/css; charset=utf-8', '.js': 'text/javascript; charset=utf-8',
+              '.html': 'text/html; charset=utf-8', '.svg': 'image/svg+xml', '.json': 'application/json'}
+
+
+def content_type(path):
+    extension = os.path.splitext(path)[1].lower()
+    return TEXT_TYPES.get(extension) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def fingerprinted_name(path, digest):
+    """css/styles.css -> css/styles.<digest>.css"""
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.{digest}{extension}"
+
+
+class Asset:
+    """One file's bytes in every encoding we serve, with its ETag"""
+
+    def __init__(self, path, body):
+        self.path = path
+        self.content_type = content_type(path)
+        self.digest = hashlib.sha256(body).hexdigest()[:10]
+        self.encodings = {'identity': body}
+        compressible = not self.content_type.startswith('image/') or self.content_type == 'image/svg+xml'
+        if compressible and len(body) >= MIN_COMPRESS_BYTES:
+            self.encodings['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.encodings['br'] = brotli.compress(body, quality=11)
+            # Keep only encodings that actually shrink the file
+            for name in [name for name in self.encodings if name != 'identity']:
+                if len(self.encodings[name]) >= len(body):
+                    del self.encodings[name]
+
+    def etag(self, encoding):
+        return f'"{self.digest}-{encoding}"' if encoding != 'identity' else f'"{self.digest}"'
+
+
+def parse_accept_encoding(header):
+    """Encodings the client accepts (q > 0)"""
+    accepted = set()
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        q = 1.0
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        if name and q > 0:
+            accepted.add(name)
+    return accepted
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison, as If-None-Match requires"""
+    if if_none_match.strip() == '*':
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+
+class StaticAssets:
+    """In-memory asset table keyed by URL path (without the leading slash)"""
+
+    def __init__(self, root, directories=('css', 'js'), index='index.html', generated=None):
+        self.root = root
+        # URL path -> (asset, Cache-Control); the plain and fingerprinted URLs share one asset
+        self.routes = {}
+        self.urls = {}
+        for directory in directories:
+            base = os.path.join(root, directory)
+            for folder, _, files in os.walk(base):
+                for name in sorted(files):
+                    full = os.path.join(folder, name)
+                    path = os.path.relpath(full, root).replace(os.sep, '/')
+                    with open(full, 'rb') as f:
+                        self.add(path, f.read())
+        for path, body in (generated or {}).items():
+            self.add(path, body)
+
+        self.index = index
+        with open(os.path.join(root, index), 'rb') as f:
+            self.index_html = f.read().decode('utf-8')
+        self._render_index()
+
+    def _render_index(self):
+        self.routes[''] = (Asset(self.index, self.rewrite_html(self.index_html).encode('utf-8')), REVALIDATE)
+
+    def add(self, path, body):
+        """Serve body at path and at its fingerprinted URL"""
+        asset = Asset(path, body)
+        hashed = fingerprinted_name(path, asset.digest)
+        # The plain URL stays valid (for pages cached before a deploy) but must revalidate
+        self.routes[path] = (asset, REVALIDATE)
+        self.routes[hashed] = (asset, IMMUTABLE)
+        self.urls[path] = hashed
+
+    def replace(self, path, body):
+        """New content for a generated asset; index.html is re-pointed at its new fingerprint"""
+        previous = self.urls.get(path)
+        self.add(path, body)
+        if previous and previous != self.urls[path]:
+            self.routes.pop(previous, None)
+        self._render_index()
+
+    def rewrite_html(self, html):
+        """Point local src/href attributes at the fingerprinted URLs"""
+        def replace(match):
+            attribute, quote, url = match.groups()
+            target = url.lstrip('/').split('?', 1)[0]
+            if target in self.urls:
+                return f'{attribute}={quote}/{self.urls[target]}{quote}'
+            return match.group(0)
+        return re.sub(r'\b(src|href)=(["\'])([^"\']+)\2', replace, html)
+
+    def stats(self):
+        """Total bytes per encoding across the distinct files"""
+        sizes = {'identity': 0, 'gzip': 0, 'br': 0}
+        assets = {id(asset): asset for asset, _ in self.routes.values()}
+        for asset in assets.values():
+            for encoding, body in asset.encodings.items():
+                sizes[encoding] += len(body)
+        return {"files": len(assets), "bytes": sizes, "brotli": brotli is not None}
+
+    def lookup(self, path, accept_encoding=None, if_none_match=None):
+        """Return (status, headers, body) for a path, or None if it is not an asset"""
+        route = self.routes.get(path)
+        if route is None:
+            return None
+        asset, cache_control = route
+        accepted = parse_accept_encoding(accept_encoding)
+        encoding = next((name for name in ('br', 'gzip') if name in accepted and name in asset.encodings),
+                        'identity')
+        etag = asset.etag(encoding)
+        headers = {
+            'Content-Type': asset.content_type,
+            'Cache-Control': cache_control,
+            'ETag': etag,
+            'Vary': 'Accept-Encoding'
+        }
+        if if_none_match and etag_matches(if_none_match, etag):
+            return 304, headers, b''
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return 200, headers, asset.encodings[encoding]
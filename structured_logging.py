@@ -0,0 +1,184 @@
+"""Non-blocking structured logging for request hot paths.
+
+Request threads only check the level and sampling rate, build a LogRecord
+and put it on a bounded queue; a background thread formats and writes it.
+If the queue is full the record is dropped and counted rather than making
+the request wait on stdout.
+
+Each record is an event name plus keyword fields:
+
+    log = get_logger('mehelper')
+    log.info('triage_complete', backend='GPTOSS20BService', risk_level='moderate')
+
+Free-text clinical fields (symptoms, image_analysis, ...) are replaced by
+their length before they are written unless LOG_REDACT=false.
+
+Configuration:
+  LOG_LEVEL          DEBUG | INFO (default) | WARNING | ERROR
+  LOG_FORMAT         json (default, one object per line) | text
+  LOG_SAMPLE         per-event keep rates, e.g. "triage_complete=0.1,emergency_fast_path=1";
+                     only DEBUG and INFO events are sampled
+  LOG_REDACT         true (default) | false
+  LOG_REDACT_FIELDS  extra comma-separated field names to redact
+  LOG_QUEUE_SIZE     records buffered for the writer thread (default 10000)
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from metrics import LOG_DROPPED
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_REDACT = os.getenv('LOG_REDACT', 'true').lower() == 'true'
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+# Patient-entered or model-generated free text
+REDACTED_FIELDS = frozenset(
+    {'symptoms', 'image_analysis', 'description', 'analysis', 'response_text', 'notes'}
+    | {name.strip() for name in os.getenv('LOG_REDACT_FIELDS', '').split(',') if name.strip()}
+)
+
+
+def parse_sample_rates(spec):
+    """Parse "event=rate,..." into {event: rate}, ignoring malformed entries"""
+    rates = {}
+    for item in spec.split(','):
+        event, _, rate = item.partition('=')
+        try:
+            rates[event.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+SAMPLE_RATES = parse_sample_rates(os.getenv('LOG_SAMPLE', ''))
+
+
+def redact(fields):
+    """Replace free-text clinical values with their length"""
+    if not LOG_REDACT:
+        return fields
+    return {
+        key: (f"[redacted {len(value)} chars]" if isinstance(value, str) else "[redacted]")
+        if key in REDACTED_FIELDS and value else value
+        for key, value in fields.items()
+    }
+
+
+class StructuredFormatter(logging.Formatter):
+    """Render an event record as a JSON line or as "event key=value" text"""
+
+    def __init__(self, fmt='json'):
+        super().__init__()
+        self.json = fmt == 'json'
+
+    def format(self, record):
+        timestamp = datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds')
+        fields = redact(getattr(record, 'fields', {}))
+        if record.exc_info:
+            fields = dict(fields, traceback=self.formatException(record.exc_info))
+        if self.json:
+            return json.dumps({
+                'ts': timestamp, 'level': record.levelname, 'logger': record.name,
+                'event': record.getMessage(), **fields
+            }, default=str, ensure_ascii=False)
+        pairs = ' '.join(f"{key}={value}" for key, value in fields.items())
+        return f"{timestamp} {record.levelname} {record.name} {record.getMessage()} {pairs}".rstrip()
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Enqueue records as-is and drop them when the writer falls behind"""
+
+    def prepare(self, record):
+        # Formatting happens on the writer thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_DROPPED.inc()
+
+
+class EventLogger:
+    """Thin wrapper that logs an event name with keyword fields"""
+
+    def __init__(self, logger):
+        self._logger = logger
+
+    def _log(self, level, event, fields, exc_info=None):
+        logger = self._logger
+        if not logger.isEnabledFor(level):
+            return
+        if level < logging.WARNING:
+            rate = SAMPLE_RATES.get(event)
+            if rate is not None and random.random() >= rate:
+                return
+        # makeRecord/handle skip the stack walk logger.log() does to find the caller
+        record = logger.makeRecord(logger.name, level, '', 0, event, (), exc_info, extra={'fields': fields})
+        logger.handle(record)
+
+    def debug(self, event, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event, **fields):
+        self._log(logging.ERROR, event, fields, exc_info=sys.exc_info())
+
+    def isEnabledFor(self, level):
+        return self._logger.isEnabledFor(level)
+
+
+_listener = None
+
+
+def configure(stream=None, fmt=None, level=None):
+    """Attach the queue handler and start the writer thread (safe to call again)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(StructuredFormatter(fmt or LOG_FORMAT))
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _listener = QueueListener(log_queue, handler)
+    _listener.start()
+
+    root = logging.getLogger('mehelper')
+    root.handlers = [NonBlockingQueueHandler(log_queue)]
+    root.setLevel(getattr(logging, level or LOG_LEVEL, logging.INFO))
+    root.propagate = False
+    return _listener
+
+
+def shutdown():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name='mehelper'):
+    """Event logger under the "mehelper" hierarchy"""
+    if not name.startswith('mehelper'):
+        name = f"mehelper.{name}"
+    return EventLogger(logging.getLogger(name))
+
+
+configure()
+atexit.register(shutdown)
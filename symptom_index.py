@@ -0,0 +1,272 @@
+"""Semantic symptom -> condition matching on the CPU, without a model call.
+
+The keyword rules only find a condition when one of their words appears
+in the text, so "my tummy hurts and I feel hot" gets the generic list.
+condition_descriptions.json lists, for each condition, short plain-language
+descriptions of how patients put it. Each description is embedded once and
+stored as one row of a float32 matrix in symptom_index/vectors.npy. The
+matrix is memory-mapped, so worker processes share the same pages. A query is embedded
+with the same encoder. A condition scores the cosine similarity of its
+closest description, and the top k are returned.
+
+Two encoders:
+- "hashing" (the default) needs only NumPy. Words, word pairs and
+  character 3-5-grams are hashed into a fixed-size vector and weighted
+  by IDF over the descriptions. Typos and word forms still match
+  ("stomache", "vomitting"). Lay terms match through the descriptions
+  that use them.
+- any sentence-embedding model id, e.g.
+  sentence-transformers/all-MiniLM-L6-v2, runs through transformers on
+  the CPU with mean pooling.
+
+The index is rebuilt when the descriptions file or the encoder changes.
+Its metadata records both, so a stale matrix is never searched.
+"""
+import functools
+import hashlib
+import json
+import os
+import re
+import zlib
+
+import numpy as np
+
+from structured_logging import get_logger
+from triage_rules import TOKEN_PATTERN
+
+log = get_logger('mehelper.symptom_index')
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DESCRIPTIONS_PATH = os.path.join(ROOT, 'condition_descriptions.json')
+DEFAULT_INDEX_DIR = os.path.join(ROOT, 'symptom_index')
+
+# Bump when the files written to the index directory change shape
+INDEX_SCHEMA = 1
+
+HASHING_DIMENSIONS = 4096
+
+# Words that say nothing about the complaint; the descriptions are too few for IDF to learn this
+STOP_WORDS = frozenset("""
+a an and are am at be been but by for from had has have i i'm im in is it it's its me my of on or so
+that the then there this to very was with feel feels feeling felt got get getting keep keeps really
+""".split())
+
+
+class SymptomIndexError(ValueError):
+    """A descriptions file or index directory that cannot be used"""
+
+
+def _tokens(text):
+    return [word for word in re.findall(TOKEN_PATTERN, (text or '').lower().replace('’', "'"))
+            if word not in STOP_WORDS]
+
+
+@functools.lru_cache(maxsize=65536)
+def _hash(feature, dimensions):
+    """(bucket, sign) for one feature; crc32 is stable across processes, unlike hash()"""
+    value = zlib.crc32(feature.encode('utf-8'))
+    return value % dimensions, 1.0 if value & 0x80000000 else -1.0
+
+
+@functools.lru_cache(maxsize=65536)
+def _word_features(word, dimensions):
+    """(bucket, sign, weight) of a word and its character n-grams, shared by every encoder"""
+    padded = f"<{word}>"
+    grams = [padded[start:start + n] for n in (3, 4, 5) for start in range(len(padded) - n + 1)]
+    # The whole word counts as much as all of its n-grams together
+    features = [(*_hash('w:' + word, dimensions), 1.0)]
+    features += [(*_hash('c:' + gram, dimensions), 1.0 / len(grams)) for gram in grams]
+    return tuple(features)
+
+
+class HashingEncoder:
+    """Feature-hashed words, word pairs and character n-grams, IDF-weighted, L2-normalized"""
+
+    name = 'hashing'
+
+    def __init__(self, dimensions=HASHING_DIMENSIONS, idf=None):
+        self.dimensions = dimensions
+        self.idf = idf if idf is not None else np.ones(dimensions, dtype=np.float32)
+
+    def _features(self, text):
+        words = _tokens(text)
+        features = [feature for word in words for feature in _word_features(word, self.dimensions)]
+        for first, second in zip(words, words[1:]):
+            features.append((*_hash(f"b:{first} {second}", self.dimensions), 1.0))
+        return features
+
+    def raw(self, texts):
+        """Unweighted hashed feature counts, one row per text"""
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            if features:
+                buckets, signs, weights = zip(*features)
+                np.add.at(matrix[row], np.array(buckets), np.array(signs, dtype=np.float32) * weights)
+        return matrix
+
+    @classmethod
+    def fit(cls, texts, dimensions=HASHING_DIMENSIONS):
+        """An encoder whose IDF weights come from texts"""
+        document_frequency = np.count_nonzero(cls(dimensions).raw(texts), axis=0)
+        idf = np.log((1 + len(texts)) / (1 + document_frequency)).astype(np.float32) + 1
+        return cls(dimensions, idf)
+
+    def encode(self, texts):
+        return _normalize(self.raw(texts) * self.idf)
+
+
+class TransformerEncoder:
+    """A sentence-embedding model through transformers, mean-pooled, on the CPU"""
+
+    def __init__(self, model_name):
+        self.name = model_name
+        self._model = None
+        self._tokenizer = None
+
+    def _load(self):
+        if self._model is None:
+            # Heavy optional dependencies, only imported when this encoder is chosen
+            from transformers import AutoModel, AutoTokenizer  # type: ignore
+            self._tokenizer = AutoTokenizer.from_pretrained(self.name)
+            self._model = AutoModel.from_pretrained(self.name).eval()
+        return self._tokenizer, self._model
+
+    @property
+    def dimensions(self):
+        return self._load()[1].config.hidden_size
+
+    def encode(self, texts):
+        import torch  # type: ignore
+        tokenizer, model = self._load()
+        with torch.no_grad():
+            batch = tokenizer(list(texts), padding=True, truncation=True, max_length=128, return_tensors='pt')
+            hidden = model(**batch).last_hidden_state
+            mask = batch['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        return _normalize(pooled.numpy().astype(np.float32))
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def _read_descriptions(path):
+    """(source version, [(condition, [description, ...]), ...]) in file order"""
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        data = json.loads(raw.decode('utf-8'))
+    except (OSError, ValueError) as e:
+        raise SymptomIndexError(f"cannot read {path}: {e}") from e
+    conditions = data.get('conditions') if isinstance(data, dict) else None
+    if not isinstance(conditions, dict) or not conditions:
+        raise SymptomIndexError(f"invalid {path}: conditions must be a non-empty object")
+    entries = []
+    for condition, descriptions in conditions.items():
+        if not isinstance(descriptions, list) or not descriptions \
+                or not all(isinstance(text, str) for text in descriptions):
+            raise SymptomIndexError(f"invalid {path}: conditions.{condition} must be a list of strings")
+        entries.append((condition, descriptions))
+    return hashlib.sha256(raw).hexdigest()[:12], entries
+
+
+class SymptomIndex:
+    """Condition descriptions embedded into one matrix, searched by cosine similarity"""
+
+    def __init__(self, conditions, counts, vectors, encoder, source_version):
+        self.conditions = tuple(conditions)
+        # Rows are grouped by condition; starts[i] is the first row of conditions[i]
+        self.starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.intp)
+        self.vectors = vectors
+        self.encoder = encoder
+        self.source_version = source_version
+
+    @classmethod
+    def build(cls, descriptions_path=DEFAULT_DESCRIPTIONS_PATH, encoder='hashing'):
+        """Embed every description in memory"""
+        source_version, entries = _read_descriptions(descriptions_path)
+        texts = [text for _, descriptions in entries for text in descriptions]
+        if encoder == 'hashing':
+            encoder = HashingEncoder.fit(texts)
+        elif isinstance(encoder, str):
+            encoder = TransformerEncoder(encoder)
+        return cls([condition for condition, _ in entries], [len(descriptions) for _, descriptions in entries],
+                   encoder.encode(texts), encoder, source_version)
+
+    def save(self, directory):
+        """Write vectors.npy (and idf.npy for the hashing encoder), then index.json last"""
+        os.makedirs(directory, exist_ok=True)
+        arrays = {'vectors.npy': self.vectors}
+        if isinstance(self.encoder, HashingEncoder):
+            arrays['idf.npy'] = self.encoder.idf
+        for name, array in arrays.items():
+            temporary = os.path.join(directory, f".{name}.tmp")
+            with open(temporary, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array, dtype=np.float32))
+            os.replace(temporary, os.path.join(directory, name))
+        meta = {'schema': INDEX_SCHEMA, 'encoder': self.encoder.name, 'dimensions': int(self.vectors.shape[1]),
+                'source_version': self.source_version,
+                'conditions': [[condition, int(count)] for condition, count in
+                               zip(self.conditions, np.diff(np.append(self.starts, len(self.vectors))))]}
+        temporary = os.path.join(directory, '.index.json.tmp')
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+        os.replace(temporary, os.path.join(directory, 'index.json'))
+
+    @classmethod
+    def load(cls, directory):
+        """Memory-map a saved index"""
+        try:
+            with open(os.path.join(directory, 'index.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+            vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+            if meta['encoder'] == 'hashing':
+                encoder = HashingEncoder(meta['dimensions'], np.load(os.path.join(directory, 'idf.npy')))
+            else:
+                encoder = TransformerEncoder(meta['encoder'])
+        except (OSError, ValueError, KeyError) as e:
+            raise SymptomIndexError(f"cannot load {directory}: {e}") from e
+        if meta.get('schema') != INDEX_SCHEMA or vectors.shape != (sum(count for _, count in meta['conditions']),
+                                                                    meta['dimensions']):
+            raise SymptomIndexError(f"cannot load {directory}: unsupported or inconsistent index")
+        return cls([condition for condition, _ in meta['conditions']], [count for _, count in meta['conditions']],
+                   vectors, encoder, meta['source_version'])
+
+    @classmethod
+    def open(cls, directory=DEFAULT_INDEX_DIR, descriptions_path=DEFAULT_DESCRIPTIONS_PATH, encoder='hashing'):
+        """The saved index if it matches the descriptions and encoder, otherwise a rebuilt one"""
+        source_version, _ = _read_descriptions(descriptions_path)
+        try:
+            index = cls.load(directory)
+            if index.source_version == source_version and index.encoder.name == encoder:
+                return index
+        except SymptomIndexError:
+            pass
+        index = cls.build(descriptions_path, encoder)
+        try:
+            index.save(directory)
+        except OSError as e:
+            # A read-only install still works, just without the shared memory map
+            log.warning("symptom_index_not_saved", directory=directory, error=str(e))
+            return index
+        log.info("symptom_index_built", directory=directory, encoder=encoder, version=source_version,
+                 conditions=len(index.conditions), descriptions=len(index.vectors))
+        return cls.load(directory)
+
+    def search(self, text, k=3, min_score=0.0):
+        """Up to k (condition, score) pairs, best first, scoring at least min_score"""
+        query = self.encoder.encode([text])[0]
+        if not query.any():
+            return []
+        scores = np.maximum.reduceat(self.vectors @ query, self.starts)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.conditions[i], round(float(scores[i]), 3)) for i in top if scores[i] >= min_score]
+
+    def stats(self):
+        return {"encoder": self.encoder.name, "dimensions": int(self.vectors.shape[1]),
+                "conditions": len(self.conditions), "descriptions": int(self.vectors.shape[0]),
+                "version": self.source_version, "memory_mapped": isinstance(self.vectors, np.memmap)}
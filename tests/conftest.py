@@ -0,0 +1,22 @@
+"""Import the app without model loading, history files or upstream calls."""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_DATA_DIR = tempfile.mkdtemp(prefix='mehelper-tests-')
+
+for name, value in {
+    'DATA_DIR': _DATA_DIR,
+    'HISTORY_BACKEND': 'off',
+    'BACKGROUND_MODEL_LOAD': 'false',
+    'MODEL_WARMUP': 'false',
+    'STATIC_PRECOMPRESS': 'false',
+    'LOG_LEVEL': 'CRITICAL',
+    'HF_TOKEN': '',
+    'GEMINI_API_KEY': '',
+    'SYMPTOM_INDEX_DIR': os.path.join(_DATA_DIR, 'symptom_index'),
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,65 @@
+import io
+import random
+
+import numpy as np
+import pytest
+
+import app
+from batch_triage import LIST_SEPARATOR, RISK_LEVELS, ChunkTriage, CSVResults, triage_file
+from triage_rules import DEFAULT_PATH, TriageRules
+
+PHRASES = ['fever', 'cough', 'headache', 'stomach ache', 'chest tightness', 'back pain', 'nausea', 'diarrhea',
+           'rash', 'tired', 'dizzy', 'sore throat', 'for two weeks', 'severe', 'worst ever', 'chest pains',
+           'bleeding', "can’t breathe", 'having seizures', 'since last month', 'poisoned', 'mild itch']
+
+
+def make_records(count, seed=3):
+    rng = random.Random(seed)
+    records = []
+    for _ in range(count):
+        record = {'symptoms': 'I have ' + ', '.join(rng.sample(PHRASES, rng.randint(1, 4))), 'vitals': {}}
+        age = rng.choice([None, 1, 4, 30, 70, 85])
+        if age is not None:
+            record['age'] = age
+        for name, values in (('temperature', [None, 36.8, 39.4, 34.8, 0]), ('heart_rate', [None, 78, 130, 40])):
+            value = rng.choice(values)
+            if value is not None:
+                record['vitals'][name] = value
+        records.append(record)
+    return records
+
+
+@pytest.fixture
+def rules_service(monkeypatch):
+    monkeypatch.setattr(app, 'ai_service', app.mock_service)
+    # Without a condition keyword the service falls back to the semantic index, which the batch path does not use
+    monkeypatch.setattr(app, 'symptom_index', None)
+
+
+def column(records, get):
+    return np.array([np.nan if get(record) is None else get(record) for record in records], dtype=float)
+
+
+def test_chunk_triage_agrees_with_the_rule_based_service(rules_service):
+    records = make_records(500)
+    risk, emergency_keywords, conditions = ChunkTriage(TriageRules.load(DEFAULT_PATH)).evaluate(
+        column(records, lambda record: record.get('age')),
+        [record['symptoms'] for record in records],
+        column(records, lambda record: record['vitals'].get('temperature')),
+        column(records, lambda record: record['vitals'].get('heart_rate')))
+    for index, record in enumerate(records):
+        # The /api/analyze path: emergency keywords first, then MockAIService
+        expected = app.run_triage(dict(record, refine=False))
+        assert RISK_LEVELS[risk[index]] == expected['risk_level'], record
+        assert emergency_keywords[index] == LIST_SEPARATOR.join(expected.get('emergency_keywords', [])), record
+        assert conditions[index] == LIST_SEPARATOR.join(expected['possible_conditions']), record
+
+
+def test_triage_file_writes_one_row_per_record():
+    source = io.StringIO('id,age,symptoms,temperature\nr1,30,fever and cough,39.8\n\nr2,,chest pain,\nr3,4,rash\n')
+    output = io.StringIO()
+    counts = triage_file(source, CSVResults(output), TriageRules.load(DEFAULT_PATH), chunk_size=2)
+    rows = output.getvalue().splitlines()
+    assert rows[0] == 'id,risk_level,emergency_keywords,possible_conditions,next_action'
+    assert [row.split(',')[:2] for row in rows[1:]] == [['r1', 'high'], ['r2', 'emergency'], ['r3', 'moderate']]
+    assert counts == {'low': 0, 'moderate': 1, 'high': 1, 'emergency': 1}
@@ -0,0 +1,84 @@
+import app
+
+
+def test_opens_after_consecutive_failures_and_rejects():
+    breaker = app.CircuitBreaker(failure_threshold=2, recovery_seconds=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow_request()
+    assert breaker.status()['rejected'] == 1
+
+
+def test_half_open_lets_one_probe_through_and_closes_on_success():
+    breaker = open_breaker()
+    assert breaker.allow_request()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.consecutive_failures == 0
+    assert breaker.allow_request() and breaker.allow_request()
+
+
+def test_failed_half_open_probe_reopens():
+    breaker = open_breaker()
+    breaker.recovery_seconds = 60
+    breaker.opened_at -= 60
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow_request()
+
+
+def open_breaker():
+    breaker = app.CircuitBreaker(failure_threshold=1, recovery_seconds=0)
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    return breaker
+
+
+class StreamingService(app.GPTOSS20BService):
+    """GPT-OSS-20B service streaming canned chunks from a remote client"""
+
+    def __init__(self, breaker, chunks):
+        self.client = object()
+        self.use_local = False
+        self.breaker = breaker
+        self.chunks = chunks
+
+    def _create_messages(self, data):
+        return []
+
+    def _stream_text(self, messages):
+        for chunk in self.chunks:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+
+PAYLOAD = {'age': 30, 'sex': 'female', 'symptoms': 'fever', 'duration': 'hours', 'cache': False}
+CHUNKS = ['{"level_1_reassurance": "Rest", ', '"level_2_assessment": {"severity": "mild", "description": "ok"}}']
+
+
+def test_closing_the_stream_mid_probe_releases_it():
+    breaker = open_breaker()
+    stream = StreamingService(breaker, CHUNKS).stream_analysis(PAYLOAD)
+    assert next(stream)[0] == 'level_1_reassurance'
+    stream.close()
+    assert breaker.state == 'half_open'
+    assert breaker.allow_request()
+
+
+def test_completed_probe_closes_the_breaker():
+    breaker = open_breaker()
+    list(StreamingService(breaker, CHUNKS).stream_analysis(PAYLOAD))
+    assert breaker.state == 'closed'
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = open_breaker()
+    list(StreamingService(breaker, [CHUNKS[0], ConnectionError('reset')]).stream_analysis(PAYLOAD))
+    assert breaker.state == 'open'
@@ -0,0 +1,36 @@
+import pytest
+
+import app
+
+
+@pytest.fixture
+def loader(monkeypatch):
+    loader = app.BackendLoader()
+    monkeypatch.setattr(app, 'backend_loader', loader)
+    return loader
+
+
+@pytest.mark.parametrize('state', ['starting', 'warming'])
+def test_loading_backend_is_not_ready(loader, state):
+    loader.state = state
+    body, status = app.health_status()
+    assert status == 503 and body['status'] == state
+
+
+def test_failed_load_reports_degraded_with_error(loader, monkeypatch):
+    def fail():
+        raise RuntimeError("Both Inference Providers and local model failed")
+    monkeypatch.setattr(app, 'GPTOSS20BService', fail)
+    monkeypatch.setattr(app, 'GeminiVisionService', fail)
+    monkeypatch.setattr(app, 'ai_service', app.mock_service)
+    loader.start(background=False)
+    body, status = app.health_status()
+    assert loader.state == 'degraded'
+    assert status == 200 and body['status'] == 'degraded'
+    assert 'local model failed' in body['message']
+    assert body['services']['ai_service']['backend']['error'] == "Both Inference Providers and local model failed"
+
+
+def test_health_endpoint_returns_503_while_starting(loader):
+    response = app.app.test_client().get('/api/health')
+    assert response.status_code == 503 and response.get_json()['status'] == 'starting'
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+import app
+from history_store import HistoryStore
+
+
+def test_default_database_goes_in_data_dir_not_cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(app, 'DATA_DIR', str(tmp_path / 'data'))
+    monkeypatch.setenv('HISTORY_BACKEND', 'sqlite')
+    monkeypatch.delenv('HISTORY_DB_PATH', raising=False)
+    store = app.create_history_store()
+    assert store.path == str(tmp_path / 'data' / 'triage_history.sqlite3')
+    assert os.path.exists(store.path)
+    assert not os.path.exists(tmp_path / 'triage_history.sqlite3')
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(str(tmp_path / 'history.sqlite3'))
+
+
+def scan(record_id, updated_at='2024-05-01T10:00:00Z', **fields):
+    return dict({'id': record_id, 'date': '2024-05-01T09:00:00Z', 'updated_at': updated_at,
+                 'riskLevel': 'low', 'symptoms': 'fever'}, **fields)
+
+
+def test_sync_returns_other_devices_changes_but_not_own_upload(store):
+    store.ingest([scan(1)], 'tablet-1')
+    accepted, stale, rejected, first, last = store.ingest([scan(2)], 'tablet-2')
+    changes, token, has_more = store.changes_since(0, 10, exclude=(first, last))
+    assert (accepted, stale, rejected) == (1, 0, [])
+    assert [(record['device_id'], record['id']) for record in changes] == [('tablet-1', 1)]
+    assert token == store.current_version() and not has_more
+    assert store.changes_since(token, 10) == ([], token, False)
+
+
+def test_newer_update_wins_and_older_one_is_stale(store):
+    store.ingest([scan(1, symptoms='fever')], 'tablet-1')
+    assert store.ingest([scan(1, '2024-05-01T11:00:00Z', symptoms='fever, rash')], 'tablet-1')[:2] == (1, 0)
+    assert store.ingest([scan(1, '2024-05-01T10:30:00Z', symptoms='old edit')], 'tablet-1')[:2] == (0, 1)
+    assert store.ingest([scan(1, '2024-05-01T11:00:00Z', symptoms='same time')], 'tablet-1')[:2] == (0, 1)
+    records, _ = store.query()
+    assert [record['symptoms'] for record in records] == ['fever, rash']
+
+
+def test_deletion_propagates_as_tombstone(store):
+    store.ingest([scan(1)], 'tablet-1')
+    token = store.current_version()
+    store.ingest([scan(1, '2024-05-01T12:00:00Z', device_id='tablet-1', deleted=True)], 'tablet-2')
+    changes, _, _ = store.changes_since(token, 10)
+    assert changes == [{'id': 1, 'device_id': 'tablet-1', 'date': '2024-05-01T09:00:00Z',
+                        'updated_at': '2024-05-01T12:00:00.000Z', 'deleted': True}]
+    assert store.query() == ([], None)
+
+
+def test_changes_are_paged_by_token(store):
+    store.ingest([scan(index) for index in range(5)], 'tablet-1')
+    first_page, token, has_more = store.changes_since(0, 3)
+    second_page, token, more = store.changes_since(token, 3)
+    assert has_more and not more
+    assert [record['id'] for record in first_page + second_page] == list(range(5))
+
+
+def test_invalid_records_are_rejected_individually(store):
+    accepted, _, rejected, _, _ = store.ingest([scan(1), {'date': '2024-05-01'}, scan(2, date='yesterday')], 'tablet-1')
+    assert accepted == 1
+    assert [item['index'] for item in rejected] == [1, 2]
+
+
+def test_sync_endpoint(store, monkeypatch):
+    monkeypatch.setattr(app, 'history_store', store)
+    client = app.app.test_client()
+    client.post('/api/history/sync', json={'device_id': 'tablet-1', 'sync_token': 0, 'records': [scan(1)]})
+    body = client.post('/api/history/sync', json={'device_id': 'tablet-2', 'sync_token': 0}).get_json()
+    assert [record['id'] for record in body['changes']] == [1]
+    assert client.post('/api/history/sync', json={'records': []}).status_code == 400
+    for limit in ('abc', [1]):
+        response = client.post('/api/history/sync', json={'device_id': 'tablet-2', 'limit': limit})
+        assert response.status_code == 400
+        assert response.get_json() == {'error': 'Field limit must be an integer'}
@@ -0,0 +1,47 @@
+import io
+
+from PIL import Image
+
+import app
+
+
+def jpeg(color, size=(64, 64), quality=90):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def test_evictions_from_both_tiers_are_counted(tmp_path):
+    disk = app.SQLiteCacheStore(str(tmp_path / 'images.sqlite3'), 1, table='image_cache')
+    cache = app.ImageAnalysisCache(app.MemoryCacheStore(1), disk)
+    cache.set('first', {'success': True})
+    cache.set('second', {'success': True})
+    assert cache.stats()['evictions'] == 2
+
+
+def test_disk_hit_is_promoted_to_memory(tmp_path):
+    disk = app.SQLiteCacheStore(str(tmp_path / 'images.sqlite3'), 4, table='image_cache')
+    cache = app.ImageAnalysisCache(app.MemoryCacheStore(4), disk)
+    cache.set('key', {'analysis': 'rash'})
+    cache.memory = app.MemoryCacheStore(4)
+    assert cache.get('key') == {'analysis': 'rash'}
+    assert cache.get('key') == {'analysis': 'rash'}
+    assert (cache.stats()['disk_hits'], cache.stats()['memory_hits']) == (1, 1)
+
+
+def test_exact_keys_are_the_default_and_need_identical_bytes():
+    cache = app.ImageAnalysisCache(app.MemoryCacheStore(4))
+    image = jpeg('red')
+    assert cache.key_mode == 'exact'
+    assert cache.fingerprint(image, 'What is this?') == cache.fingerprint(image, ' What  is this? ')
+    assert cache.fingerprint(image, 'What is this?') != cache.fingerprint(jpeg('red', quality=60), 'What is this?')
+    assert cache.fingerprint(image, 'What is this?') != cache.fingerprint(image, 'Describe the rash')
+
+
+def test_perceptual_keys_match_reencoded_copies():
+    cache = app.ImageAnalysisCache(app.MemoryCacheStore(4), key_mode='perceptual')
+    image = Image.linear_gradient('L').convert('RGB')
+    original, copy = io.BytesIO(), io.BytesIO()
+    image.save(original, format='JPEG', quality=95)
+    image.resize((128, 128)).save(copy, format='JPEG', quality=60)
+    assert cache.fingerprint(original.getvalue(), '') == cache.fingerprint(copy.getvalue(), '')
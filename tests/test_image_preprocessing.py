@@ -0,0 +1,44 @@
+import io
+import os
+import subprocess
+import sys
+import textwrap
+
+from PIL import Image
+
+from conftest import ROOT
+from image_preprocessing import create_worker_pool, preprocess_image
+
+
+def test_preprocess_downscales_to_jpeg():
+    buffer = io.BytesIO()
+    Image.new('RGB', (2048, 1024), 'red').save(buffer, format='PNG')
+    result = preprocess_image(buffer.getvalue())
+    assert result['success'] and result['format'] == 'JPEG' and result['size'] == '1024x512'
+
+
+def png(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_worker_pool_applies_pixel_limit_to_pillow():
+    with create_worker_pool(1, max_pixels=1000) as pool:
+        result = pool.submit(preprocess_image, png(64, 64), 10 ** 9).result()
+    assert not result['success'] and 'decompression bomb' in result['error']
+
+
+def test_app_rerun_in_image_worker_sets_nothing_up(tmp_path):
+    script = textwrap.dedent(f"""
+        import runpy, sys
+        sys.path.insert(0, {ROOT!r})
+        app = runpy.run_path({os.path.join(ROOT, 'app.py')!r}, run_name='__mp_main__')
+        assert app['IMAGE_WORKER']
+        assert app['history_store'] is app['triage_cache'] is app['static_assets'] is None
+        assert app['backend_loader'].state == 'starting', app['backend_loader'].state
+    """)
+    env = dict(os.environ, DATA_DIR=str(tmp_path), HISTORY_BACKEND='sqlite', TRIAGE_CACHE_BACKEND='sqlite',
+               STATIC_PRECOMPRESS='true', BACKGROUND_MODEL_LOAD='false')
+    subprocess.run([sys.executable, '-c', script], check=True, timeout=60, env=env)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,35 @@
+from app import IncrementalJSONParser
+
+
+def feed_all(chunks):
+    parser = IncrementalJSONParser()
+    return [parser.feed(chunk) for chunk in chunks], parser
+
+
+def test_members_are_returned_as_soon_as_they_complete():
+    results, parser = feed_all(['Sure! {"level_1_reassurance": "Re', 'st", "level_2', '_assessment": {"severity": "mild"}', '}'])
+    assert results == [[], [('level_1_reassurance', 'Rest')], [], [('level_2_assessment', {'severity': 'mild'})]]
+    assert parser.closed
+
+
+def test_braces_and_quotes_inside_strings_are_text():
+    results, _ = feed_all(['{"a": "x } \\" , {", "b": [1, {"c": "]"}]}'])
+    assert results == [[('a', 'x } " , {'), ('b', [1, {'c': ']'}])]]
+
+
+def test_text_after_the_object_closes_is_ignored():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"a": 1} then {"b": 2}') == [('a', 1)]
+    assert parser.feed(', "c": 3}') == []
+
+
+def test_one_character_at_a_time_matches_whole_input():
+    text = '{"level_3_possibilities": ["Flu", "Cold"], "level_6_vitals_analysis": "Normal"}'
+    results, parser = feed_all(list(text))
+    assert [member for members in results for member in members] == [
+        ('level_3_possibilities', ['Flu', 'Cold']), ('level_6_vitals_analysis', 'Normal')]
+
+
+def test_unparseable_member_is_skipped():
+    results, parser = feed_all(['{"a": oops, "b": 2}'])
+    assert results == [[('b', 2)]] and parser.closed
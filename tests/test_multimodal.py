@@ -0,0 +1,57 @@
+import io
+import threading
+
+import pytest
+
+import app
+
+FORM = {'age': '30', 'sex': 'female', 'symptoms': 'itchy rash on both arms', 'duration': '3-7days'}
+
+
+@pytest.fixture
+def stalled_image(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(app, 'analyze_upload', lambda image_bytes, prompt: release.wait(5) and {'success': False})
+    monkeypatch.setattr(app, 'IMAGE_ANALYSIS_TIMEOUT', 0.05)
+    yield
+    release.set()
+
+
+def post(form):
+    data = dict(form, image=(io.BytesIO(b'not decoded'), 'rash.png'))
+    return app.app.test_client().post('/api/analyze_multimodal', data=data, content_type='multipart/form-data')
+
+
+def test_slow_image_falls_back_to_text_only_triage(stalled_image):
+    response = post(FORM)
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['image_analysis_included'] is False
+    assert 'did not finish' in body['image_error']
+    assert body['fallback_message'] == app.IMAGE_FALLBACK_MESSAGE
+    assert body['risk_level'] == 'low'
+
+
+def test_slow_image_does_not_hold_back_emergency_refinement(stalled_image):
+    response = post(dict(FORM, symptoms='chest pain and shortness of breath'))
+    request_id = response.get_json()['request_id']
+    app.refinement_jobs[request_id][1].result(timeout=5)
+    body, status = app.refinement_status(request_id)
+    assert status == 200
+    assert body['result']['risk_level'] == 'emergency'
+    assert body['result']['image_analysis_included'] is False
+
+
+def test_image_findings_do_not_pin_emergency(monkeypatch):
+    class ModelService:
+        def analyze_symptoms(self, data):
+            return app.mock_service.analyze_symptoms(dict(data, image_analysis=None))
+
+    monkeypatch.setattr(app, 'ai_service', ModelService())
+    monkeypatch.setattr(app, 'analyze_upload', lambda image_bytes, prompt: {
+        'success': True, 'analysis': 'Bloodshot sclera, no active bleeding'})
+    body = post(FORM).get_json()
+    assert body['risk_level'] == 'low' and 'emergency_keywords' not in body
+    app.refinement_jobs[body['request_id']][1].result(timeout=5)
+    result = app.refinement_status(body['request_id'])[0]['result']
+    assert result['risk_level'] == 'low' and 'emergency_keywords' not in result
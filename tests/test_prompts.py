@@ -0,0 +1,17 @@
+import importlib
+
+import prompts
+
+
+def test_verbose_template_is_the_default(monkeypatch):
+    monkeypatch.delenv('PROMPT_TEMPLATE', raising=False)
+    assert importlib.reload(prompts).TRIAGE_INSTRUCTIONS == prompts.VERBOSE_INSTRUCTIONS
+
+
+def test_compact_template_is_opt_in(monkeypatch):
+    monkeypatch.setenv('PROMPT_TEMPLATE', 'compact')
+    try:
+        assert importlib.reload(prompts).TRIAGE_INSTRUCTIONS == prompts.COMPACT_INSTRUCTIONS
+    finally:
+        monkeypatch.delenv('PROMPT_TEMPLATE')
+        importlib.reload(prompts)
@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    monkeypatch.setattr(app, 'REFINEMENT_MAX_JOBS', 2)
+    monkeypatch.setattr(app, 'refinement_jobs', app.OrderedDict())
+    release = threading.Event()
+    yield release
+    release.set()
+
+
+def test_pending_refinements_are_never_evicted(jobs):
+    first = app.submit_refinement(jobs.wait, 5)
+    second = app.submit_refinement(jobs.wait, 5)
+    assert app.submit_refinement(jobs.wait, 5) is None
+    assert app.refinement_status(first)[1] == 202
+    assert app.refinement_status(second)[1] == 202
+
+
+def test_finished_refinement_makes_room(jobs):
+    first = app.submit_refinement(lambda: {'risk_level': 'emergency'})
+    app.refinement_jobs[first][1].result(timeout=5)
+    second = app.submit_refinement(jobs.wait, 5)
+    third = app.submit_refinement(jobs.wait, 5)
+    assert third is not None
+    assert app.refinement_status(first)[1] == 404
+    assert app.refinement_status(second)[1] == 202
+
+
+def test_full_queue_marks_response_unavailable(jobs):
+    app.submit_refinement(jobs.wait, 5)
+    app.submit_refinement(jobs.wait, 5)
+    response = app.queue_refinement({}, jobs.wait, 5)
+    assert response == {'refinement': 'unavailable'}
+
+
+def test_expired_refinements_are_dropped(jobs, monkeypatch):
+    expired = app.submit_refinement(lambda: {'risk_level': 'emergency'})
+    app.refinement_jobs[expired][1].result(timeout=5)
+    monkeypatch.setattr(app, 'REFINEMENT_TTL_SECONDS', -1)
+    app.submit_refinement(jobs.wait, 5)
+    assert app.refinement_status(expired)[1] == 404
+
+
+def test_running_refinement_outlives_ttl(jobs, monkeypatch):
+    running = app.submit_refinement(jobs.wait, 5)
+    monkeypatch.setattr(app, 'REFINEMENT_TTL_SECONDS', -1)
+    app.submit_refinement(lambda: None)
+    assert app.refinement_status(running)[1] == 202
+    jobs.set()
+    app.refinement_jobs[running][1].result(timeout=5)
+    assert app.refinement_status(running)[1] == 200
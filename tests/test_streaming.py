@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+import app
+
+PAYLOAD = {'age': 30, 'sex': 'female', 'symptoms': 'fever and cough', 'duration': '1-3days'}
+
+
+class StreamingModel:
+    """Yields every level, as GPT-OSS-20B does once its JSON is complete"""
+
+    def __init__(self, same=()):
+        self.same = same
+
+    def stream_analysis(self, data):
+        rules = app.mock_service.analyze_symptoms(data)
+        for key in app.TRIAGE_LEVEL_KEYS:
+            yield key, rules[key] if key in self.same else refined(rules[key]), 'model'
+
+
+def refined(value):
+    if isinstance(value, dict):
+        return dict(value, model=True)
+    if isinstance(value, list):
+        return value + ['Model note']
+    return f"{value} (model)"
+
+
+def level_events(body):
+    events = []
+    for block in body.decode('utf-8').strip().split('\n\n'):
+        name, data = block.split('\n', 1)
+        if name == 'event: level':
+            events.append(json.loads(data[len('data: '):]))
+    return events
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    def run(model, payload=PAYLOAD):
+        monkeypatch.setattr(app, 'ai_service', model)
+        response = app.app.test_client().post('/api/analyze_stream', json=payload)
+        assert response.status_code == 200
+        return level_events(response.data)
+    return run
+
+
+def test_model_value_for_a_rules_level_is_marked_as_replacement(stream):
+    events = stream(StreamingModel())
+    keys = [event['key'] for event in events]
+    assert sorted(set(keys)) == sorted(app.TRIAGE_LEVEL_KEYS)
+    for key in ('level_5_danger_signs', 'level_6_vitals_analysis'):
+        first, second = [event for event in events if event['key'] == key]
+        assert first['source'] == 'rules' and 'replaces' not in first
+        assert second['source'] == 'model' and second['replaces'] == 'rules'
+    once = [key for key in app.TRIAGE_LEVEL_KEYS if key not in ('level_5_danger_signs', 'level_6_vitals_analysis')]
+    assert all(keys.count(key) == 1 for key in once)
+
+
+def test_identical_repeat_is_not_sent(stream):
+    events = stream(StreamingModel(same={'level_5_danger_signs', 'level_6_vitals_analysis'}))
+    keys = [event['key'] for event in events]
+    assert all(keys.count(key) == 1 for key in app.TRIAGE_LEVEL_KEYS)
@@ -0,0 +1,28 @@
+import gc
+import weakref
+
+import numpy as np
+
+from symptom_index import HashingEncoder, SymptomIndex
+
+
+def test_encoders_are_not_kept_alive_by_the_feature_cache():
+    encoder = HashingEncoder(64)
+    encoder.encode(["painful swollen ankle"])
+    ref = weakref.ref(encoder)
+    del encoder
+    gc.collect()
+    assert ref() is None
+
+
+def test_feature_cache_is_keyed_on_dimensions():
+    small, large = HashingEncoder(64), HashingEncoder(1024)
+    small.encode(["fever"])
+    assert large.encode(["fever"]).shape == (1, 1024)
+    assert np.array_equal(HashingEncoder(64).encode(["fever"]), small.encode(["fever"]))
+
+
+def test_search_finds_condition_by_meaning(tmp_path):
+    index = SymptomIndex.open(str(tmp_path / 'index'))
+    assert index.search("my skin is red and itchy all over", k=3, min_score=0.2)[0][0] == 'Skin allergy'
+    assert SymptomIndex.open(str(tmp_path / 'index')).search("vaccination appointment", min_score=0.2) == []
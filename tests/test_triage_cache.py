@@ -0,0 +1,48 @@
+import pytest
+
+import app
+
+BASE = {'age': 34, 'sex': 'Female', 'symptoms': 'fever, cough and headache', 'duration': '1-2days',
+        'vitals': {'temperature': 38.4, 'heart_rate': 92}}
+
+
+@pytest.fixture
+def cache():
+    return app.TriageCache(app.MemoryCacheStore(4), ttl=60)
+
+
+@pytest.mark.parametrize('change', [
+    {'symptoms': 'headache; Cough / fever'},
+    {'age': 38},
+    {'sex': ' female '},
+    {'duration': '2 days'},
+    {'vitals': {'temperature': 38.5, 'heart_rate': 91}},
+])
+def test_equivalent_requests_share_a_fingerprint(cache, change):
+    assert cache.fingerprint(dict(BASE, **change)) == cache.fingerprint(BASE)
+
+
+@pytest.mark.parametrize('change', [
+    {'symptoms': 'fever and cough'},
+    {'age': 70},
+    {'sex': 'male'},
+    {'duration': '1-2weeks'},
+    {'vitals': {'temperature': 39.6, 'heart_rate': 92}},
+    {'image_analysis': 'Red circular rash'},
+])
+def test_clinically_different_requests_do_not(cache, change):
+    assert cache.fingerprint(dict(BASE, **change)) != cache.fingerprint(BASE)
+
+
+def test_cache_round_trip_and_lru_eviction(cache):
+    for index in range(5):
+        cache.set(f"key{index}", {'level_1_reassurance': str(index)})
+    assert cache.get('key0') is None
+    assert cache.get('key4') == {'level_1_reassurance': '4'}
+    assert cache.stats()['evictions'] == 1 and cache.stats()['hits'] == 1
+
+
+def test_expired_entries_are_misses():
+    cache = app.TriageCache(app.MemoryCacheStore(4), ttl=-1)
+    cache.set('key', {'level_1_reassurance': 'x'})
+    assert cache.get('key') is None
@@ -0,0 +1,154 @@
+import json
+import os
+import time
+
+import pytest
+
+from triage_rules import DEFAULT_PATH, KeywordMatcher, KnowledgeBase, TriageRules
+
+
+@pytest.fixture(scope='module')
+def rules():
+    return TriageRules.load(DEFAULT_PATH)
+
+
+def test_matcher_finds_phrases_in_order_of_appearance():
+    matcher = KeywordMatcher({'emergency': ['chest pain', 'bleeding'], 'condition': ['fever', 'pain']})
+    assert matcher.match("Fever, then bleeding and chest pain") == {
+        'condition': ['fever', 'pain'], 'emergency': ['bleeding', 'chest pain']}
+
+
+def test_matcher_reports_each_keyword_once():
+    matcher = KeywordMatcher({'condition': ['cough']})
+    assert matcher.match("cough cough cough") == {'condition': ['cough']}
+
+
+def test_matcher_matches_inflections_only():
+    matcher = KeywordMatcher({'emergency': ['stroke', 'blood', 'choke'], 'condition': ['pain']})
+    assert matcher.match("heatstroke") == {}
+    assert matcher.match("strokes") == {'emergency': ['stroke']}
+    assert matcher.match("choking, pained") == {'emergency': ['choke'], 'condition': ['pain']}
+
+
+@pytest.mark.parametrize('text', ["painting the fence", "painless lump", "painkillers", "routine bloodwork",
+                                  "bloodshot eyes", "bloody nose", "weekly checkup", "monthly period cramps"])
+def test_longer_words_do_not_match_keywords_they_start_with(text):
+    matcher = KeywordMatcher({'emergency': ['blood'], 'condition': ['pain'], 'duration': ['week', 'month']})
+    assert matcher.match(text) == {}
+
+
+def test_short_keyword_words_match_exactly():
+    matcher = KeywordMatcher({'duration': ['day']})
+    assert matcher.match("days") == {}
+    assert matcher.match("for a day") == {'duration': ['day']}
+
+
+def test_matcher_handles_curly_apostrophes():
+    matcher = KeywordMatcher({'emergency': ["can't breathe"]})
+    assert matcher.match("I CAN’T BREATHE") == {'emergency': ["can't breathe"]}
+
+
+def test_word_matching_several_keyword_words_hits_each():
+    matcher = KeywordMatcher({'duration': ['week', 'weeks']})
+    assert matcher.match("two weeks") == {'duration': ['week', 'weeks']}
+
+
+@pytest.mark.parametrize('text, keyword', [
+    ("having seizures", 'seizure'),
+    ("convulsions since noon", 'convulsion'),
+    ("chest pains", 'chest pain'),
+    ("he overdosed", 'overdose'),
+    ("I think I was poisoned", 'poisoned'),
+    ("she fainted", 'fainted'),
+    ("cannot breathe", 'cannot breathe'),
+    ("bleeding heavily", 'bleeding'),
+])
+def test_inflected_emergency_keywords_are_detected(rules, text, keyword):
+    assert keyword in rules.match(text).get('emergency', [])
+
+
+@pytest.mark.parametrize('text', ["having seizures", "chest pains", "poisoned", "choked on food"])
+def test_inflected_emergency_words_raise_risk(rules, text):
+    assert rules.risk_level(rules.match(text), {}, 30) == 'emergency'
+
+
+def test_analyze_takes_emergency_path_for_inflected_keywords():
+    import app
+    response = app.app.test_client().post('/api/analyze', json={
+        'age': 30, 'sex': 'male', 'symptoms': 'having seizures and chest pains', 'duration': 'hours'})
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['risk_level'] == 'emergency'
+    assert body['emergency_keywords'] == ['seizure', 'chest pain']
+
+
+
+def test_analyze_does_not_treat_bloodwork_as_emergency():
+    import app
+    body = app.app.test_client().post('/api/analyze', json={
+        'age': 30, 'sex': 'female', 'symptoms': 'need routine bloodwork', 'duration': 'hours'}).get_json()
+    assert body['risk_level'] != 'emergency'
+    assert not body.get('emergency_keywords')
+
+
+def test_image_findings_do_not_trigger_emergency_fast_path():
+    import app
+    body = app.app.test_client().post('/api/analyze', json={
+        'age': 30, 'sex': 'female', 'symptoms': 'itchy rash', 'duration': 'hours',
+        'image_analysis': 'Red patches, no active bleeding'}).get_json()
+    assert not body.get('fast_path')
+    assert body['risk_level'] != 'emergency'
+
+def test_batch_triage_rates_inflected_emergencies(rules):
+    import numpy as np
+    from batch_triage import EMERGENCY, ChunkTriage
+    nan = np.full(2, np.nan)
+    risk, emergency_keywords, _ = ChunkTriage(rules).evaluate(nan, ["having seizures", "chest pains"], nan, nan)
+    assert risk.tolist() == [EMERGENCY, EMERGENCY]
+    assert emergency_keywords == ['seizure', 'chest pain']
+
+
+@pytest.fixture
+def rules_file(tmp_path):
+    path = tmp_path / 'triage_rules.json'
+    with open(DEFAULT_PATH) as f:
+        data = json.load(f)
+
+    def write(**changes):
+        path.write_text(json.dumps(dict(data, **changes)))
+        # A fresh mtime even on filesystems with coarse timestamps
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    write()
+    return path, write, data
+
+
+def test_knowledge_base_reloads_changed_file(rules_file):
+    path, write, data = rules_file
+    base = KnowledgeBase(str(path), check_interval=0)
+    swapped = []
+    base.on_reload(swapped.append)
+    write(revision=3, keywords=dict(data['keywords'], emergency=data['keywords']['emergency'] + ['snakebite']))
+    rules = base.reload()
+    assert rules.revision == 3 and swapped == [rules]
+    assert 'snakebite' in base.current().match("snakebite on leg").get('emergency', [])
+    assert base.stats()['reloads'] == 1
+
+
+def test_knowledge_base_picks_up_edits_on_its_check_interval(rules_file):
+    path, write, _ = rules_file
+    base = KnowledgeBase(str(path), check_interval=0.01)
+    previous = base.current()
+    write(revision=4)
+    time.sleep(0.02)
+    assert base.current().revision == 4 and base.current() is not previous
+
+
+def test_broken_file_keeps_last_good_revision(rules_file):
+    path, _, _ = rules_file
+    base = KnowledgeBase(str(path), check_interval=0)
+    good = base.current()
+    path.write_text('{"keywords": ')
+    assert base.reload() is good
+    assert base.stats()['failures'] == 1
@@ -0,0 +1,385 @@
+"""Triage knowledge base: the rules behind MockAIService and the offline engine.
+
+Keyword lists, symptom -> condition maps, first-aid branches, danger signs,
+vital-sign thresholds and messages live in triage_rules.json, which
+clinicians can edit without touching code. Loading compiles the file
+once into a `TriageRules` object: a keyword trie over every category (the
+inverted index from phrase to category), per-keyword condition and
+first-aid tuples, threshold tables, and the messages and summaries for
+each risk level already formatted.
+
+`KnowledgeBase` holds the current revision and checks the file's mtime
+at most every `check_interval` seconds. A changed file is compiled
+off to the side and swapped in with a single assignment. A request keeps
+the `TriageRules` it started with, so in-flight requests finish on the
+old revision, and a file that fails to load leaves the old revision in
+place.
+
+The compiled `json` attribute is the same data exported for the engine
+in js/app.js, so a phone without a connection gives the answer the server's
+rules would have given. Its content hash is the ruleset version. Keep
+the evaluation order in `TriageRules` and evaluateTriageRules() in
+js/app.js in step when changing how the rules are applied.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from structured_logging import get_logger
+
+log = get_logger('mehelper.triage_rules')
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'triage_rules.json')
+
+# Bump when the structure of the file or the export changes, not when a rule does
+RULESET_SCHEMA = 2
+
+# Tokenizer for keywords and symptom text; valid in both Python and JavaScript
+TOKEN_PATTERN = r"[a-z0-9]+(?:'[a-z]+)?"
+
+# Keyword words this long also match themselves plus one of these endings (plurals, -ed, -ing);
+# a final 'e' is dropped before -ing, so 'choke' finds 'choking'
+INFLECTION_MIN_LENGTH = 4
+INFLECTION_SUFFIXES = ('s', 'es', 'd', 'ed', 'ing')
+
+RISK_LEVELS = ('low', 'moderate', 'high', 'emergency')
+
+VITALS = ('temperature', 'heart_rate')
+
+
+class TriageRulesError(ValueError):
+    """A knowledge base file that cannot be used"""
+
+
+class KeywordMatcher:
+    """Multi-pattern keyword matcher compiled once into a word-level phrase trie.
+
+    The text is tokenized a single time and every keyword of every category is
+    found in that one pass, so the cost per request depends on the length of the
+    text rather than on the number of keywords. A keyword word matches the same
+    word, and keyword words of INFLECTION_MIN_LENGTH letters or more also match
+    their inflections, so 'seizure' finds 'seizures' and 'chest pain' finds
+    'chest pains'. Only the endings in INFLECTION_SUFFIXES count: 'blood' does
+    not hit 'bloodwork' or 'bloodshot', 'pain' does not hit 'painting', and
+    'stroke' does not hit 'heatstroke'.
+    """
+
+    _TOKEN_RE = re.compile(TOKEN_PATTERN)
+
+    # Bound on remembered text words, so arbitrary input cannot grow it forever
+    _MAX_FORMS = 50000
+
+    def __init__(self, patterns: Optional[Dict[str, List[str]]] = None):
+        """Build the trie from a mapping of category -> keywords"""
+        self._trie: Dict[str, Any] = {}
+        self._max_words = 0
+        self._words: set = set()
+        self._forms: Dict[str, tuple] = {}
+        self._count = 0
+        for category, keywords in (patterns or {}).items():
+            self.add(category, keywords)
+
+    def _tokenize(self, text):
+        return self._TOKEN_RE.findall(text.lower().replace('’', "'"))
+
+    def add(self, category, keywords):
+        """Register keywords under a category"""
+        for keyword in keywords:
+            words = self._tokenize(keyword)
+            if not words:
+                continue
+            node = self._trie
+            for word in words:
+                node = node.setdefault(word, {})
+            # The registration rank orders keywords that end at the same word
+            node.setdefault(None, []).append((self._count, keyword, category))
+            self._count += 1
+            self._words.update(words)
+            self._max_words = max(self._max_words, len(words))
+        self._forms.clear()
+
+    def forms(self, token):
+        """The keyword words a text word matches, longest first"""
+        found = self._forms.get(token)
+        if found is None:
+            candidates = {token}
+            for suffix in INFLECTION_SUFFIXES:
+                if token.endswith(suffix):
+                    stem = token[:-len(suffix)]
+                    candidates.update((stem, stem + 'e') if suffix == 'ing' else (stem,))
+            found = tuple(sorted((word for word in candidates
+                                  if word in self._words and (word == token or len(word) >= INFLECTION_MIN_LENGTH)),
+                                 key=len, reverse=True))
+            if len(self._forms) >= self._MAX_FORMS:
+                self._forms.clear()
+            self._forms[token] = found
+        return found
+
+    def scan(self, text):
+        """Return every (keyword, category) hit in order of appearance"""
+        forms = [self.forms(token) for token in self._tokenize(text or '')]
+        trie = self._trie
+        hits = []
+        for start, words in enumerate(forms):
+            # Most words start no keyword at all
+            if not words:
+                continue
+            # A word can match several keyword words ('weeks' is 'weeks' and 'week'), so follow each
+            nodes = [trie[word] for word in words if word in trie]
+            found = []
+            span = 1
+            while nodes:
+                for node in nodes:
+                    found.extend((span, rank, keyword, category) for rank, keyword, category in node.get(None, ()))
+                if span >= self._max_words or start + span >= len(forms):
+                    break
+                nodes = [node[word] for node in nodes for word in forms[start + span] if word in node]
+                span += 1
+            # Shorter phrases first, then keywords in file order
+            found.sort()
+            hits.extend((keyword, category) for _, _, keyword, category in found)
+        return hits
+
+    def match(self, text):
+        """Group hits by category, keeping first-appearance order without duplicates"""
+        grouped: Dict[str, List[str]] = {}
+        for keyword, category in self.scan(text):
+            found = grouped.setdefault(category, [])
+            if keyword not in found:
+                found.append(keyword)
+        return grouped
+
+
+def _require(data, key, kind):
+    value = data.get(key)
+    if not isinstance(value, kind) or isinstance(value, bool):
+        raise TriageRulesError(f"{key} must be a {kind.__name__ if isinstance(kind, type) else 'number'}")
+    return value
+
+
+def _strings(value, key):
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise TriageRulesError(f"{key} must be a list of strings")
+    return tuple(value)
+
+
+def _by_level(data, key):
+    """Per-risk-level messages, with the 'default' entry filled in for missing levels"""
+    messages = _require(data, key, dict)
+    if 'default' not in messages:
+        raise TriageRulesError(f"{key} needs a 'default' entry")
+    return {level: str(messages.get(level, messages['default'])) for level in RISK_LEVELS + ('default',)}
+
+
+class TriageRules:
+    """One compiled, read-only revision of the knowledge base"""
+
+    def __init__(self, data):
+        if not isinstance(data, dict) or data.get('schema') != RULESET_SCHEMA:
+            raise TriageRulesError(f"unsupported schema (expected {RULESET_SCHEMA})")
+        number = (int, float)
+        self.revision = data.get('revision')
+
+        conditions = _require(data, 'conditions', dict)
+        first_aid = _require(data, 'first_aid', dict)
+        keywords = {category: list(_strings(words, f"keywords.{category}"))
+                    for category, words in _require(data, 'keywords', dict).items()}
+        for category in ('risk_emergency', 'risk_high', 'duration', 'emergency'):
+            keywords.setdefault(category, [])
+        # Symptom words that select conditions and first-aid branches are categories too
+        keywords['condition'] = list(conditions)
+        keywords['first_aid'] = list(first_aid)
+        self.keywords = keywords
+        self.matcher = KeywordMatcher(keywords)
+
+        self.conditions = {keyword: _strings(names, f"conditions.{keyword}") for keyword, names in conditions.items()}
+        self.default_conditions = _strings(data.get('default_conditions'), 'default_conditions')
+        self.max_conditions = _require(data, 'max_conditions', int)
+        # First-aid branches are applied in file order, whatever order the text mentions them in
+        self.first_aid = {keyword: _strings(steps, f"first_aid.{keyword}") for keyword, steps in first_aid.items()}
+        self.first_aid_rank = {keyword: rank for rank, keyword in enumerate(first_aid)}
+        self.base_first_aid = _strings(data.get('base_first_aid'), 'base_first_aid')
+
+        self.child_age = _require(data, 'child_age', number)
+        self.danger_signs = _strings(data.get('danger_signs'), 'danger_signs')
+        # Everyone's danger signs followed by the ones for young children
+        self.danger_signs_child = self.danger_signs + _strings(data.get('child_danger_signs'), 'child_danger_signs')
+
+        self.default_age = _require(data, 'default_age', number)
+        risk_age = _require(data, 'risk_age', dict)
+        self.age_under, self.age_over = _require(risk_age, 'under', number), _require(risk_age, 'over', number)
+        self.risk_vitals = tuple(
+            (name, _require(limits, 'above', number), _require(limits, 'below', number))
+            for name, limits in _require(data, 'risk_vitals', dict).items()
+        )
+        self.vitals_bands = {}
+        for name, rule in _require(data, 'vitals_bands', dict).items():
+            bands = tuple((direction, limit, str(text)) for direction, limit, text in rule['bands'])
+            if any(direction not in ('above', 'below') for direction, _, _ in bands):
+                raise TriageRulesError(f"vitals_bands.{name}: bands must be 'above' or 'below'")
+            self.vitals_bands[name] = (rule['label'], bands, rule['default'])
+        self.no_vitals = str(data.get('no_vitals', ''))
+
+        self.reassurance = _by_level(data, 'reassurance')
+        self.assessments = _by_level(data, 'risk_assessments')
+        self.next_actions = _by_level(data, 'next_actions')
+        self.summary_template = _require(data, 'summary_template', str)
+        self.summaries = {level: self.summary_template.format(risk_level=level, assessment=self.assessments[level])
+                          for level in RISK_LEVELS}
+        self.timeline = _require(data, 'timeline', dict)
+
+        export = dict(data, token_pattern=TOKEN_PATTERN, inflection_min_length=INFLECTION_MIN_LENGTH,
+                      inflection_suffixes=INFLECTION_SUFFIXES, keywords=keywords)
+        self.version = hashlib.sha256(self._serialize(export)).hexdigest()[:12]
+        self.json = self._serialize(dict(export, version=self.version))
+
+    @staticmethod
+    def _serialize(ruleset):
+        # Key order is kept: first-aid branches are applied in file order
+        return json.dumps(ruleset, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, 'rb') as f:
+                data = json.loads(f.read().decode('utf-8'))
+        except (OSError, ValueError) as e:
+            raise TriageRulesError(f"cannot read {path}: {e}") from e
+        try:
+            return cls(data)
+        except (KeyError, TypeError, ValueError) as e:
+            raise TriageRulesError(f"invalid {path}: {e}") from e
+
+    def match(self, text):
+        """Keyword hits by category for one text"""
+        return self.matcher.match(text)
+
+    def risk_level(self, matches, vitals, age):
+        """Emergency keywords, then high-risk words and vitals, then age and duration"""
+        if matches.get('risk_emergency'):
+            return "emergency"
+        if matches.get('risk_high'):
+            return "high"
+        for name, above, below in self.risk_vitals:
+            value = vitals.get(name)
+            if value and (value > above or value < below):
+                return "high"
+        if age < self.age_under or age > self.age_over:
+            return "moderate"
+        if matches.get('duration'):
+            return "moderate"
+        return "low"
+
+    def possible_conditions(self, matches):
+        """Unique conditions in order of appearance, at most max_conditions"""
+        found = {}
+        for keyword in matches.get('condition', ()):
+            found.update(dict.fromkeys(self.conditions[keyword]))
+            if len(found) >= self.max_conditions:
+                break
+        return list(found or dict.fromkeys(self.default_conditions))[:self.max_conditions]
+
+    def first_aid_measures(self, matches):
+        measures = list(self.base_first_aid)
+        for keyword in sorted(matches.get('first_aid', ()), key=self.first_aid_rank.__getitem__):
+            measures.extend(self.first_aid[keyword])
+        return measures
+
+    def danger_signs_for(self, age):
+        return list(self.danger_signs_child if age < self.child_age else self.danger_signs)
+
+    def summary(self, risk_level):
+        return self.summaries.get(risk_level) or self.summary_template.format(
+            risk_level=risk_level, assessment=self.assessments['default'])
+
+    def vitals_note(self, name, value):
+        """'Temperature 38.2°C → Mild fever' for one reading"""
+        label, bands, text = self.vitals_bands[name]
+        for direction, limit, band in bands:
+            if (value > limit) if direction == 'above' else (value < limit):
+                text = band
+                break
+        return f"{label.format(value=value)} → {text}"
+
+    def vitals_analysis(self, vitals):
+        notes = [self.vitals_note(name, vitals[name]) for name in VITALS if vitals.get(name)]
+        return "; ".join(notes) if notes else self.no_vitals
+
+    def stats(self):
+        return {"revision": self.revision, "version": self.version,
+                "keywords": sum(len(words) for words in self.keywords.values())}
+
+
+class KnowledgeBase:
+    """The current TriageRules, reloaded when its file changes"""
+
+    def __init__(self, path=DEFAULT_PATH, check_interval=2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.reloads = 0
+        self.failures = 0
+        self._listeners = []
+        self._reload_lock = threading.Lock()
+        self._stamp = self._file_stamp()
+        # A broken file at startup is fatal; later it only keeps the last good revision
+        self._rules = TriageRules.load(path)
+        self._checked = time.monotonic()
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def current(self):
+        """The revision to evaluate one request against"""
+        if self.check_interval and time.monotonic() - self._checked >= self.check_interval:
+            self._check()
+        return self._rules
+
+    def _check(self):
+        # One thread stats the file; the others carry on with the current revision
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._checked = time.monotonic()
+            stamp = self._file_stamp()
+            if stamp is not None and stamp != self._stamp:
+                self._stamp = stamp
+                self._reload()
+        finally:
+            self._reload_lock.release()
+
+    def reload(self):
+        """Reload the file now; returns the revision in use afterwards"""
+        with self._reload_lock:
+            self._stamp = self._file_stamp()
+            self._reload()
+        return self._rules
+
+    def _reload(self):
+        started = time.perf_counter()
+        try:
+            rules = TriageRules.load(self.path)
+        except TriageRulesError as e:
+            self.failures += 1
+            log.error("triage_rules_reload_failed", error=str(e), kept_version=self._rules.version)
+            return
+        previous, self._rules = self._rules, rules
+        self.reloads += 1
+        log.info("triage_rules_reloaded", revision=rules.revision, version=rules.version,
+                 previous_version=previous.version, compile_ms=round((time.perf_counter() - started) * 1000, 2))
+        for listener in self._listeners:
+            listener(rules)
+
+    def on_reload(self, listener):
+        """Call listener(rules) after each successful swap"""
+        self._listeners.append(listener)
+
+    def stats(self):
+        return dict(self._rules.stats(), path=self.path, reloads=self.reloads, failures=self.failures)